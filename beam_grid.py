@@ -0,0 +1,380 @@
+"""
+Reusable grid of scatter panels for the per-antenna and per-beam QA plots
+
+Most crosscal and selfcal plots are a grid with one panel per beam (8x5 for
+40 beams), of which one figure is made per antenna. Creating the figure and
+its 40 axes takes most of the rendering time, so BeamGrid creates them once
+and for every antenna only replaces the points of the scatter plots and the
+titles before saving.
+
+Series with many points (e.g. thousands of channels) are reduced to the
+lowest and highest point per pixel column before drawing PNG files, which
+looks the same but keeps the rendering time independent of the number of
+channels.
+
+The figures of different products and antennas are independent, so a
+PlotQueue can collect them from several plot methods and render them with
+a pool of processes.
+"""
+
+from __future__ import print_function
+
+import logging
+import time
+import multiprocessing
+import traceback
+import numpy as np
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+logger = logging.getLogger(__name__)
+
+_no_points = np.empty((0, 2))
+
+# jobs of PlotQueue.run, set before the pool is created so the workers
+# inherit them instead of receiving the data through pickling
+_worker_jobs = None
+# grids of a worker process, by grid layout
+_worker_grids = {}
+
+
+def _render_job_worker(index):
+    """
+    Render a single job of _worker_jobs in a worker process
+
+    The grid of the previous job is reused if it has the same layout.
+    """
+    key, grid_kwargs, frame = _worker_jobs[index]
+    try:
+        if key not in _worker_grids:
+            for grid in _worker_grids.values():
+                grid.close()
+            _worker_grids.clear()
+            _worker_grids[key] = BeamGrid(**grid_kwargs)
+        _worker_grids[key].render(frame)
+        return frame.filename, None
+    except Exception:
+        return frame.filename, traceback.format_exc()
+
+
+def decimate_minmax(x, y, n_bins):
+    """
+    Reduce a series to the points with the lowest and highest y per x bin
+
+    Outliers are always the extreme of their bin, so they remain visible.
+    Points that are not finite are left out, as they are not drawn anyway.
+
+    Args:
+        x (array): x-coordinates
+        y (array): y-coordinates
+        n_bins (int): Number of bins along x, e.g. the width of the panel in pixels
+
+    Returns:
+        tuple: x and y of at most 2 * n_bins points, in the original order
+    """
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    if len(x) <= 2 * n_bins:
+        return x, y
+    finite = np.isfinite(x) & np.isfinite(y)
+    x = x[finite]
+    y = y[finite]
+    if len(x) <= 2 * n_bins:
+        return x, y
+
+    x_min = x.min()
+    x_range = x.max() - x_min
+    if x_range == 0:
+        bins = np.zeros(len(x), dtype=int)
+    else:
+        bins = np.minimum(((x - x_min) / x_range * n_bins).astype(int), n_bins - 1)
+
+    # sort by bin and then by y, the first and last point of a bin are its extremes
+    order = np.lexsort((y, bins))
+    sorted_bins = bins[order]
+    new_bin = sorted_bins[1:] != sorted_bins[:-1]
+    is_extreme = np.concatenate(([True], new_bin)) | np.concatenate((new_bin, [True]))
+    keep = np.sort(order[is_extreme])
+    return x[keep], y[keep]
+
+
+class Frame(object):
+    def __init__(self, filename, suptitle, panels):
+        """
+        Content of a single figure rendered with a BeamGrid
+
+        Args:
+            filename (str): File name of the figure
+            suptitle (str): Title of the figure
+            panels (list(tuple)): Panels to draw as (panel index, title, points),
+                where points is a list with an entry (x, y) or (x, y, color)
+                for each series of the grid, or None if the series is empty.
+                Panels that are not listed are not shown.
+        """
+        self.filename = filename
+        self.suptitle = suptitle
+        self.panels = panels
+
+
+class BeamGrid(object):
+    def __init__(self, series, nx=8, ny=5, panelsize=4, ylim=None, xlabel=None, ylabel=None,
+                 suptitle_size=30, legend_kwargs=None, decimate=True, decimate_bins=None):
+        """
+        Figure with a grid of scatter panels that is reused for many frames
+
+        Args:
+            series (list(dict)): Scatter series of every panel, keyword arguments
+                for scatter (e.g. label, marker, s, color)
+            nx (int): Number of panels per row
+            ny (int): Number of rows
+            panelsize (float): Size of a panel in inches
+            ylim (tuple): Fixed limits of the y-axis, None to scale to the data
+            xlabel (str): Label of the x-axis of the bottom row
+            ylabel (str): Label of the y-axis of the left column
+            suptitle_size (float): Font size of the figure title, None for default
+            legend_kwargs (dict): Keyword arguments for the legend in the last
+                panel of a frame, None for no legend
+            decimate (bool): Reduce series to the extremes per pixel column
+                when saving PNG files, see decimate_minmax
+            decimate_bins (int): Number of columns for decimating a series,
+                None for the width of a panel in pixels
+        """
+        self.series = series
+        self.ylim = ylim
+        self.legend_kwargs = legend_kwargs
+        self.decimate = decimate
+
+        self.figure = Figure(figsize=(nx * panelsize, ny * panelsize))
+        FigureCanvasAgg(self.figure)
+        if suptitle_size is None:
+            self.suptitle = self.figure.suptitle('')
+        else:
+            self.suptitle = self.figure.suptitle('', size=suptitle_size)
+
+        self.axes = []
+        self.collections = []
+        # series of each panel that were given points in the current frame
+        self.drawn = []
+        for index in range(nx * ny):
+            ax = self.figure.add_subplot(ny, nx, index + 1)
+            self.collections.append([ax.scatter([], [], **kwargs) for kwargs in series])
+            if ylim is not None:
+                ax.set_ylim(ylim)
+            if xlabel is not None and index >= (ny - 1) * nx:
+                ax.set_xlabel(xlabel)
+            if ylabel is not None and index % nx == 0:
+                ax.set_ylabel(ylabel)
+            self.axes.append(ax)
+            self.drawn.append([False] * len(series))
+        self.default_colors = [collection.get_facecolor() for collection in self.collections[0]]
+
+        if decimate_bins is None:
+            decimate_bins = int(np.ceil(panelsize * self.figure.dpi))
+        self.decimate_bins = decimate_bins
+
+    def render(self, frame):
+        """
+        Draw a frame and save it
+
+        Args:
+            frame (Frame): Content of the figure
+        """
+        self.suptitle.set_text(frame.suptitle)
+
+        # vector formats keep every point
+        decimate = self.decimate and frame.filename.lower().endswith('.png')
+
+        shown = set()
+        for index, title, points in frame.panels:
+            self.set_panel(index, title, points, decimate=decimate)
+            shown.add(index)
+        for index, ax in enumerate(self.axes):
+            ax.set_visible(index in shown)
+
+        legend_ax = None
+        if self.legend_kwargs is not None and len(frame.panels) != 0:
+            legend_ax = self.axes[frame.panels[-1][0]]
+            collections = self.collections[frame.panels[-1][0]]
+            drawn = self.drawn[frame.panels[-1][0]]
+            # like plt.legend, only list the series that were drawn
+            handles = [collection for collection, is_drawn in zip(collections, drawn)
+                       if is_drawn and not collection.get_label().startswith('_')]
+            if len(handles) != 0:
+                legend_ax.legend(handles, [handle.get_label() for handle in handles],
+                                 **self.legend_kwargs)
+            else:
+                legend_ax = None
+
+        self.figure.savefig(frame.filename)
+
+        if legend_ax is not None:
+            legend_ax.get_legend().remove()
+
+    def set_panel(self, index, title, points, decimate=False):
+        """
+        Replace the points and title of a panel
+
+        Args:
+            index (int): Panel index
+            title (str): Panel title, None for no title
+            points (list): Points per series, see Frame
+            decimate (bool): Only draw the extremes per pixel column
+        """
+        ax = self.axes[index]
+        ax.set_title('' if title is None else title)
+
+        ax.ignore_existing_data_limits = True
+        has_points = False
+        for s, collection in enumerate(self.collections[index]):
+            self.drawn[index][s] = not (s >= len(points) or points[s] is None or len(points[s][0]) == 0)
+            if not self.drawn[index][s]:
+                collection.set_offsets(_no_points)
+                continue
+            offsets = np.column_stack((np.asarray(points[s][0], dtype=float),
+                                       np.asarray(points[s][1], dtype=float)))
+            finite = offsets[np.all(np.isfinite(offsets), axis=1)]
+            if decimate:
+                collection.set_offsets(np.column_stack(
+                    decimate_minmax(finite[:, 0], finite[:, 1], self.decimate_bins)))
+            else:
+                collection.set_offsets(offsets)
+            if len(points[s]) > 2:
+                color = points[s][2]
+            else:
+                color = self.default_colors[s]
+            collection.set_facecolor(color)
+            collection.set_edgecolor(color)
+
+            if len(finite) != 0:
+                # limits of all points, also when decimated
+                ax.update_datalim([finite.min(axis=0), finite.max(axis=0)])
+                has_points = True
+
+        # scatter collections are not included by relim,
+        # so the data limits are updated from the points above
+        if has_points:
+            ax.autoscale(enable=True, axis='x' if self.ylim is not None else 'both')
+        else:
+            ax.set_xlim(0, 1)
+            if self.ylim is None:
+                ax.set_ylim(0, 1)
+
+    def close(self):
+        """Release the figure"""
+        self.figure.clear()
+
+
+def get_grid_key(grid_kwargs):
+    """Hashable key of the layout of a grid"""
+    return repr(sorted(grid_kwargs.items()))
+
+
+class PlotQueue(object):
+    def __init__(self):
+        """
+        Figures of several plot methods, to be rendered together
+
+        Every frame is an independent job, so with more than one worker
+        all figures of all products are rendered in parallel.
+        """
+        self.jobs = []
+
+    def __len__(self):
+        return len(self.jobs)
+
+    def add(self, frames, **grid_kwargs):
+        """
+        Add frames that share the same grid layout
+
+        Args:
+            frames (list(Frame)): Figures to render
+            **grid_kwargs: Arguments for BeamGrid
+        """
+        key = get_grid_key(grid_kwargs)
+        self.jobs.extend([(key, grid_kwargs, frame) for frame in frames])
+
+    def run(self, n_workers=1, timeout=None):
+        """
+        Render all frames and empty the queue
+
+        Args:
+            n_workers (int): Number of rendering processes,
+                1 renders the frames one after another
+            timeout (float): Time in seconds to wait for all figures in parallel mode,
+                None to wait indefinitely
+
+        Returns:
+            list(str): File names of the figures that failed
+        """
+        jobs = self.jobs
+        self.jobs = []
+        n_workers = max(1, min(n_workers, len(jobs),
+                               multiprocessing.cpu_count()))
+
+        failed = []
+        if n_workers == 1:
+            grid = None
+            grid_key = None
+            for key, grid_kwargs, frame in jobs:
+                try:
+                    if key != grid_key:
+                        if grid is not None:
+                            grid.close()
+                        grid = BeamGrid(**grid_kwargs)
+                        grid_key = key
+                    grid.render(frame)
+                except Exception as e:
+                    logger.error("Rendering {0} failed: {1}".format(frame.filename, e))
+                    failed.append(frame.filename)
+            if grid is not None:
+                grid.close()
+            return failed
+
+        logger.info("Rendering {0} figures with {1} processes".format(
+            len(jobs), n_workers))
+        global _worker_jobs
+        _worker_jobs = jobs
+        if timeout is not None:
+            deadline = time.time() + timeout
+        pool = multiprocessing.Pool(n_workers)
+        try:
+            # jobs are handed out one at a time in order, so a worker
+            # mostly gets frames of the same product and reuses its grid
+            results = [pool.apply_async(_render_job_worker, (index,))
+                       for index in range(len(jobs))]
+            # all figures share the same deadline
+            for result, (_, _, frame) in zip(results, jobs):
+                try:
+                    if timeout is None:
+                        filename, error = result.get()
+                    else:
+                        filename, error = result.get(max(0, deadline - time.time()))
+                except multiprocessing.TimeoutError:
+                    filename, error = frame.filename, "No result after {}s".format(timeout)
+                if error is not None:
+                    logger.error("Rendering {0} failed".format(filename))
+                    logger.error(error)
+                    failed.append(filename)
+        finally:
+            # stops workers that are still busy with a figure that timed out
+            pool.terminate()
+            _worker_jobs = None
+        return failed
+
+
+def render_frames(frames, plot_queue=None, **grid_kwargs):
+    """
+    Render frames that share the same grid layout
+
+    Args:
+        frames (list(Frame)): Figures to render
+        plot_queue (PlotQueue): Queue to add the frames to instead of
+            rendering them now, None to render them now
+        **grid_kwargs: Arguments for BeamGrid
+    """
+    if plot_queue is None:
+        plot_queue = PlotQueue()
+        plot_queue.add(frames, **grid_kwargs)
+        plot_queue.run()
+    else:
+        plot_queue.add(frames, **grid_kwargs)
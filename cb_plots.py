@@ -20,6 +20,7 @@ import numpy as np
 import os
 import logging
 import pkg_resources
+from line.cube_stats_store import CubeStatsStore, get_obs_store_name
 
 logger = logging.getLogger(__name__)
 
@@ -143,12 +144,20 @@ def make_cb_plots_for_report(obs_id, qa_dir, plot_dir=None):
 
     # Create line plots
     logger.info("Creating cb plots for line")
+    line_store_file = os.path.join(
+        qa_dir, "line", get_obs_store_name(obs_id))
     line_summary_file = os.path.join(
         qa_dir, "line/{}_HI_cube_noise_statistics.ecsv".format(obs_id))
-    if os.path.exists(line_summary_file):
+    if os.path.exists(line_store_file) or os.path.exists(line_summary_file):
 
-        # read the file
-        line_summary_data = Table.read(line_summary_file, format="ascii.ecsv")
+        # get the summary from the statistics of all cubes
+        # or read the file of older QA runs
+        if os.path.exists(line_store_file):
+            line_summary_data = CubeStatsStore.load(
+                line_store_file).get_summary()
+        else:
+            line_summary_data = Table.read(
+                line_summary_file, format="ascii.ecsv")
 
         # number of cubes
         n_cubes = np.size(np.unique(line_summary_data['cube']))
@@ -0,0 +1,203 @@
+"""
+Gaussianity of an image from random pixels of a grid of tiles
+
+A normality test over all pixels of a continuum image is slow and its
+p-value is meaningless with tens of millions of pixels, as any tiny
+deviation is significant. The image is divided into N_TILES x N_TILES
+tiles and N_SAMPLES random pixels are taken from every tile, so the time
+does not depend on the size of the image and every part of the image is
+represented. For every tile, the skewness, the kurtosis and the
+D'Agostino-Pearson normality test (as scipy.stats.normaltest) are computed
+at once for all tiles. The pooled samples of all tiles give a global score
+with the standard errors of the skewness and kurtosis of a Gaussian.
+"""
+
+import logging
+import numpy as np
+from astropy.table import Table
+
+logger = logging.getLogger(__name__)
+
+# number of tiles along each axis of the image
+N_TILES = 8
+
+# number of random pixels per tile
+N_SAMPLES = 2000
+
+# p-value below which a tile or the image is not Gaussian
+GAUSSIANITY_ALPHA = 1.e-2
+
+# seed of the random pixels, so the result of an image is reproducible
+SEED = 0
+
+# tiles with more pixels than this times N_SAMPLES are sampled with replacement
+MAX_PERMUTATION = 50
+
+# minimum number of pixels for the kurtosis test
+MIN_SAMPLES = 20
+
+
+def get_tile_samples(img, n_tiles=N_TILES, n_samples=N_SAMPLES, seed=SEED):
+    """
+    Get random pixels of every tile of an image
+
+    Only the sampled pixels are read, so img can be a memory map.
+
+    Args:
+        img (array): Image (y, x)
+        n_tiles (int): Number of tiles along each axis
+        n_samples (int): Number of pixels per tile, all pixels of smaller tiles
+        seed (int): Seed of the random pixels
+
+    Returns:
+        tuple: Samples (tile, sample) padded with NaN, and the tile
+        index along y and x of every row
+    """
+    ny, nx = np.shape(img)
+    rng = np.random.RandomState(seed)
+    edges_y = np.linspace(0, ny, min(n_tiles, ny) + 1).astype(int)
+    edges_x = np.linspace(0, nx, min(n_tiles, nx) + 1).astype(int)
+
+    tile_y, tile_x = np.meshgrid(np.arange(len(edges_y) - 1),
+                                 np.arange(len(edges_x) - 1), indexing='ij')
+    tile_y = tile_y.ravel()
+    tile_x = tile_x.ravel()
+
+    # flat index of the pixels of every tile, -1 for padding
+    indices = np.full((len(tile_y), n_samples), -1, dtype=np.int64)
+    for tile, (ty, tx) in enumerate(zip(tile_y, tile_x)):
+        height = edges_y[ty + 1] - edges_y[ty]
+        width = edges_x[tx + 1] - edges_x[tx]
+        n_pixels = height * width
+        if n_pixels <= n_samples:
+            pixels = np.arange(n_pixels)
+        elif n_pixels <= MAX_PERMUTATION * n_samples:
+            pixels = rng.choice(n_pixels, n_samples, replace=False)
+        else:
+            # few duplicates, without the cost of a permutation of the tile
+            pixels = rng.randint(0, n_pixels, n_samples)
+        y = edges_y[ty] + pixels // width
+        x = edges_x[tx] + pixels % width
+        indices[tile, :len(pixels)] = y * nx + x
+
+    # read the pixels in the order of the file
+    valid = indices >= 0
+    flat_indices = indices[valid]
+    order = np.argsort(flat_indices)
+    values = np.empty(len(flat_indices))
+    values[order] = np.asarray(img).reshape(-1)[flat_indices[order]]
+
+    samples = np.full(indices.shape, np.nan)
+    samples[valid] = values
+    return samples, tile_y, tile_x
+
+
+def get_normality(samples):
+    """
+    Skewness, kurtosis and D'Agostino-Pearson test of every row
+
+    This gives the same result as scipy.stats.skew, scipy.stats.kurtosis
+    and scipy.stats.normaltest of every row without its NaNs.
+
+    Args:
+        samples (array): Values (row, sample), NaN for missing values
+
+    Returns:
+        dict: For every row the number of values ("n"), the skewness
+        ("skew"), the excess kurtosis ("kurtosis"), the z-scores of both
+        ("skew_z", "kurtosis_z"), the test statistic ("k2") and its
+        p-value ("p"). NaN for rows with fewer than MIN_SAMPLES values.
+    """
+    samples = np.atleast_2d(samples)
+    valid = ~np.isnan(samples)
+    n = valid.sum(axis=1).astype(float)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = np.where(valid, samples, 0.).sum(axis=1) / n
+        deviation = np.where(valid, samples - mean[:, np.newaxis], 0.)
+        m2 = (deviation**2).sum(axis=1) / n
+        m3 = (deviation**3).sum(axis=1) / n
+        m4 = (deviation**4).sum(axis=1) / n
+        skew = m3 / m2**1.5
+        b2 = m4 / m2**2
+
+        # skewness test
+        y = skew * np.sqrt(((n + 1) * (n + 3)) / (6. * (n - 2)))
+        beta2 = (3. * (n**2 + 27 * n - 70) * (n + 1) * (n + 3) /
+                 ((n - 2.) * (n + 5) * (n + 7) * (n + 9)))
+        w2 = -1 + np.sqrt(2 * (beta2 - 1))
+        delta = 1 / np.sqrt(0.5 * np.log(w2))
+        alpha = np.sqrt(2. / (w2 - 1))
+        y = np.where(y == 0, 1, y)
+        skew_z = delta * np.log(y / alpha + np.sqrt((y / alpha)**2 + 1))
+
+        # kurtosis test
+        expected = 3. * (n - 1) / (n + 1)
+        variance = 24. * n * (n - 2) * (n - 3) / ((n + 1) * (n + 1.) * (n + 3) * (n + 5))
+        x = (b2 - expected) / np.sqrt(variance)
+        sqrt_beta1 = (6. * (n * n - 5 * n + 2) / ((n + 7) * (n + 9)) *
+                      np.sqrt((6. * (n + 3) * (n + 5)) / (n * (n - 2) * (n - 3))))
+        a = 6. + 8. / sqrt_beta1 * (2. / sqrt_beta1 + np.sqrt(1 + 4. / sqrt_beta1**2))
+        term1 = 1 - 2 / (9. * a)
+        denominator = 1 + x * np.sqrt(2 / (a - 4.))
+        term2 = np.sign(denominator) * np.where(
+            denominator == 0, np.nan, np.power((1 - 2. / a) / np.abs(denominator), 1 / 3.))
+        kurtosis_z = (term1 - term2) / np.sqrt(2 / (9. * a))
+
+        # chi-squared with two degrees of freedom
+        k2 = skew_z**2 + kurtosis_z**2
+        p = np.exp(-k2 / 2.)
+
+    normality = {'n': n.astype(int),
+                 'skew': skew,
+                 'kurtosis': b2 - 3.,
+                 'skew_z': skew_z,
+                 'kurtosis_z': kurtosis_z,
+                 'k2': k2,
+                 'p': p}
+    for name in normality:
+        if name != 'n':
+            normality[name][n < MIN_SAMPLES] = np.nan
+    return normality
+
+
+def get_image_gaussianity(img, alpha=GAUSSIANITY_ALPHA, n_tiles=N_TILES,
+                          n_samples=N_SAMPLES, seed=SEED):
+    """
+    Test the gaussianity of an image per tile and globally
+
+    Args:
+        img (array): Image (y, x), can be a memory map
+        alpha (float): p-value below which a tile or the image is not Gaussian
+        n_tiles (int): Number of tiles along each axis
+        n_samples (int): Number of pixels per tile
+        seed (int): Seed of the random pixels
+
+    Returns:
+        tuple: Table with the tile index along y and x and the result of
+        get_normality of every tile, and a dict with the result of
+        get_normality of the pooled samples of all tiles, the standard errors
+        of the skewness and kurtosis of a Gaussian ("skew_error",
+        "kurtosis_error") and the fraction of the tiles with a p-value below
+        alpha ("rejected_fraction")
+    """
+    samples, tile_y, tile_x = get_tile_samples(
+        img, n_tiles=n_tiles, n_samples=n_samples, seed=seed)
+
+    names = ['n', 'skew', 'kurtosis', 'skew_z', 'kurtosis_z', 'k2', 'p']
+    tiles = get_normality(samples)
+    tile_table = Table([tile_y, tile_x] + [tiles[name] for name in names],
+                       names=['tile_y', 'tile_x'] + names)
+
+    pooled = samples[~np.isnan(samples)]
+    global_score = dict([(name, value[0]) for name, value in get_normality(pooled).items()])
+    n = float(global_score['n'])
+    with np.errstate(invalid='ignore', divide='ignore'):
+        global_score['skew_error'] = np.sqrt(6. * (n - 2) / ((n + 1) * (n + 3)))
+        global_score['kurtosis_error'] = np.sqrt(
+            24. * n * (n - 2) * (n - 3) / ((n + 1)**2 * (n + 3) * (n + 5)))
+    tested = ~np.isnan(tiles['p'])
+    global_score['rejected_fraction'] = (np.sum(tiles['p'][tested] < alpha) / float(np.sum(tested))
+                                         if np.any(tested) else np.nan)
+
+    return tile_table, global_score
@@ -6,78 +6,90 @@ matplotlib.use('Agg')
 
 import matplotlib.pyplot as plt
 import matplotlib.colors as mc
-from astropy.wcs import WCS
 import numpy as np
 import logging
 import bdsf
 import os
 import time
 import socket
+import signal
+import traceback
+import multiprocessing
+try:
+    from queue import Empty
+except ImportError:
+    from Queue import Empty
 from apercal.libs import lib
 import sys
-import glob
 from dataqa.continuum.validation_tool import validation
-import scipy
-from astropy.io import fits
+from dataqa.observation_layout import get_observation_layout
+from dataqa.fits_image import get_fits_image
+from dataqa.continuum.image_gaussianity import get_image_gaussianity
 from astropy.table import Table
 import pandas as pd
 
 logger = logging.getLogger(__name__)
 
+# cores of the validation of a beam when the beams run one after another
+VALIDATION_NCORES = 8
+
+# default time limit in seconds of the validation of a beam in parallel mode
+VALIDATION_TIMEOUT = 3600
+
 
 def get_image_from_fits(fits_file):
     """Function to get the image from a fits file
 
+    The file is opened once per process as a memory map,
+    see fits_image.get_fits_image.
+
     Parameter:
         fits_file : str
             File name of the image fits file
 
     Return:
         img : array
-            The image from the fits file of an array
+            The first plane of the image as a memory map
     """
 
-    fits_file = fits.open(fits_file)
-
-    # check the number image axis
-    wcs = WCS(fits_hdulist[0].header)
-    if wcs.naxis == 4:
-        img = fits_hdulist[0].data[0][0]
-    elif wcs.naxis == 3:
-        img = fits_hdulist[0].data[0]
-    else:
-        img = fits_hdulist[0].data
+    return get_fits_image(fits_file).plane()
 
-    # close the fits file
-    fits_file.close()
 
-    return img
-
-
-def qa_check_image_gaussianity(fits_file, alpha=1.e-2):
+def qa_check_image_gaussianity(fits_file, alpha=1.e-2, return_scores=False):
     """Check if an image has gaussian distribution
 
     Note:
-        Function was taken from apercal.subs.qa.checkimagegaussianity
+        Function was taken from apercal.subs.qa.checkimagegaussianity.
+        Instead of all pixels, random pixels of a grid of tiles are
+        tested, see image_gaussianity.get_image_gaussianity
 
     Parameter:
         fits_file : str
             The name of the fits image to process
         alpha : float (default 1e-2)
             Parameter to judge the gaussianity, default taken from apercal conifg
+        return_scores : bool (default False)
+            Also return the scores of the tiles and of the image
 
     Returns:
-        True if image is ok, False otherwise
+        True if image is ok, False otherwise. With return_scores, also
+        the table of the tiles and the global scores
     """
 
     img = get_image_from_fits(fits_file)
 
     # determin gaussianity
-    k2, p = scipy.stats.normaltest(img, nan_policy='omit', axis=None)
+    tile_table, global_score = get_image_gaussianity(img, alpha=alpha)
+    p = global_score['p']
     if p < alpha:
-        return True
+        image_ok = True
+    else:
+        image_ok = False
+
+    if return_scores:
+        return image_ok, tile_table, global_score
     else:
-        return False
+        return image_ok
 
 
 def qa_get_image_dr(fits_file, rms):
@@ -178,9 +190,15 @@ def qa_get_image_noise_dr_gaussianity(fits_file, qa_validation_dir):
 
     logger.info("Testing Gaussianity ...")
 
-    gaussianity_confirm = qa_check_image_gaussianity(fits_file)
+    gaussianity_confirm, _, gaussianity_score = qa_check_image_gaussianity(
+        fits_file, return_scores=True)
 
     logger.info("Image fullfills gaussianity: {0}".format(gaussianity_confirm))
+    logger.info("Skewness {0:.3g} +/- {1:.2g}, kurtosis {2:.3g} +/- {3:.2g}, "
+                "{4:.0f}% of the tiles are not Gaussian".format(
+                    gaussianity_score['skew'], gaussianity_score['skew_error'],
+                    gaussianity_score['kurtosis'], gaussianity_score['kurtosis_error'],
+                    100. * gaussianity_score['rejected_fraction']))
 
     # Write output file as xml
     # ++++++++++++++++++++++++
@@ -217,21 +235,11 @@ def qa_plot_pybdsf_images(fits_file_list, plot_name_list, plot_type_list, plot_f
 
         logger.info("Plotting {0:s}".format(fits_file_list[k]))
 
-        fits_hdulist = fits.open(fits_file_list[k])
+        fits_image = get_fits_image(fits_file_list[k])
 
-        # get WCS header of cube
-        wcs = WCS(fits_hdulist[0].header)
-
-        # remove unnecessary axis
-        if wcs.naxis == 4:
-            wcs = wcs.dropaxis(3)
-            wcs = wcs.dropaxis(2)
-            img = fits_hdulist[0].data[0][0]
-        elif wcs.naxis == 3:
-            wcs = wcs.dropaxis(2)
-            img = fits_hdulist[0].data[0]
-        else:
-            img = fits_hdulist[0].data
+        # get WCS header and image without the unnecessary axis
+        wcs = fits_image.celestial
+        img = fits_image.plane()
 
         # set up plot
         ax = plt.subplot(projection=wcs)
@@ -322,11 +330,14 @@ def get_continuum_fits_images(data_basedir_list, qa_validation_dir, save_table=T
 
     logger.info("Getting a list of continuum fits images")
 
+    # index of the files in the data directories
+    layout = get_observation_layout(data_basedir_list)
+
     # Go through all the different data directories
     for data_basedir in data_basedir_list:
 
         # get the beams in this directory
-        beam_data_dir_list = glob.glob("{0:s}/[0-3][0-9]".format(data_basedir))
+        beam_data_dir_list = layout.glob("{0:s}/[0-3][0-9]".format(data_basedir))
         beam_data_dir_list.sort()
 
         # number of beams
@@ -359,7 +370,7 @@ def get_continuum_fits_images(data_basedir_list, qa_validation_dir, save_table=T
             continuum_image_dir = "{0:s}/continuum".format(beam_dir)
 
             # Get the fits image
-            fits_image = glob.glob(
+            fits_image = layout.glob(
                 "{0:s}/image_mf_*.fits".format(continuum_image_dir))
 
             # check whether no fits file was found, one or more fits file
@@ -417,7 +428,7 @@ def get_continuum_fits_images(data_basedir_list, qa_validation_dir, save_table=T
     return fits_file_table
 
 
-def print_summary(sdict):
+def print_summary(sdict, output_file='../../continuum_image_properties.csv'):
 
     beams = ['{:02d}'.format(i) for i in range(40)]
     df = pd.DataFrame(columns=['desc'] + beams)
@@ -440,11 +451,137 @@ def print_summary(sdict):
     df['BMIN'] = df['BMIN'].map('{:.1f}'.format)
     df['BPA'] = df['BPA'].map('{:.2f}'.format)
 
-    df.to_csv('../../continuum_image_properties.csv', index=False)
+    df.to_csv(output_file, index=False)
+
+
+
+def qa_continuum_run_beam_validation(beam_name, fits_image, qa_validation_dir, ncores=8):
+    """This function runs the validation tool and plots the pybdsf images of a beam
+
+    Note:
+        The validation tool works in the current directory, so this function
+        changes into the directory of the beam. In parallel mode every beam
+        runs in its own process.
+
+    Parameter:
+        beam_name : str
+            The name of the beam, e.g. "00"
+        fits_image : str
+            The continuum image of the beam
+        qa_validation_dir : str
+            The directory of the QA where the output will be saved.
+        ncores : int (default 8)
+            The number of cores pybdsf uses for this beam
+
+    Return:
+        beam_summary : list
+            RMS, image and local dynamic range and beam shape, zeros if
+            the validation failed
+        errors : list
+            The error messages of the steps that failed
+    """
+
+    errors = []
+
+    # create a subdirectory for the beam in the qa directory
+    qa_validation_beam_dir = "{0:s}/{1:s}".format(
+        qa_validation_dir, beam_name)
+
+    if not os.path.exists(qa_validation_beam_dir):
+        logger.info("Creating {0:s}".format(qa_validation_beam_dir))
+        os.mkdir(qa_validation_beam_dir)
+
+    # run pybdsf
+    logger.info("## Running validation tool and pybdsf")
+    try:
+
+        # change into the directory where the QA products should be produced
+        # This is necessary for the current implementation of the validation tool
+        # Should it return to the initial directory?
+        os.chdir(qa_validation_beam_dir)
+
+        # run validation tool and pybdsf combined
+
+        img, cat, rep = validation.run(fits_image, ncores=ncores)
+
+        img_rms = int(cat.img_rms)
+        idr = int(cat.dynamic_range)
+        ldr_min, _ = cat.local_dynrange
+        ldr_min = int(ldr_min)
+        bmaj = img.bmaj
+        bmin = img.bmin
+        bpa = img.bpa
+
+        beam_summary = [img_rms, idr, ldr_min, bmaj, bmin, bpa]
+
+        logger.info("## Running validation tool. Done")
+    except Exception as e:
+        logger.error(e)
+        logger.error("## Running validation tool failed.")
+        errors.append("Validation tool: {0}".format(e))
+        img_rms = 0
+        idr = 0
+        ldr_min, _ = 0, 0
+        bmaj = bmin = bpa = 0
+        beam_summary = [img_rms, idr, ldr_min, bmaj, bmin, bpa]
 
+    plot_type_list = ['gaus_model', 'gaus_resid',
+                      'rms', 'mean', 'island_mask']
+    fits_names = ["{0:s}/{1:s}".format(qa_validation_beam_dir, os.path.basename(fits_image)).replace(
+        ".fits", "_pybdsf_{0:s}.fits".format(plot)) for plot in plot_type_list]
 
+    plot_names = [fits.replace(
+        ".fits", ".png") for fits in fits_names]
 
-def qa_continuum_run_validation(data_basedir_list, qa_validation_dir, overwrite=True):
+    # add the continuum image
+    fits_names.append(fits_image)
+    plot_names.append("{0:s}/{1:s}".format(qa_validation_beam_dir, os.path.basename(
+        fits_image)).replace(".fits", ".png"))
+    plot_type_list.append("cont")
+
+    # create images without a lot of adjusting
+    try:
+        qa_plot_pybdsf_images(fits_names, plot_names, plot_type_list)
+    except Exception as e:
+        logger.error(e)
+        logger.error("## Plotting PyBDSF diagnostic images failed")
+        errors.append("Plotting: {0}".format(e))
+
+    return beam_summary, errors
+
+
+def _run_beam_validation_worker(beam_name, fits_image, qa_validation_dir, ncores):
+    """Run the validation of a beam, returning failures instead of raising them
+
+    Exceptions are returned as a formatted traceback, because not all of
+    them (e.g. those from pybdsf) can be sent back to the main process.
+    """
+    try:
+        return qa_continuum_run_beam_validation(
+            beam_name, fits_image, qa_validation_dir, ncores=ncores), None
+    except Exception:
+        return None, traceback.format_exc()
+
+
+def _run_beam_validation_process(result_queue, beam_index, beam_name, fits_image, qa_validation_dir, ncores):
+    """Run the validation of a beam in a child process and put the result in the queue"""
+    # a group of its own, so the processes started by pybdsf can be stopped as well
+    os.setsid()
+    result_queue.put((beam_index, _run_beam_validation_worker(
+        beam_name, fits_image, qa_validation_dir, ncores)))
+
+
+def _stop_beam_validation_process(process):
+    """Stop the process of a beam and the processes it started"""
+    try:
+        os.killpg(process.pid, signal.SIGTERM)
+    except OSError:
+        process.terminate()
+    process.join()
+
+
+def qa_continuum_run_validation(data_basedir_list, qa_validation_dir, overwrite=True, n_workers=1, n_cores=None,
+                                timeout=VALIDATION_TIMEOUT):
     """This function runs pybdsf on the continuum image of each beam
 
     This function will create a new directory for each beam. In this sub-directory
@@ -454,6 +591,10 @@ def qa_continuum_run_validation(data_basedir_list, qa_validation_dir, overwrite=
 
     Note:
         The function will always overwrite existing files.
+        With more than one worker, the beams are processed by a pool of
+        processes and the cores are divided between the beams that run at
+        the same time. A beam that takes longer than the timeout is stopped
+        and counted as failed. The summary table is the same in both cases.
 
     Parameter:
         data_basedir_list : list
@@ -463,14 +604,28 @@ def qa_continuum_run_validation(data_basedir_list, qa_validation_dir, overwrite=
             The directory of the QA where the output will be saved.
             Most likely this is /home/<user>/qa_science_demo_2019/continuum/
 
+        n_workers : int (default 1)
+            Number of beams to process at the same time
+
+        n_cores : int (default None)
+            Number of cores for all beams together, None for all cores,
+            or VALIDATION_NCORES when the beams run one after another
+
+        timeout : float (default VALIDATION_TIMEOUT)
+            Time limit in seconds of a beam with more than one worker,
+            None for no limit
+
     Return:
-        run_pybdsf_status : int
-            Status of how well this function performed
+        failed_beams : dict
+            The error messages of every beam for which a step failed
 
     """
 
     logger.info("#### Running validation for each beam")
 
+    # the validation tool changes the working directory
+    qa_validation_dir = os.path.abspath(qa_validation_dir)
+
     # get the available fits images for the available beams
     fits_file_table = get_continuum_fits_images(
         data_basedir_list, qa_validation_dir)
@@ -478,8 +633,8 @@ def qa_continuum_run_validation(data_basedir_list, qa_validation_dir, overwrite=
     # # Get only the rwos of the table for which beams exists
     # fits_file_table = fits_file_table[np.where(fits_file_table['beam_exists']==True)]
 
-    summary = dict()
-
+    # collect the beams with an image
+    beam_runs = []
     for beam_index in fits_file_table['beam_id']:
 
         # if a beam does not exists go directly to the next one
@@ -491,75 +646,101 @@ def qa_continuum_run_validation(data_basedir_list, qa_validation_dir, overwrite=
                 fits_file_table['beam_name'][beam_index]))
             continue
 
-        # create a subdirectory for the beam in the qa directory
-        qa_validation_beam_dir = "{0:s}/{1:s}".format(
-            qa_validation_dir, fits_file_table['beam_name'][beam_index])
-
-        if not os.path.exists(qa_validation_beam_dir):
-            logger.info("Creating {0:s}".format(qa_validation_beam_dir))
-            os.mkdir(qa_validation_beam_dir)
-
         # get the path to the fits image
         fits_image = fits_file_table['fits_image_path'][beam_index]
 
         if fits_image == '':
             logger.warning("No fits image for beam {0:s}".format(
                 fits_file_table['beam_name'][beam_index]))
-        else:
-            # run pybdsf
-            logger.info("## Running validation tool and pybdsf")
-            try:
-
-                # change into the directory where the QA products should be produced
-                # This is necessary for the current implementation of the validation tool
-                # Should it return to the initial directory?
-                os.chdir(qa_validation_beam_dir)
 
-                # run validation tool and pybdsf combined
+            # still create a subdirectory for the beam in the qa directory
+            qa_validation_beam_dir = "{0:s}/{1:s}".format(
+                qa_validation_dir, fits_file_table['beam_name'][beam_index])
+            if not os.path.exists(qa_validation_beam_dir):
+                logger.info("Creating {0:s}".format(qa_validation_beam_dir))
+                os.mkdir(qa_validation_beam_dir)
+        else:
+            beam_runs.append(
+                (beam_index, fits_file_table['beam_name'][beam_index], fits_image))
+
+    # divide the cores between the beams that run at the same time
+    n_workers = max(1, min(n_workers, len(beam_runs),
+                           n_cores if n_cores is not None else multiprocessing.cpu_count()))
+    if n_cores is None and n_workers == 1:
+        ncores = VALIDATION_NCORES
+    else:
+        if n_cores is None:
+            n_cores = multiprocessing.cpu_count()
+        ncores = max(1, n_cores // n_workers)
 
-                img, cat, rep = validation.run(fits_image)
+    summary = dict()
+    failed_beams = dict()
 
-                img_rms = int(cat.img_rms)
-                idr = int(cat.dynamic_range)
-                ldr_min, _ = cat.local_dynrange
-                ldr_min = int(ldr_min)
-                bmaj = img.bmaj
-                bmin = img.bmin
-                bpa = img.bpa
+    if n_workers == 1:
+        results = []
+        for beam_index, beam_name, fits_image in beam_runs:
+            results.append(_run_beam_validation_worker(
+                beam_name, fits_image, qa_validation_dir, ncores))
+    else:
+        logger.info("Running validation for {0:d} beams with {1:d} processes and {2:d} cores per beam".format(
+            len(beam_runs), n_workers, ncores))
+        # pybdsf starts processes itself, so the beams cannot run in the
+        # daemonic workers of a multiprocessing.Pool
+        result_queue = multiprocessing.Queue()
+        pending = list(beam_runs)
+        # process and deadline of the running beams, by beam index
+        running = dict()
+        beam_results = dict()
+        try:
+            while len(pending) != 0 or len(running) != 0:
+                while len(pending) != 0 and len(running) < n_workers:
+                    beam_index, beam_name, fits_image = pending.pop(0)
+                    process = multiprocessing.Process(
+                        target=_run_beam_validation_process,
+                        args=(result_queue, beam_index, beam_name, fits_image, qa_validation_dir, ncores))
+                    process.start()
+                    running[beam_index] = (process, time.time() + timeout if timeout is not None else None)
+                try:
+                    beam_index, beam_result = result_queue.get(timeout=1.)
+                except Empty:
+                    for beam_index, (process, deadline) in list(running.items()):
+                        # a process that stopped with an error has no result
+                        if not process.is_alive() and process.exitcode != 0:
+                            running.pop(beam_index)
+                            process.join()
+                            beam_results[beam_index] = (
+                                None, "Process stopped with exit code {0}".format(process.exitcode))
+                        elif deadline is not None and time.time() > deadline:
+                            running.pop(beam_index)
+                            _stop_beam_validation_process(process)
+                            beam_results[beam_index] = (
+                                None, "Stopped after the time limit of {0:.0f}s".format(timeout))
+                    continue
+                if beam_index in running:
+                    running.pop(beam_index)[0].join()
+                    beam_results[beam_index] = beam_result
+        finally:
+            for process, _ in running.values():
+                _stop_beam_validation_process(process)
+        results = [beam_results[beam_index] for beam_index, _, _ in beam_runs]
+
+    # collect the results in beam order
+    for (beam_index, beam_name, _), (beam_result, error) in zip(beam_runs, results):
+        if error is not None:
+            logger.error("## Running validation for beam {0:s} failed".format(beam_name))
+            logger.error(error)
+            beam_summary, errors = [0, 0, 0, 0, 0, 0], [error]
+        else:
+            beam_summary, errors = beam_result
+        summary.update({'{:02d}'.format(beam_index): beam_summary})
+        if len(errors) != 0:
+            failed_beams[str(beam_name)] = errors
 
-                summary.update({'{:02d}'.format(beam_index)
-                               : [img_rms, idr, ldr_min, bmaj, bmin, bpa]})
+    if len(failed_beams) != 0:
+        logger.warning("Validation failed for beams {0:s}".format(
+            ", ".join(sorted(failed_beams.keys()))))
 
-                logger.info("## Running validation tool. Done")
-            except Exception as e:
-                logger.error(e)
-                logger.error("## Running validation tool failed.")
-                img_rms = 0
-                idr = 0
-                ldr_min, _ = 0, 0
-                bmaj = bmin = bpa = 0
-                summary.update({'{:02d}'.format(beam_index)
-                               : [img_rms, idr, ldr_min, bmaj, bmin, bpa]})
-
-            plot_type_list = ['gaus_model', 'gaus_resid',
-                              'rms', 'mean', 'island_mask']
-            fits_names = ["{0:s}/{1:s}".format(qa_validation_beam_dir, os.path.basename(fits_image)).replace(
-                ".fits", "_pybdsf_{0:s}.fits".format(plot)) for plot in plot_type_list]
-
-            plot_names = [fits.replace(
-                ".fits", ".png") for fits in fits_names]
-
-            # add the continuum image
-            fits_names.append(fits_image)
-            plot_names.append("{0:s}/{1:s}".format(qa_validation_beam_dir, os.path.basename(
-                fits_image)).replace(".fits", ".png"))
-            plot_type_list.append("cont")
-
-            # create images without a lot of adjusting
-            try:
-                qa_plot_pybdsf_images(fits_names, plot_names, plot_type_list)
-            except Exception as e:
-                logger.error(e)
-                logger.error("## Plotting PyBDSF diagnostic images failed")
+    print_summary(summary, os.path.join(
+        qa_validation_dir, "continuum_image_properties.csv"))
 
-    print_summary(summary)
+    return failed_beams
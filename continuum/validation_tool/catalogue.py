@@ -10,7 +10,7 @@ from astropy.table import Table
 from astropy.coordinates import SkyCoord
 from astropy.io.votable import parse_single_table
 from astropy.utils.exceptions import AstropyWarning
-from astropy.wcs import WCS
+from dataqa.fits_image import get_fits_image
 
 import warnings
 from inspect import currentframe, getframeinfo
@@ -1363,12 +1363,9 @@ class catalogue(object):
 
     # take 5 brightest sources:
         d = d.sort_values(self.peak_col, ascending=False)[:5]
-        fts = f.open(self.image.residual)[0]
-        data = fts.data
-        wcs = WCS(fts.header).celestial
-        # print data.shape
-        if len(data.shape) == 4:
-            data = data[0,0,:,:]
+        fts = get_fits_image(self.image.residual)
+        wcs = fts.celestial
+        data = fts.plane()
         res = []
         for ra, dec, peak in zip(d[self.ra_col], d[self.dec_col], d[self.peak_col]):
             pxra, pxdec = wcs.wcs_world2pix([[ra, dec]], 1)[0]
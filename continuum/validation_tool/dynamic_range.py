@@ -7,20 +7,19 @@ Created on Wed Mar 20 14:09:37 2019
 """
 
 import pandas as pd
-import astropy.io.fits as fits
 import astropy.units as u
 from astropy.coordinates import SkyCoord, Angle
-from astropy.wcs import WCS
+from dataqa.fits_image import get_fits_image
 
 import numpy as np
 import matplotlib.pyplot as plt
 
 
 def get_image_center_beam(image):
-    fts = fts = fits.open(image)[0]
-    center = SkyCoord(ra=fts.header['CRVAL1'], dec=fts.header['CRVAL2'], unit='deg,deg')
+    header = get_fits_image(image).header
+    center = SkyCoord(ra=header['CRVAL1'], dec=header['CRVAL2'], unit='deg,deg')
 # TODO: is the BPA in degrees?
-    beam = Angle([fts.header['BMAJ'], fts.header['BMIN'], fts.header['BPA']], unit=u.deg)
+    beam = Angle([header['BMAJ'], header['BMIN'], header['BPA']], unit=u.deg)
     return center, beam
 
 
@@ -64,10 +63,9 @@ def local_dynamic_range(pybdsfcat, resimage, radius=30, box=50):
     d = d.sort_values('Peak_flux', ascending=False)[:5]
 
     center, beam = get_image_center_beam(resimage)
-    fts = fits.open(resimage)[0]
-    data = fts.data
-    wcs = WCS(fts.header).celestial
-    data = data[0,0,:,:]
+    fts = get_fits_image(resimage)
+    wcs = fts.celestial
+    data = fts.plane()
     res = []
     for ra, dec, peak in zip(d.RA, d.DEC, d.Peak_flux):
         pxra, pxdec = wcs.wcs_world2pix([[ra, dec]], 1)[0]
@@ -15,12 +15,24 @@ import matplotlib
 import time
 matplotlib.use('Agg')
 import matplotlib.pyplot as plt
-from scandata import ScanData
+from scandata import ScanData, BeamArray, SolutionCache, get_default_imagepath
 from apercal.subs import misc
+from crosscal.visibility_stats import VisibilityStats, BLOCKSIZE
+from beam_grid import Frame, PlotQueue, render_frames
 
 logger = logging.getLogger(__name__)
 
-def make_all_ccal_plots(scan, fluxcal, polcal, output_path=None, basedir=None, trigger_mode=False):
+# legend of the per-antenna plots
+LEGEND_KWARGS = {'markerscale': 3, 'fontsize': 14}
+
+
+def get_pol_series(labels=('XX', 'YY'), marker=',', s=1):
+    """Scatter series for the polarisations in the per-antenna plots"""
+    return [{'label': label, 'marker': marker, 's': s} for label in labels]
+
+
+def make_all_ccal_plots(scan, fluxcal, polcal, output_path=None, basedir=None, trigger_mode=False, n_workers=1,
+                        cache_dir=None, use_cache=True, blocksize=BLOCKSIZE, timeout=None):
     """
     Create crosscal QA plots
 
@@ -30,15 +42,47 @@ def make_all_ccal_plots(scan, fluxcal, polcal, output_path=None, basedir=None, t
         polcal(str): Name of the polcal, e.g. "3C286"
         output_path (str): Output path, None for default
         trigger_mode (bool): To run automatically after Apercal
+        n_workers (int): Number of processes reading the beams and rendering
+            the figures in parallel
+        cache_dir (str): Directory for caching the calibration solutions,
+            None for the default in the QA directory
+        use_cache (bool): Reuse solutions of calibration tables that did not change
+        blocksize (int): Number of fluxcal MS rows read at once, sets the memory use
+        timeout (float): Time in seconds to wait for the beams of the fluxcal MS
+            and of each calibration table in parallel mode, None to wait indefinitely
     """
 
+    # Cache for the calibration solutions, so plots can be
+    # remade quickly if the tables did not change
+    if use_cache:
+        if cache_dir is None:
+            cache_dir = os.path.join(get_default_imagepath(
+                scan, basedir=basedir), 'cache')
+        cache = SolutionCache(cache_dir)
+    else:
+        cache = None
+
+    # The per-antenna figures are collected and rendered together at the end,
+    # so they can be spread over n_workers processes
+    plots = PlotQueue()
+
+    # Read the visibilities for the autocorrelation, raw, model and
+    # corrected data plots in a single pass over each fluxcal MS
+    logger.info("Reading fluxcal visibilities")
+    start_time_vis = time.time()
+    Vis = VisibilityStats(scan, fluxcal, trigger_mode,
+                          basedir=basedir, blocksize=blocksize)
+    Vis.get_data(n_workers=n_workers, timeout=timeout)
+    logger.info('Done with reading fluxcal visibilities ({0:.0f}s)'.format(
+        time.time() - start_time_vis))
+
     # Get autocorrelation plots
     logger.info("Autocorrelation plots")
     start_time_autocorr = time.time()
     AC = AutocorrData(scan, fluxcal, trigger_mode, basedir=basedir)
-    AC.get_data()
-    AC.plot_autocorr_per_antenna(imagepath=output_path)
-    AC.plot_autocorr_per_beam(imagepath=output_path)
+    AC.get_data(vis_stats=Vis)
+    AC.plot_autocorr_per_antenna(imagepath=output_path, plot_queue=plots)
+    AC.plot_autocorr_per_beam(imagepath=output_path, plot_queue=plots)
     logger.info('Done with autocorrelation plots ({0:.0f}s)'.format(
         time.time() - start_time_autocorr))
 
@@ -46,25 +90,25 @@ def make_all_ccal_plots(scan, fluxcal, polcal, output_path=None, basedir=None, t
     logger.info("Bandpass plots")
     start_time_bp = time.time()
     BP = BPSols(scan, fluxcal, trigger_mode)
-    BP.get_data()
-    BP.plot_amp(imagepath=output_path)
-    BP.plot_phase(imagepath=output_path)
+    BP.get_data(n_workers=n_workers, timeout=timeout, cache=cache)
+    BP.plot_amp(imagepath=output_path, plot_queue=plots)
+    BP.plot_phase(imagepath=output_path, plot_queue=plots)
     logger.info('Done with bandpass plots ({0:.0f}s)'.format(time.time() - start_time_bp))
 
     # Get Gain plots
     logger.info("Gain plots")
     start_time_gain = time.time()
     Gain = GainSols(scan, fluxcal, trigger_mode)
-    Gain.get_data()
-    Gain.plot_amp(imagepath=output_path)
-    Gain.plot_phase(imagepath=output_path)
+    Gain.get_data(n_workers=n_workers, timeout=timeout, cache=cache)
+    Gain.plot_amp(imagepath=output_path, plot_queue=plots)
+    Gain.plot_phase(imagepath=output_path, plot_queue=plots)
     logger.info('Done with gainplots ({0:.0f}s)'.format(time.time() - start_time_gain))
 
     # Get Global Delay plots
     logger.info("Global delay plots")
     start_time_gdelay = time.time()
     GD = GDSols(scan, fluxcal, trigger_mode)
-    GD.get_data()
+    GD.get_data(n_workers=n_workers, timeout=timeout, cache=cache)
     GD.plot_delay(imagepath=output_path)
     logger.info('Done with global delay plots ({0:.0f}s)'.format(time.time() - start_time_gdelay))
 
@@ -72,16 +116,16 @@ def make_all_ccal_plots(scan, fluxcal, polcal, output_path=None, basedir=None, t
     logger.info("Leakage plots")
     start_time_leak = time.time()
     Leak = LeakSols(scan, fluxcal, trigger_mode)
-    Leak.get_data()
-    Leak.plot_amp(imagepath=output_path)
-    Leak.plot_phase(imagepath=output_path)
+    Leak.get_data(n_workers=n_workers, timeout=timeout, cache=cache)
+    Leak.plot_amp(imagepath=output_path, plot_queue=plots)
+    Leak.plot_phase(imagepath=output_path, plot_queue=plots)
     logger.info('Done with leakage plots ({0:.0f}s)'.format(time.time() - start_time_leak))
 
     # Get cross hand delay solutions
     logger.info("Cross-hand delay plots")
     start_time_kcross = time.time()
     KCross = KCrossSols(scan, polcal, trigger_mode)
-    KCross.get_data()
+    KCross.get_data(n_workers=n_workers, timeout=timeout, cache=cache)
     KCross.plot_delay(imagepath=output_path)
     logger.info('Done with cross hand delay plots ({0:.0f}s)'.format(time.time() - start_time_kcross))
 
@@ -89,26 +133,26 @@ def make_all_ccal_plots(scan, fluxcal, polcal, output_path=None, basedir=None, t
     logger.info("Polarisation angle plots")
     start_time_polangle = time.time()
     Polangle = PolangleSols(scan, polcal, trigger_mode)
-    Polangle.get_data()
-    Polangle.plot_amp(imagepath=output_path)
-    Polangle.plot_phase(imagepath=output_path)
+    Polangle.get_data(n_workers=n_workers, timeout=timeout, cache=cache)
+    Polangle.plot_amp(imagepath=output_path, plot_queue=plots)
+    Polangle.plot_phase(imagepath=output_path, plot_queue=plots)
     logger.info('Done with polarisation angle correction plots ({0:.0f}s)'.format(time.time() - start_time_polangle))
 
     # Get Raw data
     logger.info("Raw data plots")
     start_time_raw = time.time()
-    Raw = RawData(scan, fluxcal, trigger_mode)
-    Raw.get_data()
-    Raw.plot_amp(imagepath=output_path)
-    Raw.plot_phase(imagepath=output_path)
+    Raw = RawData(scan, fluxcal, trigger_mode, basedir=basedir)
+    Raw.get_data(vis_stats=Vis)
+    Raw.plot_amp(imagepath=output_path, plot_queue=plots)
+    Raw.plot_phase(imagepath=output_path, plot_queue=plots)
     logger.info('Done with plotting raw data ({0:.0f}s)'.format(
         time.time() - start_time_raw))
 
     # Get model data
     logger.info("Model data plots")
     start_time_model = time.time()
-    Model = ModelData(scan, fluxcal, trigger_mode)
-    Model.get_data()
+    Model = ModelData(scan, fluxcal, trigger_mode, basedir=basedir)
+    Model.get_data(vis_stats=Vis)
     Model.plot_amp(imagepath=output_path)
     Model.plot_phase(imagepath=output_path)
     logger.info('Done with plotting model data  ({0:.0f}s)'.format(
@@ -117,13 +161,20 @@ def make_all_ccal_plots(scan, fluxcal, polcal, output_path=None, basedir=None, t
     # Get corrected data
     logger.info("Corrected data plots")
     start_time_corrected = time.time()
-    Corrected = CorrectedData(scan, fluxcal, trigger_mode)
-    Corrected.get_data()
-    Corrected.plot_amp(imagepath=output_path)
-    Corrected.plot_phase(imagepath=output_path)
+    Corrected = CorrectedData(scan, fluxcal, trigger_mode, basedir=basedir)
+    Corrected.get_data(vis_stats=Vis)
+    Corrected.plot_amp(imagepath=output_path, plot_queue=plots)
+    Corrected.plot_phase(imagepath=output_path, plot_queue=plots)
     logger.info('Done with plotting corrected data  ({0:.0f}s)'.format(
         time.time() - start_time_corrected))
 
+    # Render the per-antenna figures of all products
+    logger.info("Rendering {} per-antenna plots".format(len(plots)))
+    start_time_render = time.time()
+    plots.run(n_workers=n_workers)
+    logger.info('Done with rendering plots ({0:.0f}s)'.format(
+        time.time() - start_time_render))
+
 
 class BPSols(ScanData):
     def __init__(self,scan,fluxcal,trigger_mode,basedir=None):
@@ -131,121 +182,91 @@ class BPSols(ScanData):
                           trigger_mode=trigger_mode, basedir=basedir)
         self.imagepathsuffix = "crosscal"
         self.ants = np.empty(len(self.dirlist),dtype=np.object)
-        self.time = np.empty(len(self.dirlist),dtype=np.ndarray)
-        self.freq = np.empty(len(self.dirlist),dtype=np.ndarray)
-        self.flags = np.empty(len(self.dirlist),dtype=np.ndarray)
+        self.time = BeamArray(self.beamlist)
+        self.freq = BeamArray(self.beamlist, empty_shape=(2,2))
+        self.flags = BeamArray(self.beamlist, dtype=bool, fill_value=True, empty_shape=(12,2,2))
+        self.amp = BeamArray(self.beamlist, empty_shape=(12,2,2))
+        self.phase = BeamArray(self.beamlist, empty_shape=(12,2,2))
         self.amps_norm = np.empty(len(self.dirlist),dtype=np.ndarray)
         self.phases_norm = np.empty(len(self.dirlist),dtype=np.ndarray)
     
-    def get_data(self):
-        #get the data
-        for i, (path,beam) in enumerate(zip(self.dirlist,self.beamlist)):
-            bptable = "{0}/raw/{1}.Bscan".format(path,self.sourcename)
-            #print(bptable)
-            if os.path.isdir(bptable):
-                taql_command = ("SELECT TIME,abs(CPARAM) AS amp, arg(CPARAM) AS phase, "
-                                "FLAG FROM {0}").format(bptable)
-                t=pt.taql(taql_command)
-                times = t.getcol('TIME')
-                amp_sols=t.getcol('amp')
-                phase_sols = t.getcol('phase')
-                flags = t.getcol('FLAG')
-                taql_antnames = "SELECT NAME FROM {0}::ANTENNA".format(bptable)
-                t= pt.taql(taql_antnames)
-                ant_names=t.getcol("NAME") 
-                taql_freq = "SELECT CHAN_FREQ FROM {0}::SPECTRAL_WINDOW".format(bptable)
-                t = pt.taql(taql_freq)
-                freqs = t.getcol('CHAN_FREQ')
+    def get_beam_table(self, path):
+        return "{0}/raw/{1}.Bscan".format(path, self.sourcename)
+
+    def get_beam_data(self, path, beam):
+        # get the data
+        bptable = self.get_beam_table(path)
+        #print(bptable)
+        if os.path.isdir(bptable):
+            taql_command = ("SELECT TIME,abs(CPARAM) AS amp, arg(CPARAM) AS phase, "
+                            "FLAG FROM {0}").format(bptable)
+            t=pt.taql(taql_command)
+            times = t.getcol('TIME')
+            amp_sols=t.getcol('amp')
+            phase_sols = t.getcol('phase')
+            flags = t.getcol('FLAG')
+            taql_antnames = "SELECT NAME FROM {0}::ANTENNA".format(bptable)
+            t= pt.taql(taql_antnames)
+            ant_names=t.getcol("NAME") 
+            taql_freq = "SELECT CHAN_FREQ FROM {0}::SPECTRAL_WINDOW".format(bptable)
+            t = pt.taql(taql_freq)
+            freqs = t.getcol('CHAN_FREQ')
+        
+            #check for flags and mask
+            amp_sols[flags] = np.nan
+            phase_sols[flags] = np.nan
+            
+            return {'ants': ant_names,
+                    'time': times,
+                    'phase': phase_sols *180./np.pi, #put into degrees
+                    'amp': amp_sols,
+                    'flags': flags,
+                    'freq': freqs}
             
-                #check for flags and mask
-                amp_sols[flags] = np.nan
-                phase_sols[flags] = np.nan
-                
-                self.ants[i] = ant_names
-                self.time[i] = times
-                self.phase[i] = phase_sols *180./np.pi #put into degrees
-                self.amp[i] = amp_sols
-                self.flags[i] = flags
-                self.freq[i] = freqs
-                
-            else:
-                logger.info('Filling with NaNs. BP table not present for B{}'.format(beam))
-                self.ants[i] = ['RT2','RT3','RT4','RT5','RT6','RT7','RT8','RT9','RTA','RTB','RTC','RTD']
-                self.time[i] = np.array(np.nan)
-                self.phase[i] = np.full((12,2,2),np.nan)
-                self.amp[i] = np.full((12,2,2),np.nan)
-                self.freq[i] = np.full((2,2),np.nan)
+        else:
+            logger.info('Filling with NaNs. BP table not present for B{}'.format(beam))
+            return self.get_empty_beam_data(beam)
+
+    def get_empty_beam_data(self, beam):
+        return {'ants': ['RT2','RT3','RT4','RT5','RT6','RT7','RT8','RT9','RTA','RTB','RTC','RTD']}
             
-    def plot_amp(self, imagepath=None):
+    def plot_amp(self, imagepath=None, plot_queue=None):
         """Plot amplitude, one plot per antenna"""
 
         logging.info("Creating plots for bandpass amplitude")
         imagepath = self.create_imagepath(imagepath)
         #put plots in default place w/ default name
         ant_names = self.ants[0]
-        #figlist = ['fig_'+str(i) for i in range(len(ant_names))]
+        frames = []
         for a,ant in enumerate(ant_names):
-            #iterate through antennas
-            #set up for 8x5 plots (40 beams)
-            nx = 8
-            ny = 5
-            xsize = nx*4
-            ysize = ny*4
-            plt.figure(figsize=(xsize,ysize))
-            plt.suptitle('Bandpass amplitude for Antenna {0}'.format(ant),size=30)
-            
+            #iterate through antennas, one panel per beam
+            panels = []
             for n,beam in enumerate(self.beamlist):
-                beamnum = int(beam)
-                #print(beamnum)
-                plt.subplot(ny, nx, beamnum+1)
-                plt.scatter(self.freq[n][0,:],self.amp[n][a,:,0],
-                            label='XX',
-                            marker=',',s=1)
-                plt.scatter(self.freq[n][0,:],self.amp[n][a,:,1],
-                            label='YY',
-                            marker=',',s=1)
-                plt.title('Beam {0}'.format(beam))
-                plt.ylim(0,1.8)
-            plt.legend(markerscale=3,fontsize=14)
-            plt.savefig('{imagepath}/BP_amp_{ant}_{scan}.png'.format(ant=ant, scan=self.scan, imagepath=imagepath))
-            #plt.clf()
-            # to really close the plot, this will do
-            plt.close('all')
+                panels.append((int(beam), 'Beam {0}'.format(beam),
+                               [(self.freq[n][0,:], self.amp[n][a,:,0]),
+                                (self.freq[n][0,:], self.amp[n][a,:,1])]))
+            frames.append(Frame('{imagepath}/BP_amp_{ant}_{scan}.png'.format(ant=ant, scan=self.scan, imagepath=imagepath),
+                                'Bandpass amplitude for Antenna {0}'.format(ant), panels))
+        render_frames(frames, plot_queue=plot_queue, series=get_pol_series(), ylim=(0,1.8), legend_kwargs=LEGEND_KWARGS)
             
-    def plot_phase(self, imagepath=None):
+    def plot_phase(self, imagepath=None, plot_queue=None):
         """Plot phase, one plot per antenna"""
 
         logger.info("Creating plots for bandpass phase")
         
         imagepath = self.create_imagepath(imagepath)
         ant_names = self.ants[0]
-        #figlist = ['fig_'+str(i) for i in range(len(ant_names))]
+        frames = []
         for a,ant in enumerate(ant_names):
-            #iterate through antennas
-            #set up for 8x5 plots (40 beams)
-            nx = 8
-            ny = 5
-            xsize = nx*4
-            ysize = ny*4
-            plt.figure(figsize=(xsize,ysize))
-            plt.suptitle('Bandpass phases for Antenna {0}'.format(ant),size=30)
-            
+            #iterate through antennas, one panel per beam
+            panels = []
             for n,beam in enumerate(self.beamlist):
-                beamnum = int(beam)
-                plt.subplot(ny, nx, beamnum+1)
-                plt.scatter(self.freq[n][0,:],self.phase[n][a,:,0],
-                            label='XX',
-                            marker=',',s=1)
-                plt.scatter(self.freq[n][0,:],self.phase[n][a,:,1],
-                            label='YY',
-                            marker=',',s=1)
-                plt.title('Beam {0}'.format(beam))
-                plt.ylim(-180,180)
-            plt.legend(markerscale=3,fontsize=14)
-            plt.savefig('{imagepath}/BP_phase_{ant}_{scan}.png'.format(ant=ant,scan=self.scan,imagepath=imagepath))
-            #plt.clf()
-            # to really close the plot, this will do
-            plt.close('all')
+                panels.append((int(beam), 'Beam {0}'.format(beam),
+                               [(self.freq[n][0,:], self.phase[n][a,:,0]),
+                                (self.freq[n][0,:], self.phase[n][a,:,1])]))
+            frames.append(Frame('{imagepath}/BP_phase_{ant}_{scan}.png'.format(ant=ant,scan=self.scan,imagepath=imagepath),
+                                'Bandpass phases for Antenna {0}'.format(ant), panels))
+        render_frames(frames, plot_queue=plot_queue, series=get_pol_series(), ylim=(-180,180), legend_kwargs=LEGEND_KWARGS)
             
 
 class GainSols(ScanData):
@@ -254,67 +275,71 @@ class GainSols(ScanData):
                           trigger_mode=trigger_mode, basedir=basedir)
         self.imagepathsuffix = "crosscal"
         self.ants = np.empty(len(self.dirlist),dtype=np.object)
-        self.time = np.empty(len(self.dirlist),dtype=np.ndarray)
-        self.flags = np.empty(len(self.dirlist),dtype=np.ndarray)
+        self.time = BeamArray(self.beamlist, empty_shape=(2,))
+        self.flags = BeamArray(self.beamlist, dtype=bool, fill_value=True, empty_shape=(12,2,2))
+        self.amp = BeamArray(self.beamlist, empty_shape=(12,2,2))
+        self.phase = BeamArray(self.beamlist, empty_shape=(12,2,2))
         self.amps_norm = np.empty(len(self.dirlist),dtype=np.ndarray)
         self.phases_norm = np.empty(len(self.dirlist),dtype=np.ndarray)
         
-    def get_data(self):
-        for i, (path,beam) in enumerate(zip(self.dirlist,self.beamlist)):
-            gaintable = "{0}/raw/{1}.G1ap".format(path,self.sourcename)
-            #check if table exists
-            #otherwise, place NaNs in place for everything
-            if os.path.isdir(gaintable):
-                taql_antnames = "SELECT NAME FROM {0}::ANTENNA".format(gaintable)
-                t= pt.taql(taql_antnames)
-                ant_names=t.getcol("NAME")
-    
-                #then get number of times
-                #need this for setting shape
-                taql_time =  "select TIME from {0} orderby unique TIME".format(gaintable)
-                t= pt.taql(taql_time)
-                times = t.getcol('TIME') 
-    
-                #then iterate over antenna
-                #set array sahpe to be [n_ant,n_time,n_stokes]
-                #how can I get n_stokes? Could be 2 or 4, want to find from data
-                #get 1 data entry
-                taql_stokes = "SELECT abs(CPARAM) AS amp from {0} limit 1" .format(gaintable)
-                t_pol = pt.taql(taql_stokes)
-                pol_array = t_pol.getcol('amp')
-                n_stokes = pol_array.shape[2] #shape is time, one, nstokes
+    def get_beam_table(self, path):
+        return "{0}/raw/{1}.G1ap".format(path, self.sourcename)
+
+    def get_beam_data(self, path, beam):
+        # get the data
+        gaintable = self.get_beam_table(path)
+        #check if table exists
+        #otherwise, place NaNs in place for everything
+        if os.path.isdir(gaintable):
+            taql_antnames = "SELECT NAME FROM {0}::ANTENNA".format(gaintable)
+            t= pt.taql(taql_antnames)
+            ant_names=t.getcol("NAME")
+
+            #then get number of times
+            #need this for setting shape
+            taql_time =  "select TIME from {0} orderby unique TIME".format(gaintable)
+            t= pt.taql(taql_time)
+            times = t.getcol('TIME') 
+
+            #then iterate over antenna
+            #set array sahpe to be [n_ant,n_time,n_stokes]
+            #how can I get n_stokes? Could be 2 or 4, want to find from data
+            #get 1 data entry
+            taql_stokes = "SELECT abs(CPARAM) AS amp from {0} limit 1" .format(gaintable)
+            t_pol = pt.taql(taql_stokes)
+            pol_array = t_pol.getcol('amp')
+            n_stokes = pol_array.shape[2] #shape is time, one, nstokes
+
+            amp_ant_array = np.empty((len(ant_names),len(times),n_stokes),dtype=float)
+            phase_ant_array = np.empty((len(ant_names),len(times),n_stokes),dtype=float)
+            flags_ant_array = np.empty((len(ant_names),len(times),n_stokes),dtype=bool)
     
-                amp_ant_array = np.empty((len(ant_names),len(times),n_stokes),dtype=object)
-                phase_ant_array = np.empty((len(ant_names),len(times),n_stokes),dtype=object)
-                flags_ant_array = np.empty((len(ant_names),len(times),n_stokes),dtype=bool)
+            for ant in xrange(len(ant_names)):
+                taql_command = ("SELECT abs(CPARAM) AS amp, arg(CPARAM) AS phase, FLAG FROM {0} " 
+                                "WHERE ANTENNA1={1}").format(gaintable,ant)
+                t = pt.taql(taql_command)
+                amp_ant_array[ant,:,:] = t.getcol('amp')[:,0,:]
+                phase_ant_array[ant,:,:] = t.getcol('phase')[:,0,:]
+                flags_ant_array[ant,:,:] = t.getcol('FLAG')[:,0,:]
+            
+            #check for flags and mask
+            amp_ant_array[flags_ant_array] = np.nan
+            phase_ant_array[flags_ant_array] = np.nan
         
-                for ant in xrange(len(ant_names)):
-                    taql_command = ("SELECT abs(CPARAM) AS amp, arg(CPARAM) AS phase, FLAG FROM {0} " 
-                                    "WHERE ANTENNA1={1}").format(gaintable,ant)
-                    t = pt.taql(taql_command)
-                    amp_ant_array[ant,:,:] = t.getcol('amp')[:,0,:]
-                    phase_ant_array[ant,:,:] = t.getcol('phase')[:,0,:]
-                    flags_ant_array[ant,:,:] = t.getcol('FLAG')[:,0,:]
-                
-                #check for flags and mask
-                amp_ant_array[flags_ant_array] = np.nan
-                phase_ant_array[flags_ant_array] = np.nan
+            return {'amp': amp_ant_array,
+                    'phase': phase_ant_array * 180./np.pi, #put into degrees
+                    'ants': ant_names,
+                    'time': times,
+                    'flags': flags_ant_array}
             
-                self.amp[i] = amp_ant_array
-                self.phase[i] = phase_ant_array * 180./np.pi #put into degrees
-                self.ants[i] = ant_names
-                self.time[i] = times
-                self.flags[i] = flags_ant_array
-                
-            else:
-                logger.info('Filling with NaNs. Gain table not present for B{}'.format(beam))
-                self.amp[i] = np.full((12,2,2),np.nan)
-                self.phase[i] = np.full((12,2,2),np.nan)
-                self.ants[i] = ['RT2','RT3','RT4','RT5','RT6','RT7','RT8','RT9','RTA','RTB','RTC','RTD']
-                self.time[i] = np.full((2),np.nan)
-                self.flags[i] = np.full((12,2,2),np.nan)
+        else:
+            logger.info('Filling with NaNs. Gain table not present for B{}'.format(beam))
+            return self.get_empty_beam_data(beam)
+
+    def get_empty_beam_data(self, beam):
+        return {'ants': ['RT2','RT3','RT4','RT5','RT6','RT7','RT8','RT9','RTA','RTB','RTC','RTD']}
             
-    def plot_amp(self, imagepath=None):
+    def plot_amp(self, imagepath=None, plot_queue=None):
         """Plot amplitude, one plot per antenna"""
 
         logger.info("Creating plots for gain amplitude")
@@ -323,35 +348,19 @@ class GainSols(ScanData):
 
         #put plots in default place w/ default name
         ant_names = self.ants[0]
-        #figlist = ['fig_'+str(i) for i in range(len(ant_names))]
+        frames = []
         for a,ant in enumerate(ant_names):
-            #iterate through antennas
-            #set up for 8x5 plots (40 beams)
-            nx = 8
-            ny = 5
-            xsize = nx*4
-            ysize = ny*4
-            plt.figure(figsize=(xsize,ysize))
-            plt.suptitle('Gain amplitude for Antenna {0}'.format(ant),size=30)
-            
+            #iterate through antennas, one panel per beam
+            panels = []
             for n,beam in enumerate(self.beamlist):
-                beamnum = int(beam)
-                plt.subplot(ny, nx, beamnum+1)
-                plt.scatter(self.time[n],self.amp[n][a,:,0],
-                           label='XX',
-                           marker=',',s=5)
-                plt.scatter(self.time[n],self.amp[n][a,:,1],
-                           label='YY',
-                           marker=',',s=5)
-                plt.title('Beam {0}'.format(beam))
-                plt.ylim(10,30)
-            plt.legend(markerscale=3,fontsize=14)
-            plt.savefig(plt.savefig('{imagepath}/Gain_amp_{ant}_{scan}.png'.format(ant=ant,scan=self.scan,imagepath=imagepath)))
-            #plt.clf()
-            # to really close the plot, this will do
-            plt.close('all')
+                panels.append((int(beam), 'Beam {0}'.format(beam),
+                               [(self.time[n], self.amp[n][a,:,0]),
+                                (self.time[n], self.amp[n][a,:,1])]))
+            frames.append(Frame('{imagepath}/Gain_amp_{ant}_{scan}.png'.format(ant=ant,scan=self.scan,imagepath=imagepath),
+                                'Gain amplitude for Antenna {0}'.format(ant), panels))
+        render_frames(frames, plot_queue=plot_queue, series=get_pol_series(s=5), ylim=(10,30), legend_kwargs=LEGEND_KWARGS)
             
-    def plot_phase(self,imagepath=None):
+    def plot_phase(self,imagepath=None, plot_queue=None):
         """Plot phase, one plot per antenna"""
 
         logger.info("Creating plots for gain phase")
@@ -360,31 +369,17 @@ class GainSols(ScanData):
 
         #put plots in default place w/ default name
         ant_names = self.ants[0]
-        #figlist = ['fig_'+str(i) for i in range(len(ant_names))]
+        frames = []
         for a,ant in enumerate(ant_names):
-            #iterate through antennas
-            #set up for 8x5 plots (40 beams)
-            nx = 8
-            ny = 5
-            xsize = nx*4
-            ysize = ny*4
-            plt.figure(figsize=(xsize,ysize))
-            plt.suptitle('Gain phase for Antenna {0}'.format(ant),size=30)
-            
+            #iterate through antennas, one panel per beam
+            panels = []
             for n,beam in enumerate(self.beamlist):
-                beamnum = int(beam)
-                plt.subplot(ny, nx, beamnum+1)
-                plt.scatter(self.time[n],self.phase[n][a,:,0],
-                           label='XX',marker=',',s=5)
-                plt.scatter(self.time[n],self.phase[n][a,:,1],
-                           label='YY',marker=',',s=5)
-                plt.title('Beam {0}'.format(beam))
-                plt.ylim(-180,180)
-            plt.legend(markerscale=3,fontsize=14)
-            plt.savefig(plt.savefig('{2}/Gain_phase_{0}_{1}.png'.format(ant,self.scan,imagepath)))
-            #plt.clf()
-            # to really close the plot, this will do
-            plt.close('all')
+                panels.append((int(beam), 'Beam {0}'.format(beam),
+                               [(self.time[n], self.phase[n][a,:,0]),
+                                (self.time[n], self.phase[n][a,:,1])]))
+            frames.append(Frame('{2}/Gain_phase_{0}_{1}.png'.format(ant,self.scan,imagepath),
+                                'Gain phase for Antenna {0}'.format(ant), panels))
+        render_frames(frames, plot_queue=plot_queue, series=get_pol_series(s=5), ylim=(-180,180), legend_kwargs=LEGEND_KWARGS)
 
 
 class GDSols(ScanData):
@@ -393,27 +388,31 @@ class GDSols(ScanData):
                           trigger_mode=trigger_mode, basedir=basedir)
         self.imagepathsuffix = "crosscal"
         self.ants = np.empty(len(self.dirlist),dtype=np.object)
-        self.delays = np.empty(len(self.dirlist),dtype=np.ndarray)
+        self.delays = BeamArray(self.beamlist, empty_shape=(12, 2))
 
-    def get_data(self):
+    def get_beam_table(self, path):
+        return "{0}/raw/{1}.K".format(path, self.sourcename)
+
+    def get_beam_data(self, path, beam):
         # get the data
-        for i, (path, beam) in enumerate(zip(self.dirlist, self.beamlist)):
-            gdtable = "{0}/raw/{1}.K".format(path, self.sourcename)
-            if os.path.isdir(gdtable):
-                taql_command = ("SELECT FPARAM FROM {0} ").format(gdtable)
-                t = pt.taql(taql_command)
-                delays = t.getcol('FPARAM')
-                taql_antnames = "SELECT NAME FROM {0}::ANTENNA".format(gdtable)
-                t = pt.taql(taql_antnames)
-                ant_names = t.getcol("NAME")
+        gdtable = self.get_beam_table(path)
+        if os.path.isdir(gdtable):
+            taql_command = ("SELECT FPARAM FROM {0} ").format(gdtable)
+            t = pt.taql(taql_command)
+            delays = t.getcol('FPARAM')
+            taql_antnames = "SELECT NAME FROM {0}::ANTENNA".format(gdtable)
+            t = pt.taql(taql_antnames)
+            ant_names = t.getcol("NAME")
 
-                self.ants[i] = ant_names
-                self.delays[i] = delays[:,0,:]
+            return {'ants': ant_names,
+                    'delays': delays[:,0,:]}
 
-            else:
-                logger.info('Filling with NaNs. Global delay table not present for B{}'.format(beam))
-                self.ants[i] = misc.create_antnames()
-                self.delays[i] = np.full((12, 2), np.nan)
+        else:
+            logger.info('Filling with NaNs. Global delay table not present for B{}'.format(beam))
+            return self.get_empty_beam_data(beam)
+
+    def get_empty_beam_data(self, beam):
+        return {'ants': misc.create_antnames()}
 
     def plot_delay(self, imagepath=None):
         """Plot amplitude, one plot per antenna"""
@@ -464,7 +463,7 @@ class GDSols(ScanData):
         plt.suptitle('Global dish-based delay', size=30)
 
         #reshape array
-        delays = np.hstack(self.delays).reshape((12,40,2))
+        delays = np.transpose(self.delays.masked().filled(np.nan), (1, 0, 2))
         beamarray = np.arange(len(self.beamlist))
 
         for n, ant in enumerate(ant_names):
@@ -486,99 +485,85 @@ class LeakSols(ScanData):
                           trigger_mode=trigger_mode, basedir=basedir)
         self.imagepathsuffix = "crosscal"
         self.ants = np.empty(len(self.dirlist),dtype=np.object)
-        self.freq = np.empty(len(self.dirlist),dtype=np.ndarray)
-        self.flags = np.empty(len(self.dirlist),dtype=np.ndarray)
+        self.freq = BeamArray(self.beamlist, empty_shape=(2, 2))
+        self.flags = BeamArray(self.beamlist, dtype=bool, fill_value=True, empty_shape=(12, 2, 2))
+        self.amp = BeamArray(self.beamlist, empty_shape=(12, 2, 2))
+        self.phase = BeamArray(self.beamlist, empty_shape=(12, 2, 2))
         self.leakage = np.empty((len(self.dirlist)),dtype=np.ndarray)
 
-    def get_data(self):
+    def get_beam_table(self, path):
+        return "{0}/raw/{1}.Df".format(path, self.sourcename)
+
+    def get_beam_data(self, path, beam):
         # get the data
-        for i, (path, beam) in enumerate(zip(self.dirlist, self.beamlist)):
-            leaktable = "{0}/raw/{1}.Df".format(path, self.sourcename)
-            if os.path.isdir(leaktable):
-                taql_command = ("SELECT abs(CPARAM) AS amp, arg(CPARAM) AS phase, FLAG FROM {0}").format(leaktable)
-                t = pt.taql(taql_command)
-                ampleak_sols=t.getcol('amp')
-                phaseleak_sols = t.getcol('phase')
-                flags = t.getcol('FLAG')
-                taql_antnames = "SELECT NAME FROM {0}::ANTENNA".format(leaktable)
-                t = pt.taql(taql_antnames)
-                ant_names = t.getcol("NAME")
-                taql_freq = "SELECT CHAN_FREQ FROM {0}::SPECTRAL_WINDOW".format(leaktable)
-                t = pt.taql(taql_freq)
-                freqs = t.getcol('CHAN_FREQ')
-
-                # check for flags and mask
-                ampleak_sols[flags] = np.nan
-                phaseleak_sols[flags] = np.nan
-
-                self.ants[i] = ant_names
-                self.phase[i] = phaseleak_sols *180./np.pi #put into degrees
-                self.amp[i] = ampleak_sols
-                self.flags[i] = flags
-                self.freq[i] = freqs
-
-            else:
-                logger.info('Filling with NaNs. Polarisation leakage table not present for B{}'.format(beam))
-                self.ants[i] = misc.create_antnames()
-                self.phase[i] = np.full((12, 2, 2),np.nan)
-                self.amp[i] = np.full((12, 2, 2), np.nan)
-                self.freq[i] = np.full((2, 2), np.nan)
-
-    def plot_amp(self, imagepath=None):
+        leaktable = self.get_beam_table(path)
+        if os.path.isdir(leaktable):
+            taql_command = ("SELECT abs(CPARAM) AS amp, arg(CPARAM) AS phase, FLAG FROM {0}").format(leaktable)
+            t = pt.taql(taql_command)
+            ampleak_sols=t.getcol('amp')
+            phaseleak_sols = t.getcol('phase')
+            flags = t.getcol('FLAG')
+            taql_antnames = "SELECT NAME FROM {0}::ANTENNA".format(leaktable)
+            t = pt.taql(taql_antnames)
+            ant_names = t.getcol("NAME")
+            taql_freq = "SELECT CHAN_FREQ FROM {0}::SPECTRAL_WINDOW".format(leaktable)
+            t = pt.taql(taql_freq)
+            freqs = t.getcol('CHAN_FREQ')
+
+            # check for flags and mask
+            ampleak_sols[flags] = np.nan
+            phaseleak_sols[flags] = np.nan
+
+            return {'ants': ant_names,
+                    'phase': phaseleak_sols *180./np.pi, #put into degrees
+                    'amp': ampleak_sols,
+                    'flags': flags,
+                    'freq': freqs}
+
+        else:
+            logger.info('Filling with NaNs. Polarisation leakage table not present for B{}'.format(beam))
+            return self.get_empty_beam_data(beam)
+
+    def get_empty_beam_data(self, beam):
+        return {'ants': misc.create_antnames()}
+
+    def plot_amp(self, imagepath=None, plot_queue=None):
         """Plot leakage, one plot per antenna"""
 
         logger.info("Creating plots for amplitude leakage")
         imagepath = self.create_imagepath(imagepath)
         # put plots in default place w/ default name
         ant_names = self.ants[0]
+        frames = []
         for a, ant in enumerate(ant_names):
-            # iterate through antennas
-            # set up for 8x5 plots (40 beams)
-            nx = 8
-            ny = 5
-            xsize = nx * 4
-            ysize = ny * 4
-            plt.figure(figsize=(xsize, ysize))
-            plt.suptitle('Amplitude polarisation leakage for Antenna {0}'.format(ant), size=30)
-
+            # iterate through antennas, one panel per beam
+            panels = []
             for n, beam in enumerate(self.beamlist):
-                beamnum = int(beam)
-                plt.subplot(ny, nx, beamnum + 1)
-                plt.scatter(self.freq[n][0, :], self.amp[n][a, :, 0], label='X', marker=',', s=1)
-                plt.scatter(self.freq[n][0, :], self.amp[n][a, :, 1], label='Y', marker=',', s=1)
-                plt.title('Beam {0}'.format(beam))
-            plt.legend(markerscale=3, fontsize=14)
-            plt.savefig('{imagepath}/Df_amp_{ant}_{scan}.png'.format(ant=ant, scan=self.scan, imagepath=imagepath))
-            # to really close the plot, this will do
-            plt.close('all')
-
-    def plot_phase(self, imagepath=None):
+                panels.append((int(beam), 'Beam {0}'.format(beam),
+                               [(self.freq[n][0, :], self.amp[n][a, :, 0]),
+                                (self.freq[n][0, :], self.amp[n][a, :, 1])]))
+            frames.append(Frame('{imagepath}/Df_amp_{ant}_{scan}.png'.format(ant=ant, scan=self.scan, imagepath=imagepath),
+                                'Amplitude polarisation leakage for Antenna {0}'.format(ant), panels))
+        render_frames(frames, plot_queue=plot_queue, series=get_pol_series(labels=('X', 'Y')), legend_kwargs=LEGEND_KWARGS)
+
+    def plot_phase(self, imagepath=None, plot_queue=None):
         """Plot leakage, one plot per antenna"""
 
         logger.info("Creating plots for phase leakage")
         imagepath = self.create_imagepath(imagepath)
         # put plots in default place w/ default name
         ant_names = self.ants[0]
+        frames = []
         for a, ant in enumerate(ant_names):
-            # iterate through antennas
-            # set up for 8x5 plots (40 beams)
-            nx = 8
-            ny = 5
-            xsize = nx * 4
-            ysize = ny * 4
-            plt.figure(figsize=(xsize, ysize))
-            plt.suptitle('Phase polarisation leakage for Antenna {0}'.format(ant), size=30)
-
+            # iterate through antennas, one panel per beam
+            panels = []
             for n, beam in enumerate(self.beamlist):
-                beamnum = int(beam)
-                plt.subplot(ny, nx, beamnum + 1)
-                plt.scatter(self.freq[n][0, :], self.phase[n][a, :, 0], label='X', marker=',', s=1)
-                plt.scatter(self.freq[n][0, :], self.phase[n][a, :, 1], label='Y', marker=',', s=1)
-                plt.title('Beam {0}'.format(beam))
-            plt.legend(markerscale=3, fontsize=14)
-            plt.savefig('{imagepath}/Df_phase_{ant}_{scan}.png'.format(ant=ant, scan=self.scan, imagepath=imagepath))
-            # to really close the plot, this will do
-            plt.close('all')
+                panels.append((int(beam), 'Beam {0}'.format(beam),
+                               [(self.freq[n][0, :], self.phase[n][a, :, 0]),
+                                (self.freq[n][0, :], self.phase[n][a, :, 1])]))
+            frames.append(Frame('{imagepath}/Df_phase_{ant}_{scan}.png'.format(ant=ant, scan=self.scan, imagepath=imagepath),
+                                'Phase polarisation leakage for Antenna {0}'.format(ant), panels))
+        render_frames(frames, plot_queue=plot_queue, series=get_pol_series(labels=('X', 'Y')), legend_kwargs=LEGEND_KWARGS)
 
 
 class KCrossSols(ScanData):
@@ -587,27 +572,31 @@ class KCrossSols(ScanData):
                           trigger_mode=trigger_mode, basedir=basedir)
         self.imagepathsuffix = "crosscal"
         self.ants = np.empty(len(self.dirlist),dtype=np.object)
-        self.delays = np.empty(len(self.dirlist),dtype=np.ndarray)
+        self.delays = BeamArray(self.beamlist, empty_shape=(12, 2))
 
-    def get_data(self):
+    def get_beam_table(self, path):
+        return "{0}/raw/{1}.Kcross".format(path, self.sourcename)
+
+    def get_beam_data(self, path, beam):
         # get the data
-        for i, (path, beam) in enumerate(zip(self.dirlist, self.beamlist)):
-            gdtable = "{0}/raw/{1}.Kcross".format(path, self.sourcename)
-            if os.path.isdir(gdtable):
-                taql_command = ("SELECT FPARAM FROM {0} ").format(gdtable)
-                t = pt.taql(taql_command)
-                delays = t.getcol('FPARAM')
-                taql_antnames = "SELECT NAME FROM {0}::ANTENNA".format(gdtable)
-                t = pt.taql(taql_antnames)
-                ant_names = t.getcol("NAME")
+        gdtable = self.get_beam_table(path)
+        if os.path.isdir(gdtable):
+            taql_command = ("SELECT FPARAM FROM {0} ").format(gdtable)
+            t = pt.taql(taql_command)
+            delays = t.getcol('FPARAM')
+            taql_antnames = "SELECT NAME FROM {0}::ANTENNA".format(gdtable)
+            t = pt.taql(taql_antnames)
+            ant_names = t.getcol("NAME")
 
-                self.ants[i] = ant_names
-                self.delays[i] = delays[:,0,:]
+            return {'ants': ant_names,
+                    'delays': delays[:,0,:]}
 
-            else:
-                logger.info('Filling with NaNs. Cross hand delay table not present for B{}'.format(beam))
-                self.ants[i] = misc.create_antnames()
-                self.delays[i] = np.full((12, 2), np.nan)
+        else:
+            logger.info('Filling with NaNs. Cross hand delay table not present for B{}'.format(beam))
+            return self.get_empty_beam_data(beam)
+
+    def get_empty_beam_data(self, beam):
+        return {'ants': misc.create_antnames()}
 
     def plot_delay(self, imagepath=None):
         """Plot amplitude, one plot per antenna"""
@@ -645,123 +634,158 @@ class PolangleSols(ScanData):
                           trigger_mode=trigger_mode, basedir=basedir)
         self.imagepathsuffix = "crosscal"
         self.ants = np.empty(len(self.dirlist),dtype=np.object)
-        self.freq = np.empty(len(self.dirlist),dtype=np.ndarray)
-        self.flags = np.empty(len(self.dirlist),dtype=np.ndarray)
+        self.freq = BeamArray(self.beamlist, empty_shape=(2, 2))
+        self.flags = BeamArray(self.beamlist, dtype=bool, fill_value=True, empty_shape=(12, 2, 2))
+        self.amp = BeamArray(self.beamlist, empty_shape=(12, 2, 2))
+        self.phase = BeamArray(self.beamlist, empty_shape=(12, 2, 2))
         self.polangle = np.empty((len(self.dirlist)),dtype=np.ndarray)
 
-    def get_data(self):
+    def get_beam_table(self, path):
+        return "{0}/raw/{1}.Xf".format(path, self.sourcename)
+
+    def get_beam_data(self, path, beam):
         # get the data
-        for i, (path, beam) in enumerate(zip(self.dirlist, self.beamlist)):
-            polangletable = "{0}/raw/{1}.Xf".format(path, self.sourcename)
-            if os.path.isdir(polangletable):
-                taql_command = ("SELECT abs(CPARAM) AS amp, arg(CPARAM) AS phase, FLAG FROM {0}").format(polangletable)
-                t = pt.taql(taql_command)
-                amppolangle_sols=t.getcol('amp')
-                phasepolangle_sols = t.getcol('phase')
-                flags = t.getcol('FLAG')
-                taql_antnames = "SELECT NAME FROM {0}::ANTENNA".format(polangletable)
-                t = pt.taql(taql_antnames)
-                ant_names = t.getcol("NAME")
-                taql_freq = "SELECT CHAN_FREQ FROM {0}::SPECTRAL_WINDOW".format(polangletable)
-                t = pt.taql(taql_freq)
-                freqs = t.getcol('CHAN_FREQ')
-
-                # check for flags and mask
-                amppolangle_sols[flags] = np.nan
-                phasepolangle_sols[flags] = np.nan
-
-                self.ants[i] = ant_names
-                self.phase[i] = phasepolangle_sols *180./np.pi #put into degrees
-                self.amp[i] = amppolangle_sols
-                self.flags[i] = flags
-                self.freq[i] = freqs
-
-            else:
-                logger.info('Filling with NaNs. Polarisation angle table not present for B{}'.format(beam))
-                self.ants[i] = misc.create_antnames()
-                self.phase[i] = np.full((12, 2, 2),np.nan)
-                self.amp[i] = np.full((12, 2, 2), np.nan)
-                self.freq[i] = np.full((2, 2), np.nan)
-
-    def plot_amp(self, imagepath=None):
+        polangletable = self.get_beam_table(path)
+        if os.path.isdir(polangletable):
+            taql_command = ("SELECT abs(CPARAM) AS amp, arg(CPARAM) AS phase, FLAG FROM {0}").format(polangletable)
+            t = pt.taql(taql_command)
+            amppolangle_sols=t.getcol('amp')
+            phasepolangle_sols = t.getcol('phase')
+            flags = t.getcol('FLAG')
+            taql_antnames = "SELECT NAME FROM {0}::ANTENNA".format(polangletable)
+            t = pt.taql(taql_antnames)
+            ant_names = t.getcol("NAME")
+            taql_freq = "SELECT CHAN_FREQ FROM {0}::SPECTRAL_WINDOW".format(polangletable)
+            t = pt.taql(taql_freq)
+            freqs = t.getcol('CHAN_FREQ')
+
+            # check for flags and mask
+            amppolangle_sols[flags] = np.nan
+            phasepolangle_sols[flags] = np.nan
+
+            return {'ants': ant_names,
+                    'phase': phasepolangle_sols *180./np.pi, #put into degrees
+                    'amp': amppolangle_sols,
+                    'flags': flags,
+                    'freq': freqs}
+
+        else:
+            logger.info('Filling with NaNs. Polarisation angle table not present for B{}'.format(beam))
+            return self.get_empty_beam_data(beam)
+
+    def get_empty_beam_data(self, beam):
+        return {'ants': misc.create_antnames()}
+
+    def plot_amp(self, imagepath=None, plot_queue=None):
         """Plot leakage, one plot per antenna"""
 
         logger.info("Creating plots for amplitude polarisation angle corrections")
         imagepath = self.create_imagepath(imagepath)
         # put plots in default place w/ default name
         ant_names = self.ants[0]
+        frames = []
         for a, ant in enumerate(ant_names):
-            # iterate through antennas
-            # set up for 8x5 plots (40 beams)
-            nx = 8
-            ny = 5
-            xsize = nx * 4
-            ysize = ny * 4
-            plt.figure(figsize=(xsize, ysize))
-            plt.suptitle('Amplitude polarisation angle for Antenna {0}'.format(ant), size=30)
-
+            # iterate through antennas, one panel per beam
+            panels = []
             for n, beam in enumerate(self.beamlist):
-                beamnum = int(beam)
-                plt.subplot(ny, nx, beamnum + 1)
-                plt.scatter(self.freq[n][0, :], self.amp[n][a, :, 0], marker=',', s=1)
-                plt.title('Beam {0}'.format(beam))
-            plt.savefig('{imagepath}/Xf_amp_{ant}_{scan}.png'.format(ant=ant, scan=self.scan, imagepath=imagepath))
-            # to really close the plot, this will do
-            plt.close('all')
-
-    def plot_phase(self, imagepath=None):
+                panels.append((int(beam), 'Beam {0}'.format(beam),
+                               [(self.freq[n][0, :], self.amp[n][a, :, 0])]))
+            frames.append(Frame('{imagepath}/Xf_amp_{ant}_{scan}.png'.format(ant=ant, scan=self.scan, imagepath=imagepath),
+                                'Amplitude polarisation angle for Antenna {0}'.format(ant), panels))
+        render_frames(frames, plot_queue=plot_queue, series=[{'marker': ',', 's': 1}])
+
+    def plot_phase(self, imagepath=None, plot_queue=None):
         """Plot leakage, one plot per antenna"""
 
         logger.info("Creating plots for phase polarisation angle corrections")
         imagepath = self.create_imagepath(imagepath)
         # put plots in default place w/ default name
         ant_names = self.ants[0]
+        frames = []
         for a, ant in enumerate(ant_names):
-            # iterate through antennas
-            # set up for 8x5 plots (40 beams)
-            nx = 8
-            ny = 5
-            xsize = nx * 4
-            ysize = ny * 4
-            plt.figure(figsize=(xsize, ysize))
-            plt.suptitle('Phase polarisation angle for Antenna {0}'.format(ant), size=30)
-
+            # iterate through antennas, one panel per beam
+            panels = []
             for n, beam in enumerate(self.beamlist):
-                beamnum = int(beam)
-                plt.subplot(ny, nx, beamnum + 1)
-                plt.scatter(self.freq[n][0, :], self.phase[n][a, :, 0], marker=',', s=1)
-                plt.title('Beam {0}'.format(beam))
-            plt.savefig('{imagepath}/Xf_phase_{ant}_{scan}.png'.format(ant=ant, scan=self.scan, imagepath=imagepath))
-            # to really close the plot, this will do
-            plt.close('all')
+                panels.append((int(beam), 'Beam {0}'.format(beam),
+                               [(self.freq[n][0, :], self.phase[n][a, :, 0])]))
+            frames.append(Frame('{imagepath}/Xf_phase_{ant}_{scan}.png'.format(ant=ant, scan=self.scan, imagepath=imagepath),
+                                'Phase polarisation angle for Antenna {0}'.format(ant), panels))
+        render_frames(frames, plot_queue=plot_queue, series=[{'marker': ',', 's': 1}])
 
 
-class ModelData(ScanData):
+class VisibilityData(ScanData):
+    """
+    Base class for plots of averaged visibilities of the fluxcal MS
+
+    Subclasses list the averages they need in products (see
+    visibility_stats.PRODUCTS) and fill the arrays of a beam in fill_beam.
+    """
+    products = []
+
     def __init__(self, scan, fluxcal, trigger_mode, basedir=None):
         ScanData.__init__(self, scan, fluxcal,
                           trigger_mode=trigger_mode, basedir=basedir)
         self.imagepathsuffix = "crosscal"
-        self.freq = np.empty(len(self.dirlist),dtype=np.ndarray)
-        
-    def get_data(self):
-        for i, (path,beam) in enumerate(zip(self.dirlist,self.beamlist)):
-            msfile = "{0}/raw/{1}.MS".format(path,self.sourcename)
-            if os.path.isdir(msfile):
-                taql_freq = "SELECT CHAN_FREQ FROM {0}::SPECTRAL_WINDOW".format(msfile)
-                t = pt.taql(taql_freq)
-                freqs = t.getcol('CHAN_FREQ')[0,:]
-                try:
-                    taql_command = "SELECT abs(gmeans(MODEL_DATA)) AS amp, arg(gmeans(MODEL_DATA)) AS phase FROM {0}".format(msfile)
-                    t = pt.taql(taql_command)
-                    amp = t.getcol('amp')[0,:,:]
-                    phase = t.getcol('phase')[0,:,:]
-                except:
-                    amp = np.full((len(freqs),4),np.nan)
-                    phase = np.full((len(freqs),4),np.nan)
-                
-                self.amp[i] = amp
-                self.phase[i] = phase
-                self.freq[i] = freqs
+        self.freq = BeamArray(self.beamlist)
+        self.ants = np.empty(len(self.dirlist),dtype=np.object)
+
+    def get_data(self, vis_stats=None, n_workers=1, timeout=None):
+        """
+        Fill the arrays from the averaged visibilities
+
+        Args:
+            vis_stats (VisibilityStats): Visibilities already read for this scan,
+                if None the fluxcal MS of every beam is read for this plot only
+            n_workers (int): Number of processes reading the MS of the beams,
+                only used without vis_stats
+            timeout (float): Time in seconds to wait for all beams in parallel mode
+        """
+        if vis_stats is None:
+            vis_stats = VisibilityStats(self.scan, self.sourcename, self.trigger_mode,
+                                        basedir=self.basedir, products=self.products)
+            vis_stats.get_data(n_workers=n_workers, timeout=timeout)
+
+        for i, beam in enumerate(self.beamlist):
+            stats = vis_stats.get_beam(beam)
+            if stats is not None:
+                self.fill_beam(i, stats)
+
+    def fill_beam(self, i, stats):
+        raise NotImplementedError
+
+    def get_ant_names(self):
+        """Antenna names of the first beam with data"""
+        for antennas in self.ants:
+            if not antennas is None:
+                return antennas
+        return misc.create_antnames()
+
+    @staticmethod
+    def get_amp_phase(stats, product):
+        """
+        Amplitude and phase (radians) of an averaged product
+
+        Args:
+            stats (dict): Output of visibility_stats.read_visibility_stats
+            product (tuple): (column, baselines), e.g. ('DATA', 'cross')
+
+        Returns:
+            tuple: amplitude and phase, filled with NaNs if the product could not be read
+        """
+        if product in stats:
+            return np.abs(stats[product]), np.angle(stats[product])
+        shape = (len(stats['freqs']), stats['n_pol'])
+        if product[1] != 'all':
+            shape = (len(stats['ant_names']),) + shape
+        return np.full(shape, np.nan), np.full(shape, np.nan)
+
+
+class ModelData(VisibilityData):
+    products = [('MODEL_DATA', 'all', False)]
+
+    def fill_beam(self, i, stats):
+        self.amp[i], self.phase[i] = self.get_amp_phase(stats, ('MODEL_DATA', 'all'))
+        self.freq[i] = stats['freqs']
             
     def plot_amp(self,imagepath=None):
         """Plot amplitude, one subplot per beam"""
@@ -778,6 +802,8 @@ class ModelData(ScanData):
         plt.suptitle('Model amplitude')
             
         for n,beam in enumerate(self.beamlist):
+            if not self.amp.has_beam(n):
+                continue
             beamnum = int(beam)
             plt.subplot(ny, nx, beamnum+1)
             plt.plot(self.freq[n],self.amp[n][:,0],
@@ -807,6 +833,8 @@ class ModelData(ScanData):
         plt.suptitle('Model phase',size=30)
             
         for n,beam in enumerate(self.beamlist):
+            if not self.amp.has_beam(n):
+                continue
             beamnum = int(beam)
             plt.subplot(ny, nx, beamnum+1)
             plt.plot(self.freq[n],self.phase[n][:,0],
@@ -822,71 +850,15 @@ class ModelData(ScanData):
         plt.close('all')
 
 
-class AutocorrData(ScanData):
-    def __init__(self, scan, fluxcal, trigger_mode, basedir=None):
-        ScanData.__init__(self, scan, fluxcal, trigger_mode=trigger_mode, basedir=basedir)
-        self.imagepathsuffix = "crosscal"
-        self.freq = np.empty(len(self.dirlist), dtype=np.ndarray)
-        self.ants = np.empty(len(self.dirlist), dtype=np.object)
-
-    def get_data(self):
-        for i, (path, beam) in enumerate(zip(self.dirlist, self.beamlist)):
-            msfile = "{0}/raw/{1}.MS".format(path, self.sourcename)
-            if os.path.isdir(msfile):
-                logger.info("Processing {}".format(msfile))
-                taql_antnames = "SELECT NAME FROM {0}::ANTENNA".format(msfile)
-                t = pt.taql(taql_antnames)
-                ant_names = t.getcol("NAME")
-                if ant_names is None:
-                    logger.warning("Something wrong. No antenna names. Continue with next beam")
-                    continue
+class AutocorrData(VisibilityData):
+    products = [('CORRECTED_DATA', 'auto', True)]
 
-                #then get frequencies:
-                taql_freq = "SELECT CHAN_FREQ FROM {0}::SPECTRAL_WINDOW".format(
-                    msfile)
-                t = pt.taql(taql_freq)
-                freqs = t.getcol('CHAN_FREQ')[0, :]
-
-                #and number of stokes params
-                taql_stokes = "SELECT abs(DATA) AS amp from {0} limit 1" .format(
-                    msfile)
-                t_pol = pt.taql(taql_stokes)
-                pol_array = t_pol.getcol('amp')
-                if pol_array is None:
-                    logger.warning("Something wrong. No polarisation information. Continue with next beam")
-                    continue
-                n_stokes = pol_array.shape[2]  # shape is time, one, nstokes
-
-                #take MS file and get calibrated data
-                amp_ant_array = np.empty(
-                    (len(ant_names), len(freqs), n_stokes), dtype=object)
-                # phase_ant_array = np.empty(
-                #     (len(ant_names), len(freqs), n_stokes), dtype=object)
-
-                for ant in xrange(len(ant_names)):
-                    try:
-                        taql_command = ("SELECT abs(gmeans(CORRECTED_DATA[FLAG])) AS amp "
-                                        "FROM {0} "
-                                        "WHERE ANTENNA1==ANTENNA2 && (ANTENNA1={1} || ANTENNA2={1})").format(msfile, ant)
-                        t = pt.taql(taql_command)
-                        test = t.getcol('amp')
-                        amp_ant_array[ant, :, :] = t.getcol('amp')[0, :, :]
-                        #phase_ant_array[ant, :, :] = t.getcol('phase')[0, :, :]
-                    except Exception as e:
-                        amp_ant_array[ant, :, :] = np.full(
-                            (len(freqs), n_stokes), np.nan)
-                        # phase_ant_array[ant, :, :] = np.full(
-                        #     (len(freqs), n_stokes), np.nan)
-                        logger.exception(e)
-
-                #self.phase[i] = phase_ant_array
-                self.amp[i] = amp_ant_array
-                self.freq[i] = freqs
-                self.ants[i] = ant_names
-            else:
-                logger.warning("Could not find {}".format(msfile))
-
-    def plot_autocorr_per_antenna(self, imagepath=None):
+    def fill_beam(self, i, stats):
+        self.amp[i], _ = self.get_amp_phase(stats, ('CORRECTED_DATA', 'auto'))
+        self.freq[i] = stats['freqs']
+        self.ants[i] = stats['ant_names']
+
+    def plot_autocorr_per_antenna(self, imagepath=None, plot_queue=None):
         """
         Plot the autocorrelation for each antenna for all beams
         """
@@ -901,62 +873,22 @@ class AutocorrData(ScanData):
 
         #plot amplitude, one plot per antenna
         #put plots in default place w/ default name
-        for antennas in self.ants:
-            if not antennas is None:           
-                ant_names = antennas
-                break
-                #ant_names = self.ants[0]
-        #figlist = ['fig_'+str(i) for i in range(len(ant_names))]
+        ant_names = self.get_ant_names()
+        frames = []
         for a, ant in enumerate(ant_names):
-            #iterate through antennas
-            #set up for 8x5 plots (40 beams)
-            nx = 8
-            ny = 5
-            xsize = nx*4
-            ysize = ny*4
-            plt.figure(figsize=(xsize, ysize))
-            plt.suptitle(
-                'Autocorrelation of Antenna {0}'.format(ant), size=30)
-
+            #iterate through antennas, one panel per beam
+            panels = []
             for n, beam in enumerate(self.beamlist):
-                freq = self.freq[n]
-                if self.amp[n] is None:
+                if not self.amp.has_beam(n):
                     continue
-                amp_xx = self.amp[n][a, :, 0]
-                amp_yy = self.amp[n][a, :, 3]
-                beamnum = int(beam)
-                plt.subplot(ny, nx, beamnum+1)
-                plt.scatter(freq[np.where(amp_xx != 0.)[0]], amp_xx[np.where(amp_xx != 0.)[0]],
-                            label='XX',
-                            marker=',', s=1, color='C0')
-                plt.scatter(freq[np.where(amp_yy != 0.)[0]], amp_yy[np.where(amp_yy != 0)[0]],
-                            label='YY',
-                            marker=',', s=1, color='C1')
-                # plt.scatter(self.freq[n][np.where(self.amp[n][a, :, 0] != 0)[0]], self.amp[n][a, :, 0][np.where(self.amp[n][a, :, 0] != 0)[0]],
-                #             label='XX',
-                #             marker=',', s=1)
-                # plt.scatter(self.freq[n][np.where(self.amp[n][a, :, 0] != 0)[0]], self.amp[n][a, :, 3][np.where(self.amp[n][a, :, 0] != 0)[0]],
-                #             label='YY',
-                #             marker=',', s=1)
-                # values above plot maximum
-                high_xx_values = np.where(amp_xx > y_max)[0]
-                high_yy_values = np.where(amp_yy > y_max)[0]
-                if len(high_xx_values) != 0:
-                    plt.scatter(freq[high_xx_values], np.full(len(high_xx_values), y_max - 20),
-                                marker=10, s=1, label="XX>{0}".format(y_max), color='C9')
-                if len(high_yy_values) != 0:
-                    plt.scatter(freq[high_yy_values], np.full(len(high_yy_values), y_max - 30),
-                                marker=10, s=1, label="YY>{0}".format(y_max), color='C3')
-                plt.title('Beam {0}'.format(beam))
-                plt.ylim(y_min, y_max)
-            plt.legend(markerscale=3, fontsize=14)
-            plt.savefig(plt.savefig(
-                '{2}/Autocorrelation_Antenna_{0}_{1}.png'.format(ant, self.scan, imagepath)))
-            #plt.clf()
-            # to really close the plot, this will do
-            plt.close('all')
-
-    def plot_autocorr_per_beam(self, imagepath=None):
+                panels.append((int(beam), 'Beam {0}'.format(beam),
+                               self.get_autocorr_points(n, a, y_max)))
+            frames.append(Frame('{2}/Autocorrelation_Antenna_{0}_{1}.png'.format(ant, self.scan, imagepath),
+                                'Autocorrelation of Antenna {0}'.format(ant), panels))
+        render_frames(frames, plot_queue=plot_queue, series=self.get_autocorr_series(y_max), ylim=(y_min, y_max),
+                      legend_kwargs=LEGEND_KWARGS)
+
+    def plot_autocorr_per_beam(self, imagepath=None, plot_queue=None):
         """
         Plot the autocorrelation for each beam with all antennas
         """
@@ -969,120 +901,57 @@ class AutocorrData(ScanData):
         #first define imagepath if not given by user
         imagepath = self.create_imagepath(imagepath)
 
-        #plot amplitude, one plot per antenna
+        #plot amplitude, one plot per beam
         #put plots in default place w/ default name
-        for antennas in self.ants:
-            if not antennas is None:           
-                ant_names = antennas
-                break
-                #ant_names = self.ants[0]
-                #ant_names = self.ants[0]
-        #figlist = ['fig_'+str(i) for i in range(len(ant_names))]
+        ant_names = self.get_ant_names()
+        frames = []
         for n, beam in enumerate(self.beamlist):
             beamnum = int(beam)
-            #iterate through antennas
-            #set up for 8x5 plots (40 beams)
-            nx = 4
-            ny = 3
-            xsize = nx*4
-            ysize = ny*4
-            plt.figure(figsize=(xsize, ysize))
-            plt.suptitle(
-                'Autocorrelation of Beam {0:02d}'.format(beamnum), size=30)
-
-            for a, ant in enumerate(ant_names):
-                freq = self.freq[n]
-                if self.amp[n] is None:
-                    continue
-                amp_xx = self.amp[n][a, :, 0]
-                amp_yy = self.amp[n][a, :, 3]            
-                plt.subplot(ny, nx, a+1)
-                plt.scatter(freq[np.where(amp_xx != 0.)[0]], amp_xx[np.where(amp_xx != 0.)[0]],
-                            label='XX',
-                            marker=',', s=1, color='C0')
-                plt.scatter(freq[np.where(amp_yy != 0.)[0]], amp_yy[np.where(amp_yy != 0.)[0]],
-                            label='YY',
-                            marker=',', s=1, color='C1')
-                # values above plot maximum
-                high_xx_values = np.where(amp_xx > y_max)[0]
-                high_yy_values = np.where(amp_yy > y_max)[0]
-                if len(high_xx_values) != 0:
-                    plt.scatter(freq[high_xx_values], np.full(len(high_xx_values),y_max - 20),
-                                marker = 10, s = 1, label="XX>{0}".format(y_max), color='C9')
-                if len(high_yy_values) != 0:
-                    plt.scatter(freq[high_yy_values], np.full(len(high_yy_values),y_max - 30),
-                                marker=10, s=1, label="YY>{0}".format(y_max), color='C3')
-                plt.title('Antenna {0}'.format(ant))
-                plt.ylim(y_min, y_max)
-            plt.legend(markerscale=3, fontsize=14)
-            plt.savefig(plt.savefig(
-                '{2}/Autocorrelation_Beam_{0:02d}_{1}.png'.format(beamnum, self.scan, imagepath)))
-            #plt.clf()
-            # to really close the plot, this will do
-            plt.close('all')
+            #iterate through beams, one panel per antenna (4x3 plots)
+            panels = []
+            if self.amp.has_beam(n):
+                for a, ant in enumerate(ant_names):
+                    panels.append((a, 'Antenna {0}'.format(ant),
+                                   self.get_autocorr_points(n, a, y_max)))
+            frames.append(Frame('{2}/Autocorrelation_Beam_{0:02d}_{1}.png'.format(beamnum, self.scan, imagepath),
+                                'Autocorrelation of Beam {0:02d}'.format(beamnum), panels))
+        render_frames(frames, plot_queue=plot_queue, series=self.get_autocorr_series(y_max), nx=4, ny=3, ylim=(y_min, y_max),
+                      legend_kwargs=LEGEND_KWARGS)
+
+    @staticmethod
+    def get_autocorr_series(y_max):
+        """Scatter series of the autocorrelation plots"""
+        return [{'label': 'XX', 'marker': ',', 's': 1, 'color': 'C0'},
+                {'label': 'YY', 'marker': ',', 's': 1, 'color': 'C1'},
+                {'label': 'XX>{0}'.format(y_max), 'marker': 10, 's': 1, 'color': 'C9'},
+                {'label': 'YY>{0}'.format(y_max), 'marker': 10, 's': 1, 'color': 'C3'}]
+
+    def get_autocorr_points(self, n, a, y_max):
+        """
+        Points of the autocorrelation of an antenna in a beam
+
+        Zeros are left out and values above y_max are shown as markers
+        just below y_max, in the order of get_autocorr_series.
+        """
+        freq = self.freq[n]
+        points = []
+        high_points = []
+        for amp in [self.amp[n][a, :, 0], self.amp[n][a, :, 3]]:
+            nonzero = np.where(amp != 0.)[0]
+            points.append((freq[nonzero], amp[nonzero]))
+            high_values = np.where(amp > y_max)[0]
+            high_points.append((freq[high_values], np.full(len(high_values), y_max - 20 - 10 * len(high_points))))
+        return points + high_points
        
-class CorrectedData(ScanData):
-    def __init__(self, scan, fluxcal, trigger_mode, basedir=None):
-        ScanData.__init__(self, scan, fluxcal,
-                          trigger_mode=trigger_mode, basedir=basedir)
-        self.imagepathsuffix = "crosscal"
-        self.freq = np.empty(len(self.dirlist),dtype=np.ndarray)
-        self.ants = np.empty(len(self.dirlist),dtype=np.object)
-        
-    def get_data(self):
-        for i, (path,beam) in enumerate(zip(self.dirlist,self.beamlist)):
-            msfile = "{0}/raw/{1}.MS".format(path,self.sourcename)
-            if os.path.isdir(msfile):
-                logger.info("Processing {}".format(msfile))
-                taql_antnames = "SELECT NAME FROM {0}::ANTENNA".format(msfile)
-                t= pt.taql(taql_antnames)
-                ant_names=t.getcol("NAME")
-                if ant_names is None:
-                    logger.warning(
-                        "Something wrong. No antenna names. Continue with next beam")
-                    continue
+class CorrectedData(VisibilityData):
+    products = [('CORRECTED_DATA', 'cross', True)]
 
-                #then get frequencies:
-                taql_freq = "SELECT CHAN_FREQ FROM {0}::SPECTRAL_WINDOW".format(msfile)
-                t = pt.taql(taql_freq)
-                freqs = t.getcol('CHAN_FREQ')[0,:]
-        
-                #and number of stokes params
-                taql_stokes = "SELECT abs(DATA) AS amp from {0} limit 1" .format(msfile)
-                t_pol = pt.taql(taql_stokes)
-                pol_array = t_pol.getcol('amp')
-                if pol_array is None:
-                    logger.warning(
-                        "Something wrong. No polarisation information. Continue with next beam")
-                    continue
-                n_stokes = pol_array.shape[2] #shape is time, one, nstokes
-        
-                #take MS file and get calibrated data
-                amp_ant_array = np.empty((len(ant_names),len(freqs),n_stokes),dtype=object)
-                phase_ant_array = np.empty((len(ant_names),len(freqs),n_stokes),dtype=object)
-        
-                for ant in xrange(len(ant_names)):
-                    try:
-                        taql_command = ("SELECT abs(gmeans(CORRECTED_DATA[FLAG])) AS amp, "
-                                        "arg(gmeans(CORRECTED_DATA[FLAG])) AS phase FROM {0} "
-                                        "WHERE ANTENNA1!=ANTENNA2 && "
-                                        "(ANTENNA1={1} || ANTENNA2={1})").format(msfile,ant)
-                        t = pt.taql(taql_command)
-                        test=t.getcol('amp')
-                        amp_ant_array[ant,:,:] = t.getcol('amp')[0,:,:]
-                        phase_ant_array[ant,:,:] = t.getcol('phase')[0,:,:]
-                    except:
-                        amp_ant_array[ant,:,:] = np.full((len(freqs),n_stokes),np.nan)
-                        phase_ant_array[ant,:,:] = np.full((len(freqs),n_stokes),np.nan)
-                    
-                self.phase[i] = phase_ant_array
-                self.amp[i] = amp_ant_array
-                self.freq[i] = freqs
-                self.ants[i] = ant_names
-            else:
-                logger.warning("Could not find {}".format(msfile))
+    def fill_beam(self, i, stats):
+        self.amp[i], self.phase[i] = self.get_amp_phase(stats, ('CORRECTED_DATA', 'cross'))
+        self.freq[i] = stats['freqs']
+        self.ants[i] = stats['ant_names']
             
-    def plot_amp(self,imagepath=None):
+    def plot_amp(self,imagepath=None, plot_queue=None):
 
         logger.info("Creating plots for corrected amplitude")
 
@@ -1091,225 +960,98 @@ class CorrectedData(ScanData):
 
         #plot amplitude, one plot per antenna
         #put plots in default place w/ default name
-        for antennas in self.ants:
-            if not antennas is None:           
-                ant_names = antennas
-                break
-                #ant_names = self.ants[0]
-        #figlist = ['fig_'+str(i) for i in range(len(ant_names))]
+        ant_names = self.get_ant_names()
+        frames = []
         for a,ant in enumerate(ant_names):
-            #iterate through antennas
-            #set up for 8x5 plots (40 beams)
-            nx = 8
-            ny = 5
-            xsize = nx*4
-            ysize = ny*4
-            plt.figure(figsize=(xsize,ysize))
-            plt.suptitle('Corrected amplitude for Antenna {0} (baselines averaged)'.format(ant),size=30)
-            
+            #iterate through antennas, one panel per beam
+            panels = []
             for n,beam in enumerate(self.beamlist):
-                if self.amp[n] is None:
+                if not self.amp.has_beam(n):
                     continue
-                beamnum = int(beam)
-                plt.subplot(ny, nx, beamnum+1)
-                plt.scatter(self.freq[n],self.amp[n][a,:,0],
-                           label='XX',
-                           marker=',',s=1)
-                plt.scatter(self.freq[n],self.amp[n][a,:,3],
-                           label='YY',
-                           marker=',',s=1)
-                plt.title('Beam {0}'.format(beam))
-                plt.ylim(0,30)
-            plt.legend(markerscale=3,fontsize=14)
-            plt.savefig(plt.savefig('{2}/Corrected_amp_{0}_{1}.png'.format(ant,self.scan,imagepath)))
-            #plt.clf()
-            # to really close the plot, this will do
-            plt.close('all')
+                panels.append((int(beam), 'Beam {0}'.format(beam),
+                               [(self.freq[n], self.amp[n][a,:,0]),
+                                (self.freq[n], self.amp[n][a,:,3])]))
+            frames.append(Frame('{2}/Corrected_amp_{0}_{1}.png'.format(ant,self.scan,imagepath),
+                                'Corrected amplitude for Antenna {0} (baselines averaged)'.format(ant), panels))
+        render_frames(frames, plot_queue=plot_queue, series=get_pol_series(), ylim=(0,30), legend_kwargs=LEGEND_KWARGS)
             
-    def plot_phase(self,imagepath=None):
+    def plot_phase(self,imagepath=None, plot_queue=None):
 
         logger.info("Creating plots for corrected phase")
 
-        #plot amplitude, one plot per antenna
+        #first define imagepath if not given by user
         imagepath = self.create_imagepath(imagepath)
+
+        #plot phase, one plot per antenna
         #put plots in default place w/ default name
-        for antennas in self.ants:
-            if not antennas is None:           
-                ant_names = antennas
-                break
-                #ant_names = self.ants[0]
-        #figlist = ['fig_'+str(i) for i in range(len(ant_names))]
+        ant_names = self.get_ant_names()
+        frames = []
         for a,ant in enumerate(ant_names):
-            #iterate through antennas
-            #set up for 8x5 plots (40 beams)
-            nx = 8
-            ny = 5
-            xsize = nx*4
-            ysize = ny*4
-            plt.figure(figsize=(xsize,ysize))
-            plt.suptitle('Corrected phase for Antenna {0} (baselines averaged)'.format(ant))
-            
+            #iterate through antennas, one panel per beam
+            panels = []
             for n,beam in enumerate(self.beamlist):
-                if self.amp[n] is None:
-                    continue
-                beamnum = int(beam)
-                plt.subplot(ny, nx, beamnum+1)
-                plt.scatter(self.freq[n],self.phase[n][a,:,0],
-                           label='XX',
-                           marker=',',s=1)
-                plt.scatter(self.freq[n],self.phase[n][a,:,3],
-                           label='YY',
-                           marker=',',s=1)
-                plt.title('Beam {0}'.format(beam))
-                plt.ylim(-3,3)
-            plt.legend(markerscale=3,fontsize=14)
-            plt.savefig(plt.savefig('{2}/Corrected_phase_{0}_{1}.png'.format(ant,self.scan,imagepath)))
-            #plt.clf()
-            # to really close the plot, this will do
-            plt.close('all')
-
-
-class RawData(ScanData):
-    def __init__(self, scan, fluxcal, trigger_mode, basedir=None):
-        ScanData.__init__(self, scan, fluxcal,
-                          trigger_mode=trigger_mode, basedir=basedir)
-        self.imagepathsuffix = "crosscal"
-        self.freq = np.empty(len(self.dirlist),dtype=np.ndarray)
-        self.ants = np.empty(len(self.dirlist),dtype=np.object)
-        
-    def get_data(self):
-        for i, (path,beam) in enumerate(zip(self.dirlist,self.beamlist)):
-            msfile = "{0}/raw/{1}.MS".format(path,self.sourcename)
-            if os.path.isdir(msfile):
-                logger.info("Processing {}".format(msfile))
-                taql_antnames = "SELECT NAME FROM {0}::ANTENNA".format(msfile)
-                t= pt.taql(taql_antnames)
-                ant_names=t.getcol("NAME")
-                if ant_names is None:
-                    logger.warning(
-                        "Something wrong. No antenna names. Continue with next beam")
+                if not self.amp.has_beam(n):
                     continue
+                panels.append((int(beam), 'Beam {0}'.format(beam),
+                               [(self.freq[n], self.phase[n][a,:,0]),
+                                (self.freq[n], self.phase[n][a,:,3])]))
+            frames.append(Frame('{2}/Corrected_phase_{0}_{1}.png'.format(ant,self.scan,imagepath),
+                                'Corrected phase for Antenna {0} (baselines averaged)'.format(ant), panels))
+        render_frames(frames, plot_queue=plot_queue, series=get_pol_series(), ylim=(-3,3), suptitle_size=None, legend_kwargs=LEGEND_KWARGS)
 
-                #then get frequencies:
-                taql_freq = "SELECT CHAN_FREQ FROM {0}::SPECTRAL_WINDOW".format(msfile)
-                t = pt.taql(taql_freq)
-                freqs = t.getcol('CHAN_FREQ')[0,:]
-        
-                #and number of stokes params
-                taql_stokes = "SELECT abs(DATA) AS amp from {0} limit 1" .format(msfile)
-                t_pol = pt.taql(taql_stokes)
-                pol_array = t_pol.getcol('amp')
-                if pol_array is None:
-                    logger.warning(
-                        "Something wrong. No polarisation information. Continue with next beam")
-                    continue
-                n_stokes = pol_array.shape[2] #shape is time, one, nstokes
-        
-                #take MS file and get calibrated data
-                amp_ant_array = np.empty((len(ant_names),len(freqs),n_stokes),dtype=object)
-                phase_ant_array = np.empty((len(ant_names),len(freqs),n_stokes),dtype=object)
-        
-                for ant in xrange(len(ant_names)):
-                    try:
-                        taql_command = ("SELECT abs(gmeans(DATA[FLAG])) AS amp, "
-                                        "arg(gmeans(DATA[FLAG])) AS phase FROM {0} "
-                                        "WHERE ANTENNA1!=ANTENNA2 && "
-                                        "(ANTENNA1={1} || ANTENNA2={1})").format(msfile,ant)
-                        t = pt.taql(taql_command)
-                        test=t.getcol('amp')
-                        amp_ant_array[ant,:,:] = t.getcol('amp')[0,:,:]
-                        phase_ant_array[ant,:,:] = t.getcol('phase')[0,:,:]
-                    except:
-                        amp_ant_array[ant,:,:] = np.full((len(freqs),n_stokes),np.nan) #t.getcol('amp')[0,:,:]
-                        phase_ant_array[ant,:,:] = np.full((len(freqs),n_stokes),np.nan) #t.getcol('phase')[0,:,:]
-                    
-                self.phase[i] = phase_ant_array
-                self.amp[i] = amp_ant_array
-                self.freq[i] = freqs
-                self.ants[i] = ant_names
-            else:
-                logger.warning("Could not find {}".format(msfile))
+
+class RawData(VisibilityData):
+    products = [('DATA', 'cross', True)]
+
+    def fill_beam(self, i, stats):
+        self.amp[i], self.phase[i] = self.get_amp_phase(stats, ('DATA', 'cross'))
+        self.freq[i] = stats['freqs']
+        self.ants[i] = stats['ant_names']
             
-    def plot_amp(self,imagepath=None):
+    def plot_amp(self,imagepath=None, plot_queue=None):
+
         logger.info("Creating plots for raw amplitude")
 
-        #plot amplitude, one plot per antenna
+        #first define imagepath if not given by user
         imagepath = self.create_imagepath(imagepath)
+
+        #plot amplitude, one plot per antenna
         #put plots in default place w/ default name
-        for antennas in self.ants:
-            if not antennas is None:           
-                ant_names = antennas
-                break
-                #ant_names = self.ants[0]
-        #figlist = ['fig_'+str(i) for i in range(len(ant_names))]
+        ant_names = self.get_ant_names()
+        frames = []
         for a,ant in enumerate(ant_names):
-            #iterate through antennas
-            #set up for 8x5 plots (40 beams)
-            nx = 8
-            ny = 5
-            xsize = nx*4
-            ysize = ny*4
-            plt.figure(figsize=(xsize,ysize))
-            plt.suptitle('Raw amplitude for Antenna {0} (baselines averaged)'.format(ant),size=30)
-            
+            #iterate through antennas, one panel per beam
+            panels = []
             for n,beam in enumerate(self.beamlist):
-                if self.amp[n] is None:
+                if not self.amp.has_beam(n):
                     continue
-                beamnum = int(beam)
-                plt.subplot(ny, nx, beamnum+1)
-                plt.scatter(self.freq[n],self.amp[n][a,:,0],
-                           label='XX',
-                           marker=',',s=1)
-                plt.scatter(self.freq[n],self.amp[n][a,:,3],
-                           label='YY',
-                           marker=',',s=1)
-                plt.title('Beam {0}'.format(beam))
-                #plt.ylim(10,30)
-            plt.legend(markerscale=3,fontsize=14)
-            plt.savefig(plt.savefig('{2}/Raw_amp_{0}_{1}.png'.format(ant,self.scan,imagepath)))
-            #plt.clf()
-            # to really close the plot, this will do
-            plt.close('all')
+                panels.append((int(beam), 'Beam {0}'.format(beam),
+                               [(self.freq[n], self.amp[n][a,:,0]),
+                                (self.freq[n], self.amp[n][a,:,3])]))
+            frames.append(Frame('{2}/Raw_amp_{0}_{1}.png'.format(ant,self.scan,imagepath),
+                                'Raw amplitude for Antenna {0} (baselines averaged)'.format(ant), panels))
+        render_frames(frames, plot_queue=plot_queue, series=get_pol_series(), legend_kwargs=LEGEND_KWARGS)
             
-    def plot_phase(self,imagepath=None):
+    def plot_phase(self,imagepath=None, plot_queue=None):
 
         logger.info("Creating plots for raw phase")
 
-        #plot amplitude, one plot per antenna
+        #first define imagepath if not given by user
         imagepath = self.create_imagepath(imagepath)
 
+        #plot phase, one plot per antenna
         #put plots in default place w/ default name
-        for antennas in self.ants:
-            if not antennas is None:           
-                ant_names = antennas
-                break
-                #ant_names = self.ants[0]
-        #figlist = ['fig_'+str(i) for i in range(len(ant_names))]
+        ant_names = self.get_ant_names()
+        frames = []
         for a,ant in enumerate(ant_names):
-            #iterate through antennas
-            #set up for 8x5 plots (40 beams)
-            nx = 8
-            ny = 5
-            xsize = nx*4
-            ysize = ny*4
-            plt.figure(figsize=(xsize,ysize))
-            plt.suptitle('Raw phase for Antenna {0} (baselines averaged)'.format(ant),size=30)
-            
+            #iterate through antennas, one panel per beam
+            panels = []
             for n,beam in enumerate(self.beamlist):
-                if self.amp[n] is None:
+                if not self.amp.has_beam(n):
                     continue
-                beamnum = int(beam)
-                plt.subplot(ny, nx, beamnum+1)
-                plt.scatter(self.freq[n],self.phase[n][a,:,0],
-                           label='XX',
-                           marker=',',s=1)
-                plt.scatter(self.freq[n],self.phase[n][a,:,3],
-                           label='YY',
-                           marker=',',s=1)
-                plt.title('Beam {0}'.format(beam))
-                plt.ylim(-180,180)
-            plt.legend(markerscale=3,fontsize=14)
-            plt.savefig(plt.savefig('{2}/Raw_phase_{0}_{1}.png'.format(ant,self.scan,imagepath)))
-            #plt.clf()
-            # to really close the plot, this will do
-            plt.close('all')
+                panels.append((int(beam), 'Beam {0}'.format(beam),
+                               [(self.freq[n], self.phase[n][a,:,0]),
+                                (self.freq[n], self.phase[n][a,:,3])]))
+            frames.append(Frame('{2}/Raw_phase_{0}_{1}.png'.format(ant,self.scan,imagepath),
+                                'Raw phase for Antenna {0} (baselines averaged)'.format(ant), panels))
+        render_frames(frames, plot_queue=plot_queue, series=get_pol_series(), ylim=(-180,180), legend_kwargs=LEGEND_KWARGS)
@@ -0,0 +1,202 @@
+"""
+Averaged visibilities of the fluxcal MS, read in a single pass
+
+The autocorrelation, raw, model and corrected data plots all need averages
+of the same fluxcal measurement set. Instead of every plot class opening the
+MS and running its own queries, the main table is read once in blocks of rows
+and all averages are accumulated at the same time.
+"""
+
+from __future__ import print_function
+
+import os
+import numpy as np
+import casacore.tables as pt
+import logging
+from scandata import ScanData
+
+logger = logging.getLogger(__name__)
+
+# default number of MS rows read at once
+BLOCKSIZE = 10000
+
+# averages accumulated per MS as (column, baselines, use flags)
+# baselines is "cross" or "auto" for an average per antenna,
+# or "all" for a single average over all rows
+PRODUCTS = [('DATA', 'cross', True),
+            ('CORRECTED_DATA', 'cross', True),
+            ('CORRECTED_DATA', 'auto', True),
+            ('MODEL_DATA', 'all', False)]
+
+
+def read_visibility_stats(msfile, products=PRODUCTS, blocksize=BLOCKSIZE):
+    """
+    Average the visibilities of an MS for several products in one pass
+
+    For the per-antenna products, the visibilities of all baselines containing
+    an antenna are averaged, which gives the same result as running
+    gmeans(column[FLAG]) for every antenna separately.
+
+    Args:
+        msfile (str): Path to the measurement set
+        products (list(tuple)): Averages to compute, see PRODUCTS
+        blocksize (int): Number of rows read at once, this sets the memory use
+            to about blocksize * n_chan * n_pol * 9 bytes (data and flags)
+
+    Returns:
+        dict: Antenna names ("ant_names"), frequencies ("freqs"), number of
+        polarisations ("n_pol") and the complex average for every product
+        that could be read, keyed by (column, baselines). Per-antenna averages
+        have shape (n_ant, n_chan, n_pol), the others (n_chan, n_pol).
+        The flagged fraction per antenna of the cross- and auto-correlations
+        is stored as ('FLAG', 'cross') and ('FLAG', 'auto').
+    """
+
+    t = pt.taql("SELECT NAME FROM {0}::ANTENNA".format(msfile))
+    ant_names = t.getcol("NAME")
+    if ant_names is None:
+        raise RuntimeError("No antenna names in {}".format(msfile))
+    n_ant = len(ant_names)
+
+    t = pt.taql("SELECT CHAN_FREQ FROM {0}::SPECTRAL_WINDOW".format(msfile))
+    freqs = t.getcol('CHAN_FREQ')[0, :]
+
+    t = pt.table(msfile, ack=False)
+    try:
+        # skip products of columns that are not in the MS
+        available = t.colnames()
+        for product in products:
+            if product[0] not in available:
+                logger.warning("No {0} in {1}".format(product[0], msfile))
+        products = [product for product in products if product[0] in available]
+        columns = sorted(set(product[0] for product in products))
+
+        nrows = t.nrows()
+        if nrows == 0:
+            raise RuntimeError("No rows in {}".format(msfile))
+        shape = t.getcell('FLAG', 0).shape
+        n_pol = shape[1]
+
+        # running sums per product, and number of rows and flags per antenna,
+        # from which the number of averaged visibilities follows
+        vis_sum = {}
+        for product in products:
+            if product[1] == 'all':
+                vis_sum[product] = np.zeros(shape, dtype=np.complex128)
+            else:
+                vis_sum[product] = np.zeros((n_ant,) + shape, dtype=np.complex128)
+        ant_nrows = {'cross': np.zeros(n_ant, dtype=np.int64),
+                     'auto': np.zeros(n_ant, dtype=np.int64)}
+        ant_nflags = {'cross': np.zeros((n_ant,) + shape, dtype=np.int64),
+                      'auto': np.zeros((n_ant,) + shape, dtype=np.int64)}
+        total_nflags = np.zeros(shape, dtype=np.int64)
+
+        for startrow in range(0, nrows, blocksize):
+            nrow = min(blocksize, nrows - startrow)
+            ant1 = t.getcol('ANTENNA1', startrow=startrow, nrow=nrow)
+            ant2 = t.getcol('ANTENNA2', startrow=startrow, nrow=nrow)
+            flags = t.getcol('FLAG', startrow=startrow, nrow=nrow)
+
+            # row selections are the same for all columns
+            rows = {}
+            for selection in ['cross', 'auto']:
+                if selection == 'cross':
+                    baselines = ant1 != ant2
+                else:
+                    baselines = ant1 == ant2
+                for ant in range(n_ant):
+                    ant_rows = baselines & ((ant1 == ant) | (ant2 == ant))
+                    if np.any(ant_rows):
+                        rows[(selection, ant)] = ant_rows
+                        ant_nrows[selection][ant] += np.count_nonzero(ant_rows)
+                        ant_nflags[selection][ant] += flags[ant_rows].sum(axis=0)
+            total_nflags += flags.sum(axis=0)
+
+            # read one column at a time, so the memory use is set by blocksize
+            for column in columns:
+                data = t.getcol(column, startrow=startrow, nrow=nrow)
+                # averages without flags go first, after that
+                # the flagged visibilities are set to zero in place
+                column_products = sorted([product for product in products if product[0] == column],
+                                         key=lambda product: product[2])
+                for product in column_products:
+                    _, selection, use_flags = product
+                    if use_flags:
+                        data[flags] = 0.
+                    if selection == 'all':
+                        vis_sum[product] += data.sum(axis=0)
+                    else:
+                        for ant in range(n_ant):
+                            if (selection, ant) in rows:
+                                vis_sum[product][ant] += data[rows[(selection, ant)]].sum(axis=0)
+                del data
+    finally:
+        t.close()
+
+    stats = {'ant_names': ant_names, 'freqs': freqs, 'n_pol': n_pol}
+    for product in products:
+        column, selection, use_flags = product
+        if selection == 'all':
+            vis_count = nrows - total_nflags if use_flags else nrows
+        else:
+            vis_count = ant_nrows[selection][:, np.newaxis, np.newaxis]
+            if use_flags:
+                vis_count = vis_count - ant_nflags[selection]
+        # fully flagged channels have no average
+        with np.errstate(divide='ignore', invalid='ignore'):
+            stats[(column, selection)] = np.where(
+                vis_count > 0, vis_sum[product] / vis_count, np.nan)
+
+    # fraction of flagged visibilities per antenna, channel and polarisation
+    for selection in ['cross', 'auto']:
+        with np.errstate(divide='ignore', invalid='ignore'):
+            stats[('FLAG', selection)] = ant_nflags[selection] / \
+                ant_nrows[selection][:, np.newaxis, np.newaxis].astype(float)
+    logger.info("{0:.1f}% of the visibilities in {1} are flagged".format(
+        100. * total_nflags.sum() / float(nrows * total_nflags.size), msfile))
+
+    return stats
+
+
+class VisibilityStats(ScanData):
+    def __init__(self, scan, fluxcal, trigger_mode, basedir=None, products=PRODUCTS, blocksize=BLOCKSIZE):
+        """
+        Averaged visibilities of the fluxcal MS for all beams
+
+        Args:
+            scan (int): scan number, e.g. 190303083
+            fluxcal (str): name of fluxcal, e.g. "3C147"
+            trigger_mode (bool): To run automatically after Apercal
+            basedir (str): Data directory, None for default
+            products (list(tuple)): Averages to compute, see PRODUCTS
+            blocksize (int): Number of MS rows read at once
+        """
+        ScanData.__init__(self, scan, fluxcal,
+                          trigger_mode=trigger_mode, basedir=basedir)
+        self.products = products
+        self.blocksize = blocksize
+        self.stats = np.empty(len(self.dirlist), dtype=np.object)
+
+    def get_beam_data(self, path, beam):
+        msfile = "{0}/raw/{1}.MS".format(path, self.sourcename)
+        if os.path.isdir(msfile):
+            logger.info("Processing {}".format(msfile))
+            return {'stats': read_visibility_stats(
+                msfile, products=self.products, blocksize=self.blocksize)}
+        else:
+            logger.warning("Could not find {}".format(msfile))
+            return {}
+
+    def get_beam(self, beam):
+        """
+        Get the averaged visibilities of a beam
+
+        Args:
+            beam (str): Beam, e.g. "00"
+
+        Returns:
+            dict: Output of read_visibility_stats, None if not available
+        """
+        if beam not in self.beamlist:
+            return None
+        return self.stats[self.beamlist.index(beam)]
@@ -0,0 +1,160 @@
+"""
+Access to the images of the QA steps, opened once per process
+
+Several QA functions work on the same fits image of a beam, e.g. the
+gaussianity test, the dynamic range and the plot of a continuum image.
+Each of them used to open the file and read the full image again.
+FitsImage opens a file once as a memory map and keeps the parsed header
+and WCS, and gives views of 2D planes or of the cube, so only the pixels
+that are used are read from disk. get_fits_image keeps the images that
+were opened in this process, so the next function working on the same
+file reuses them as long as the file did not change.
+"""
+
+import os
+import logging
+from collections import OrderedDict
+from astropy.io import fits
+from astropy.wcs import WCS
+
+logger = logging.getLogger(__name__)
+
+# number of images get_fits_image keeps open
+MAX_OPEN_IMAGES = 8
+
+# images that were opened by get_fits_image in this process, by file name
+_images = OrderedDict()
+
+
+def get_file_state(fits_file):
+    """Size and modification time of a file, to detect changes"""
+    file_stat = os.stat(fits_file)
+    return file_stat.st_size, file_stat.st_mtime
+
+
+class FitsImage(object):
+    def __init__(self, fits_file):
+        """
+        Image of a fits file, opened as a memory map
+
+        Args:
+            fits_file (str): Path to the fits file
+        """
+        self.fits_file = fits_file
+        self.state = get_file_state(fits_file)
+        self.hdulist = fits.open(fits_file, memmap=True)
+        self._wcs = None
+        self._celestial = None
+        self._cube_wcs = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        """Close the file, views of the data remain valid"""
+        self.hdulist.close()
+
+    @property
+    def header(self):
+        """Header of the primary HDU"""
+        return self.hdulist[0].header
+
+    @property
+    def data(self):
+        """Data of the primary HDU, as a memory map"""
+        return self.hdulist[0].data
+
+    @property
+    def wcs(self):
+        """WCS of all axes"""
+        if self._wcs is None:
+            self._wcs = WCS(self.header)
+        return self._wcs
+
+    @property
+    def naxis(self):
+        """Number of axes"""
+        return self.wcs.naxis
+
+    @property
+    def celestial(self):
+        """WCS of the two celestial axes"""
+        if self._celestial is None:
+            self._celestial = self.wcs.celestial
+        return self._celestial
+
+    @property
+    def cube_wcs(self):
+        """WCS without the stokes axis"""
+        if self._cube_wcs is None:
+            self._cube_wcs = self.wcs.dropaxis(3) if self.naxis == 4 else self.wcs
+        return self._cube_wcs
+
+    def plane(self, channel=0, stokes=0):
+        """
+        Get a 2D plane of the image without reading the other planes
+
+        Args:
+            channel (int): Index along the third axis
+            stokes (int): Index along the fourth axis
+
+        Returns:
+            array: View (y, x) of the data
+        """
+        if self.naxis == 4:
+            return self.data[stokes, channel]
+        elif self.naxis == 3:
+            return self.data[channel]
+        return self.data
+
+    def cube(self, stokes=0):
+        """
+        Get the cube of the image
+
+        Args:
+            stokes (int): Index along the fourth axis
+
+        Returns:
+            array: View (channel, y, x) of the data
+
+        Raises:
+            ValueError: If the image is not a cube
+        """
+        if self.naxis == 4:
+            return self.data[stokes]
+        elif self.naxis == 3:
+            return self.data
+        raise ValueError("Fits file {0:s} is not a cube".format(self.fits_file))
+
+
+def get_fits_image(fits_file):
+    """
+    Get an image, reusing the one opened by this process if the file did not change
+
+    The images are kept open until MAX_OPEN_IMAGES other images
+    have been opened, they should not be closed by the caller.
+
+    Args:
+        fits_file (str): Path to the fits file
+
+    Returns:
+        FitsImage: The image
+    """
+    key = os.path.abspath(fits_file)
+    image = _images.pop(key, None)
+    if image is not None and image.state != get_file_state(fits_file):
+        logger.debug("{0} changed, opening it again".format(fits_file))
+        image.close()
+        image = None
+    if image is None:
+        image = FitsImage(fits_file)
+    # most recently used last
+    _images[key] = image
+
+    while len(_images) > MAX_OPEN_IMAGES:
+        _, oldest = _images.popitem(last=False)
+        oldest.close()
+    return image
@@ -0,0 +1,414 @@
+"""
+Per-channel statistics of a data cube, read in blocks of channels
+
+The cubes are opened as memory maps and read in slabs of consecutive
+channels, which are contiguous on disk. The statistics of all channels in
+a slab are computed at once with numpy, so the speed is set by reading the
+file and the memory use by the block size, not by the size of the cube.
+
+The statistics are computed by the metrics in METRICS, which all work on
+the same block, so every cube is read once however many metrics are used.
+A new metric is a function that takes a ChannelBlock and returns a dict
+with an array of one value per channel for each of its columns.
+Products that need the pixels in their original order, such as the
+noise maps, are accumulators that get every block after the metrics.
+"""
+
+import warnings
+import logging
+import numpy as np
+from dataqa.fits_image import FitsImage
+
+logger = logging.getLogger(__name__)
+
+# default amount of cube data read at once in MB
+BLOCKSIZE = 256
+
+# default percentiles of every channel
+PERCENTILES = (1, 5, 50, 95, 99)
+
+# scale of the median absolute deviation to the sigma of a Gaussian
+MAD_TO_SIGMA = 1.4826
+
+# number of histogram bins for fitting a Gaussian
+GAUSS_BINS = 100
+
+# histogram range for fitting a Gaussian in units of the MAD sigma
+GAUSS_RANGE = 5.
+
+# number of Gauss-Newton steps and their damping for fitting a Gaussian
+GAUSS_ITERATIONS = 10
+GAUSS_DAMPING = 1e-3
+
+# memory in MB of a process analysing a cube, apart from the cube data
+PROCESS_MEMORY = 200
+
+
+def get_memory_estimate(cube_size, blocksize=BLOCKSIZE, accumulators=()):
+    """
+    Estimate the memory needed to analyse a cube with get_channel_stats
+
+    Args:
+        cube_size (int): Size of the cube file in bytes
+        blocksize (float): Amount of data read at once in MB
+        accumulators (list): Classes of the accumulators given to
+            get_channel_stats, with a static method get_memory_estimate
+
+    Returns:
+        float: Memory in MB
+    """
+    cube_memory = cube_size / 1024.**2
+    block_memory = min(cube_memory, blocksize)
+    # the copies of the block for the metrics, most for the gaussian fit
+    if len(accumulators) == 0:
+        return PROCESS_MEMORY + 6 * block_memory
+
+    # with accumulators the block is also kept unsorted. They add it one after
+    # another after the metrics, when only the sorted and unsorted block are
+    # left, and keep their sums until the end
+    estimates = [accumulator.get_memory_estimate(cube_memory, block_memory)
+                 for accumulator in accumulators]
+    return (PROCESS_MEMORY + sum([sums for sums, _ in estimates]) +
+            max(7 * block_memory, 2 * block_memory + max([buffers for _, buffers in estimates])))
+
+
+def open_cube(cube_file):
+    """
+    Open a cube as a memory map
+
+    Args:
+        cube_file (str): Path to the fits file
+
+    Returns:
+        tuple: The FitsImage, the cube (channel, y, x) and its WCS without
+        the stokes axis. The FitsImage must be closed by the caller.
+
+    Raises:
+        ValueError: If the image is not a cube
+    """
+    fits_image = FitsImage(cube_file)
+
+    # getting rid of stokes axis and check that it is a cube
+    try:
+        cube = fits_image.cube()
+    except ValueError:
+        fits_image.close()
+        raise
+
+    return fits_image, cube, fits_image.cube_wcs
+
+
+def sorted_percentiles(sorted_block, n_valid, q):
+    """
+    Percentiles of every row of a sorted block, like np.nanpercentile
+
+    Args:
+        sorted_block (array): Values per row, sorted with NaNs at the end
+        n_valid (array): Number of values that are not NaN per row
+        q (float): Percentile
+
+    Returns:
+        array: Percentile of every row, NaN for rows without values
+    """
+    rows = np.arange(len(sorted_block))
+    last = np.maximum(n_valid - 1, 0)
+    position = last * (q / 100.)
+    lower = np.floor(position).astype(int)
+    upper = np.minimum(lower + 1, last)
+    fraction = position - lower
+    low_values = sorted_block[rows, lower].astype(np.float64)
+    high_values = sorted_block[rows, upper].astype(np.float64)
+    values = low_values + (high_values - low_values) * fraction
+    values[n_valid == 0] = np.nan
+    return values
+
+
+class ChannelBlock(object):
+    def __init__(self, data, percentiles=PERCENTILES, keep_order=False):
+        """
+        Block of channels that the metrics are computed from
+
+        The data is sorted in place when a metric needs it. All metrics
+        are independent of the order of the pixels within a channel.
+
+        Args:
+            data (array): Pixel values per channel (channel, pixel)
+            percentiles (list(float)): Percentiles for the percentile metric
+            keep_order (bool): Sort a copy of the data instead, so the
+                pixels stay available in their order as unsorted
+        """
+        self.data = data
+        self.unsorted = data if keep_order else None
+        self.percentiles = percentiles
+        self.n_channels, self.n_pixels = data.shape
+        self.n_valid = self.n_pixels - np.isnan(data).sum(axis=1)
+        self.is_sorted = False
+        self._median = None
+        # set by get_mad_noise, which can be used by other metrics
+        self.mad_noise = None
+
+    def sort(self):
+        """Sort the pixels of every channel, with NaNs at the end"""
+        if not self.is_sorted:
+            if self.data is self.unsorted:
+                self.data = np.sort(self.data, axis=1)
+            else:
+                self.data.sort(axis=1)
+            self.is_sorted = True
+
+    def percentile(self, q):
+        """Percentile of every channel, ignoring NaNs"""
+        self.sort()
+        return sorted_percentiles(self.data, self.n_valid, q)
+
+    @property
+    def median(self):
+        if self._median is None:
+            self._median = self.percentile(50)
+        return self._median
+
+
+def get_rms(block):
+    """Standard deviation of all pixels, NaN if a channel has NaNs as in np.std"""
+    return {'noise': np.std(block.data, axis=1, dtype=np.float64)}
+
+
+def get_extremes(block):
+    """Most negative and most positive value"""
+    rows = np.arange(block.n_channels)
+    has_values = block.n_valid != 0
+    extremes = {'min': np.full(block.n_channels, np.nan),
+                'max': np.full(block.n_channels, np.nan)}
+    block.sort()
+    extremes['min'][has_values] = block.data[has_values, 0]
+    extremes['max'][has_values] = block.data[
+        rows, np.maximum(block.n_valid - 1, 0)][has_values]
+    return extremes
+
+
+def get_nan_fraction(block):
+    """Fraction of the pixels that are flagged (blanked as NaN)"""
+    return {'nan_fraction': 1. - block.n_valid / float(block.n_pixels)}
+
+
+def get_percentiles(block):
+    """Percentiles of the pixel values"""
+    return dict([("percentile_{0:g}".format(q), block.percentile(q))
+                 for q in block.percentiles])
+
+
+def histogram_channels(block, low, high, n_bins):
+    """
+    Histograms of all channels of a block in one call
+
+    Args:
+        block (ChannelBlock): Data
+        low (array): Lower edge of the histogram of every channel
+        high (array): Upper edge of the histogram of every channel
+        n_bins (int): Number of bins
+
+    Returns:
+        tuple: Counts and bin centres of every channel, both (channel, bin)
+    """
+    width = (high - low) / float(n_bins)
+    valid = width > 0
+    width[~valid] = 1.
+    low = np.where(valid, low, 0.)
+
+    with warnings.catch_warnings():
+        # NaN pixels are not in any bin
+        warnings.simplefilter("ignore", RuntimeWarning)
+        bin_index = np.floor((block.data - low[:, np.newaxis].astype(block.data.dtype)) /
+                             width[:, np.newaxis].astype(block.data.dtype))
+        in_range = (bin_index >= 0) & (bin_index < n_bins) & valid[:, np.newaxis]
+    # one bincount for all channels, with the bins of channel i at i * n_bins
+    bin_index += (np.arange(block.n_channels) * n_bins)[:, np.newaxis]
+    counts = np.bincount(bin_index[in_range].astype(np.int64),
+                         minlength=block.n_channels * n_bins).reshape(block.n_channels, n_bins)
+
+    centres = low[:, np.newaxis] + width[:, np.newaxis] * (np.arange(n_bins) + 0.5)
+    return counts.astype(np.float64), centres
+
+
+def solve_batch(matrix, vector):
+    """Solve a stack of small linear systems, with NaN for singular ones"""
+    singular = ~(np.all(np.isfinite(matrix), axis=(1, 2)) &
+                 np.all(np.isfinite(vector), axis=1))
+    matrix = np.where(singular[:, np.newaxis, np.newaxis], np.eye(matrix.shape[1]), matrix)
+    vector = np.where(singular[:, np.newaxis], 0., vector)
+    solution = np.einsum('hij,hj->hi', np.linalg.pinv(matrix), vector)
+    solution[singular] = np.nan
+    return solution
+
+
+def fit_gaussians(x, y, n_iterations=GAUSS_ITERATIONS):
+    """
+    Fit a Gaussian A * exp(-(x - mu)^2 / (2 sigma^2)) to many histograms at once
+
+    The start values come from a weighted fit of a parabola to the logarithm
+    of the counts, which is then refined by damped Gauss-Newton steps for
+    all histograms together, in the same way as curve_fit does for one.
+
+    Args:
+        x (array): Bin centres (histogram, bin)
+        y (array): Counts (histogram, bin)
+        n_iterations (int): Number of Gauss-Newton steps
+
+    Returns:
+        tuple: A, mu and sigma of every histogram, NaN if there is no fit
+    """
+    # fit in coordinates centred on the histogram, for numerical stability
+    x0 = x.mean(axis=1)
+    scale = x[:, -1] - x[:, 0]
+    scale[~(scale > 0)] = 1.
+    xc = (x - x0[:, np.newaxis]) / scale[:, np.newaxis]
+
+    # weighted fit of ln(y) = a + b x + c x^2, with weights y^2
+    with np.errstate(divide='ignore', invalid='ignore'):
+        log_y = np.where(y > 0, np.log(np.where(y > 0, y, 1.)), 0.)
+    weight = y ** 2
+    powers = np.stack([np.ones_like(xc), xc, xc ** 2], axis=1)
+    normal = np.einsum('hib,hjb,hb->hij', powers, powers, weight)
+    a, b, c = solve_batch(normal, np.einsum('hib,hb->hi', powers, weight * log_y)).T
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        params = np.stack([np.exp(a - b ** 2 / (4 * c)),
+                           -b / (2 * c),
+                           np.sqrt(-1. / (2 * c))], axis=1)
+    params[~(c < 0)] = np.nan
+
+    def model(params):
+        amplitude, mu, sigma = [p[:, np.newaxis] for p in params.T]
+        exponential = np.exp(-(xc - mu) ** 2 / (2 * sigma ** 2))
+        return amplitude * exponential, exponential, amplitude, mu, sigma
+
+    with np.errstate(all='ignore'):
+        fitted, exponential, amplitude, mu, sigma = model(params)
+        cost = np.sum((y - fitted) ** 2, axis=1)
+        for _ in range(n_iterations):
+            residual = y - fitted
+            jacobian = np.stack([exponential,
+                                 fitted * (xc - mu) / sigma ** 2,
+                                 fitted * (xc - mu) ** 2 / sigma ** 3], axis=1)
+            normal = np.einsum('hib,hjb->hij', jacobian, jacobian)
+            # damping as in Levenberg-Marquardt
+            normal += GAUSS_DAMPING * normal * np.eye(3)
+            step = solve_batch(normal, np.einsum('hib,hb->hi', jacobian, residual))
+            new_params = params + step
+            new_fitted, new_exponential, _, _, _ = model(new_params)
+            new_cost = np.sum((y - new_fitted) ** 2, axis=1)
+            # only keep steps that improve the fit
+            better = new_cost < cost
+            params[better] = new_params[better]
+            cost[better] = new_cost[better]
+            fitted, exponential, amplitude, mu, sigma = model(params)
+
+    amplitude, mu, sigma = params.T
+    return amplitude, x0 + mu * scale, np.abs(sigma) * scale
+
+
+def get_gauss_noise(block):
+    """
+    Width of a Gaussian fitted to the histogram of every channel
+
+    The histogram covers GAUSS_RANGE times the MAD sigma around the median,
+    so the fit is dominated by the noise and not by sources. All channels
+    of the block are histogrammed and fitted together.
+    """
+    mad_noise = get_mad_noise(block, in_place=False)['mad_noise']
+    median = block.median
+    counts, centres = histogram_channels(block, median - GAUSS_RANGE * mad_noise,
+                                         median + GAUSS_RANGE * mad_noise, GAUSS_BINS)
+    _, _, sigma = fit_gaussians(centres, counts)
+    sigma[~(mad_noise > 0)] = np.nan
+    return {'gauss_noise': sigma}
+
+
+def get_mad_noise(block, in_place=True):
+    """
+    Median absolute deviation scaled to the sigma of a Gaussian
+
+    Args:
+        block (ChannelBlock): Data
+        in_place (bool): Overwrite the data of the block with the deviations,
+            to save memory when this is the last metric
+    """
+    if block.mad_noise is None:
+        median = block.median
+        deviation = block.data if in_place else block.data.copy()
+        with warnings.catch_warnings():
+            # channels without values are NaN
+            warnings.simplefilter("ignore", RuntimeWarning)
+            np.subtract(deviation, median[:, np.newaxis].astype(deviation.dtype), out=deviation)
+        np.abs(deviation, out=deviation)
+        deviation.sort(axis=1)
+        if in_place:
+            block.is_sorted = False
+        block.mad_noise = MAD_TO_SIGMA * sorted_percentiles(deviation, block.n_valid, 50)
+    return {'mad_noise': block.mad_noise}
+
+
+# available metrics as (name, function), in the order they are computed
+# get_mad_noise overwrites the data, so it must be last
+METRICS = [('noise', get_rms),
+           ('extremes', get_extremes),
+           ('nan_fraction', get_nan_fraction),
+           ('percentiles', get_percentiles),
+           ('gauss_noise', get_gauss_noise),
+           ('mad_noise', get_mad_noise)]
+
+# metrics computed by default
+DEFAULT_METRICS = ('noise', 'mad_noise', 'gauss_noise', 'extremes', 'nan_fraction', 'percentiles')
+
+
+def get_channel_stats(cube, blocksize=BLOCKSIZE, metrics=DEFAULT_METRICS, percentiles=PERCENTILES,
+                      accumulators=()):
+    """
+    Get the statistics of every channel of a cube in a single read
+
+    Args:
+        cube (array): Cube (channel, y, x), e.g. a memory map from open_cube
+        blocksize (float): Amount of data to read at once in MB. The memory
+            use is about six times this, but at least one channel is read at once.
+        metrics (list(str)): Names of the metrics to compute, see METRICS:
+            the standard deviation of all pixels as in np.std ("noise"),
+            the median absolute deviation scaled to a sigma ("mad_noise"),
+            the width of a Gaussian fitted to the histogram ("gauss_noise"),
+            the lowest and highest value ("extremes"), the fraction of NaN
+            pixels ("nan_fraction") and the percentiles ("percentiles")
+        percentiles (list(float)): Percentiles to compute per channel
+        accumulators (list): Objects with a method add(block, start) that is
+            called with every block after the metrics, e.g. NoiseMaps. The
+            block has the pixels in their original order as unsorted.
+
+    Returns:
+        dict: Array with a value per channel for every column of the metrics
+    """
+    unknown = set(metrics) - set([name for name, _ in METRICS])
+    if len(unknown) != 0:
+        raise ValueError("Unknown metrics {}".format(", ".join(sorted(unknown))))
+    metric_functions = [function for name, function in METRICS if name in metrics]
+
+    n_channels = cube.shape[0]
+    n_pixels = int(np.prod(cube.shape[1:]))
+    # read in native byte order, fits data is big-endian
+    dtype = cube.dtype.newbyteorder('=')
+
+    channel_bytes = max(1, n_pixels * dtype.itemsize)
+    n_block = max(1, int(blocksize * 1024**2 // channel_bytes))
+
+    stats = {}
+    for start in range(0, n_channels, n_block):
+        end = min(start + n_block, n_channels)
+        # copy, so the block can be sorted in place
+        block = ChannelBlock(cube[start:end].astype(dtype).reshape(end - start, n_pixels),
+                             percentiles=percentiles, keep_order=len(accumulators) != 0)
+        for function in metric_functions:
+            for name, values in function(block).items():
+                if name not in stats:
+                    stats[name] = np.full(n_channels, np.nan)
+                stats[name][start:end] = values
+        for accumulator in accumulators:
+            accumulator.add(block, start)
+
+    return stats
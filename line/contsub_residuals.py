@@ -0,0 +1,233 @@
+"""
+Residuals of the continuum subtraction, accumulated while reading a cube
+
+When the continuum subtraction fails, the spectra at the position of
+continuum sources keep a non-zero mean or a slope along frequency.
+ContsubResiduals gets every block of channels that get_channel_stats reads
+of a continuum-subtracted cube and keeps running sums per pixel, from which
+a straight line is fitted to every spectrum in one go. The significance of
+the mean and of the slope, relative to the scatter of the spectrum, give a
+residual score for every pixel. Pixels with a score above
+RESIDUAL_THRESHOLD are flagged.
+"""
+
+import os
+import warnings
+import logging
+import numpy as np
+from astropy.io import fits
+from astropy.table import Table
+
+logger = logging.getLogger(__name__)
+
+# residual score above which a pixel is flagged
+RESIDUAL_THRESHOLD = 5.
+
+# name of the table with the residual scores of all beams in the line QA directory
+RESIDUAL_TABLE_NAME = "contsub_residual_scores.csv"
+
+# header keywords of the residual map with the scores of the beam
+RESIDUAL_KEYWORDS = [('n_pixels', 'NPIXELS', 'Number of pixels with data'),
+                     ('n_flagged', 'NFLAGGED', 'Number of flagged pixels'),
+                     ('flagged_fraction', 'FFLAGGED', 'Fraction of flagged pixels'),
+                     ('max_score', 'MAXSCORE', 'Highest residual score'),
+                     ('median_score', 'MEDSCORE', 'Median residual score')]
+
+
+def get_residual_files(plot_file):
+    """
+    Get the names of the residual products of a cube
+
+    Args:
+        plot_file (str): File name of the noise plot of the cube,
+            e.g. beam_00_cube_noise_contsub.png
+
+    Returns:
+        tuple: Fits file of the residual maps and their plot,
+        e.g. beam_00_cube_contsub_residuals.fits
+    """
+    plot_dir, plot_name = os.path.split(plot_file)
+    if plot_name.endswith(".png"):
+        plot_name = plot_name[:-len(".png")]
+    base_name = os.path.join(plot_dir, plot_name.replace("_noise", "", 1))
+    return ("{0:s}_residuals.fits".format(base_name),
+            "{0:s}_residuals.png".format(base_name))
+
+
+class ContsubResiduals(object):
+    def __init__(self, shape, threshold=RESIDUAL_THRESHOLD):
+        """
+        Running sums for a straight line fit to the spectrum of every pixel
+
+        Args:
+            shape (tuple): Shape of the cube (channel, y, x)
+            threshold (float): Residual score above which a pixel is flagged
+        """
+        self.n_channels, self.ny, self.nx = shape
+        self.threshold = threshold
+        # channels relative to the centre of the band, for the precision of the sums
+        self.centre = (self.n_channels - 1) / 2.
+
+        self.count = np.zeros((self.ny, self.nx))
+        self.sum_t = np.zeros((self.ny, self.nx))
+        self.sum_tt = np.zeros((self.ny, self.nx))
+        self.sum_y = np.zeros((self.ny, self.nx))
+        self.sum_ty = np.zeros((self.ny, self.nx))
+        self.sum_yy = np.zeros((self.ny, self.nx))
+
+    @staticmethod
+    def get_memory_estimate(cube_memory, block_memory):
+        """
+        Estimate the memory of the sums and of the buffers of add
+
+        Args:
+            cube_memory (float): Size of the cube in MB
+            block_memory (float): Size of a block of channels in MB
+
+        Returns:
+            tuple: Memory in MB of the sums, which are kept until the end,
+            and of the buffers of add, which only exist while adding a block
+        """
+        # the mask and the float64 channels, values and a product of the two,
+        # for a cube of 32-bit floats. The sums are maps of a channel.
+        return 0., 7 * block_memory
+
+    def add(self, block, start):
+        """
+        Add a block of channels
+
+        Args:
+            block (ChannelBlock): Data of the channels, with keep_order
+            start (int): First channel of the block
+        """
+        data = block.unsorted.reshape(block.n_channels, self.ny, self.nx)
+        valid = ~np.isnan(data)
+        t = (np.arange(start, start + block.n_channels) - self.centre)[:, np.newaxis, np.newaxis]
+        t = np.where(valid, t, 0.)
+        y = np.where(valid, data, 0.).astype(np.float64)
+
+        self.count += valid.sum(axis=0)
+        self.sum_t += t.sum(axis=0)
+        self.sum_tt += (t * t).sum(axis=0)
+        self.sum_y += y.sum(axis=0)
+        self.sum_ty += (t * y).sum(axis=0)
+        self.sum_yy += (y * y).sum(axis=0)
+
+    def get_residuals(self):
+        """
+        Fit a straight line to the spectrum of every pixel
+
+        Returns:
+            dict: (y, x) maps of the mean, the slope per channel,
+            the significance of both and the residual score, the larger
+            of the two significances. NaN for pixels with fewer than
+            three channels.
+        """
+        n = self.count
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", RuntimeWarning)
+            with np.errstate(invalid='ignore', divide='ignore'):
+                mean_t = self.sum_t / n
+                mean = self.sum_y / n
+                # sums of squares around the means
+                s_tt = self.sum_tt - n * mean_t**2
+                s_ty = self.sum_ty - n * mean_t * mean
+                s_yy = np.maximum(self.sum_yy - n * mean**2, 0.)
+
+                slope = s_ty / s_tt
+                residual_variance = np.maximum(s_yy - slope * s_ty, 0.) / (n - 2)
+
+                mean_significance = mean / np.sqrt(s_yy / (n - 1) / n)
+                slope_significance = slope / np.sqrt(residual_variance / s_tt)
+                score = np.fmax(np.abs(mean_significance), np.abs(slope_significance))
+
+        residuals = {'mean': mean,
+                     'slope': slope,
+                     'mean_significance': mean_significance,
+                     'slope_significance': slope_significance,
+                     'score': score}
+        for name in residuals:
+            residuals[name][n < 3] = np.nan
+        return residuals
+
+    def get_scores(self, residuals=None):
+        """
+        Summarise the residuals of the cube
+
+        Args:
+            residuals (dict): Result of get_residuals, None to compute it
+
+        Returns:
+            dict: Number of pixels with data, number and fraction of flagged
+            pixels and the highest and median residual score
+        """
+        if residuals is None:
+            residuals = self.get_residuals()
+        score = residuals['score']
+        has_score = ~np.isnan(score)
+        n_pixels = int(np.sum(has_score))
+        n_flagged = int(np.sum(score[has_score] > self.threshold))
+        return {'n_pixels': n_pixels,
+                'n_flagged': n_flagged,
+                'flagged_fraction': n_flagged / float(n_pixels) if n_pixels != 0 else np.nan,
+                'max_score': np.max(score[has_score]) if n_pixels != 0 else np.nan,
+                'median_score': np.median(score[has_score]) if n_pixels != 0 else np.nan}
+
+    def write(self, residual_file, wcs, unit=None, residuals=None):
+        """
+        Write the residual maps to a fits file
+
+        The primary image is the residual score, the mean and the slope
+        follow as image extensions. The header has the scores of the cube.
+
+        Args:
+            residual_file (str): Fits file of the residual maps
+            wcs (WCS): Coordinates of the cube, without stokes axis
+            unit (str): Unit of the data
+            residuals (dict): Result of get_residuals, None to compute it
+        """
+        if residuals is None:
+            residuals = self.get_residuals()
+        scores = self.get_scores(residuals)
+
+        header = wcs.celestial.to_header()
+        header['THRESHLD'] = (self.threshold, 'Residual score above which a pixel is flagged')
+        for name, keyword, comment in RESIDUAL_KEYWORDS:
+            # fits headers cannot hold NaN, -1 for cubes without data
+            value = scores[name]
+            header[keyword] = (value if np.isfinite(value) else -1, comment)
+        hdus = [fits.PrimaryHDU(residuals['score'].astype(np.float32), header)]
+
+        for name, extension, extension_unit in [('mean', 'MEAN', unit),
+                                                ('slope', 'SLOPE', "{0}/channel".format(unit))]:
+            header = wcs.celestial.to_header()
+            header['EXTNAME'] = extension
+            if unit is not None:
+                header['BUNIT'] = extension_unit
+            hdus.append(fits.ImageHDU(residuals[name].astype(np.float32), header))
+
+        fits.HDUList(hdus).writeto(residual_file, overwrite=True)
+
+
+def get_residual_table(residual_files):
+    """
+    Collect the scores of the residual maps of several beams
+
+    Only the headers of the residual maps are read.
+
+    Args:
+        residual_files (list(tuple)): (beam, residual map) of every beam
+
+    Returns:
+        Table: Beam and scores of every residual map that exists
+    """
+    rows = []
+    for beam, residual_file in residual_files:
+        if not os.path.exists(residual_file):
+            continue
+        header = fits.getheader(residual_file)
+        rows.append([beam] + [header[keyword] for _, keyword, _ in RESIDUAL_KEYWORDS])
+    names = ['beam'] + [name for name, _, _ in RESIDUAL_KEYWORDS]
+    if len(rows) == 0:
+        return Table(names=names, dtype=[int, int, int, float, float, float])
+    return Table(rows=rows, names=names)
@@ -0,0 +1,137 @@
+"""
+Fingerprints of the inputs of the line QA, to skip cubes that did not change
+
+The statistics of a cube only have to be computed again when the cube or
+the computed statistics changed. For every output, the manifest stores the
+fingerprint of the cube it was made from: path, size, modification time and
+a checksum of the fits header, together with the metrics. A re-run of the
+line QA then only analyses new or modified cubes.
+"""
+
+import os
+import json
+import hashlib
+import logging
+import socket
+
+logger = logging.getLogger(__name__)
+
+# name of the manifest of get_cube_stats in the line QA directory
+MANIFEST_NAME = "cube_stats_manifest.json"
+
+# name of the manifest of get_cube_stats_cont in the line QA directory
+MANIFEST_NAME_CONTSUB = "cube_stats_cont_manifest.json"
+
+# version of the manifest format
+MANIFEST_VERSION = 1
+
+# size of a fits header block
+FITS_BLOCK = 2880
+
+
+def get_header_checksum(fits_file):
+    """
+    Get the checksum of the primary header of a fits file
+
+    Args:
+        fits_file (str): Path to the file
+
+    Returns:
+        str: md5 of the header blocks
+    """
+    checksum = hashlib.md5()
+    with open(fits_file, 'rb') as f:
+        while True:
+            block = f.read(FITS_BLOCK)
+            if len(block) == 0:
+                break
+            checksum.update(block)
+            # the header ends with an END card at the start of an 80 character card
+            if any([block[i:i + 8] == b'END     ' for i in range(0, len(block), 80)]):
+                break
+    return checksum.hexdigest()
+
+
+def get_fingerprint(cube_file, **properties):
+    """
+    Get the fingerprint of a cube
+
+    The size and modification time are taken from the file itself, not from
+    an index of the directory, so a cube that was rewritten in place is seen.
+
+    Args:
+        cube_file (str): Path to the cube
+        **properties: Other properties of the output, e.g. the metrics
+
+    Returns:
+        dict: Fingerprint that can be stored as json
+    """
+    cube_stat = os.stat(cube_file)
+    fingerprint = {'cube_file': cube_file,
+                   'size': cube_stat.st_size,
+                   'mtime': cube_stat.st_mtime,
+                   'header': get_header_checksum(cube_file)}
+    fingerprint.update(properties)
+    # json turns tuples into lists
+    return json.loads(json.dumps(fingerprint))
+
+
+class CubeManifest(object):
+    def __init__(self, manifest_file):
+        """
+        Fingerprints of the inputs of every output, by output file name
+
+        Args:
+            manifest_file (str): File to load the fingerprints from and store them in
+        """
+        self.manifest_file = manifest_file
+        self.entries = {}
+        self.load()
+
+    def load(self):
+        """Load the fingerprints, if the manifest exists"""
+        if not os.path.exists(self.manifest_file):
+            return
+        try:
+            with open(self.manifest_file) as f:
+                manifest = json.load(f)
+            if manifest.get('version') != MANIFEST_VERSION:
+                logger.info("Ignoring manifest {} of other version".format(self.manifest_file))
+                return
+            self.entries = manifest['entries']
+        except Exception as e:
+            logger.warning("Could not read manifest {0}: {1}".format(self.manifest_file, e))
+
+    def save(self):
+        """Store the fingerprints"""
+        # write to a temporary file first, so a manifest is never incomplete
+        tmp_file = "{0}.{1}.{2}.tmp".format(self.manifest_file, socket.gethostname(), os.getpid())
+        try:
+            with open(tmp_file, 'w') as f:
+                json.dump({'version': MANIFEST_VERSION, 'entries': self.entries}, f)
+            os.rename(tmp_file, self.manifest_file)
+        except (IOError, OSError) as e:
+            logger.warning("Could not write manifest {0}: {1}".format(self.manifest_file, e))
+
+    def is_current(self, output_files, fingerprint):
+        """
+        Check whether outputs were made from inputs with the same fingerprint
+
+        Args:
+            output_files (list(str)): Outputs, the first one is the key
+            fingerprint (dict): Fingerprint of the current inputs
+
+        Returns:
+            bool: True if all outputs exist and the fingerprint did not change
+        """
+        if self.entries.get(output_files[0]) != fingerprint:
+            return False
+        return all([os.path.exists(output_file) for output_file in output_files])
+
+    def update(self, output_file, fingerprint):
+        """Set the fingerprint of the inputs of an output"""
+        self.entries[output_file] = fingerprint
+
+    def remove(self, output_file):
+        """Forget an output, e.g. because making it failed"""
+        self.entries.pop(output_file, None)
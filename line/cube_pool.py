@@ -0,0 +1,147 @@
+"""
+Run the analysis of many cubes with several processes
+
+Every (beam, cube) pair is analysed independently, so the cubes can be
+processed in parallel. Each task comes with an estimate of its memory use,
+and a task is only started when it fits into the memory budget next to the
+tasks that are already running. This keeps the node from swapping when
+several large cubes would otherwise be read at the same time. Every task
+runs in its own process, so a task whose process is killed, e.g. by the
+out-of-memory killer, is found and its memory is released.
+"""
+
+import logging
+import multiprocessing
+import traceback
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+logger = logging.getLogger(__name__)
+
+# time in seconds between the checks of the running tasks
+POLL_INTERVAL = 1.
+
+
+def _run_cube_task_worker(function, args, index, result_queue):
+    """
+    Run a single task in a worker process and put its result into result_queue
+
+    Exceptions are returned as a formatted traceback.
+    """
+    try:
+        result_queue.put((index, function(*args), None))
+    except Exception:
+        result_queue.put((index, None, traceback.format_exc()))
+
+
+def get_available_memory():
+    """
+    Get the memory that is available for new processes
+
+    Returns:
+        float: Available memory in MB, None if it is not known
+    """
+    try:
+        with open('/proc/meminfo') as f:
+            for line in f:
+                if line.startswith('MemAvailable:'):
+                    return int(line.split()[1]) / 1024.
+    except (IOError, OSError, ValueError):
+        pass
+    return None
+
+
+def run_cube_tasks(function, tasks, n_workers=1, max_memory=None):
+    """
+    Run a function for every task, in parallel within a memory budget
+
+    Args:
+        function (function): Function to run, must be defined at module level
+        tasks (list(tuple)): Arguments of every call and its estimated
+            memory use in MB, as (args, memory)
+        n_workers (int): Number of processes, 1 runs the tasks one after another
+        max_memory (float): Memory budget in MB for all running tasks,
+            None for the memory that is available now. A task that
+            does not fit on its own is run when no other task is running.
+
+    Returns:
+        list(tuple): (result, error) of every task, with error None for
+        tasks that were successful. A task whose process was killed,
+        e.g. when it ran out of memory, is returned as failed.
+    """
+    n_workers = max(1, min(n_workers, len(tasks),
+                           multiprocessing.cpu_count()))
+
+    results = [(None, None)] * len(tasks)
+    if n_workers == 1:
+        for index, (args, _) in enumerate(tasks):
+            try:
+                results[index] = function(*args), None
+            except Exception as e:
+                logger.exception(e)
+                results[index] = None, str(e)
+        return results
+
+    if max_memory is None:
+        max_memory = get_available_memory()
+    if max_memory is None:
+        logger.warning("Available memory is not known, not limiting the memory use")
+        max_memory = float('inf')
+
+    logger.info("Running {0} tasks with {1} processes and {2:.0f} MB of memory".format(
+        len(tasks), n_workers, max_memory))
+    result_queue = multiprocessing.Queue()
+    # process and memory of the running tasks, by task index
+    running = {}
+    # tasks whose process ended, but whose result was not received yet
+    ended = set()
+    try:
+        next_task = 0
+        n_finished = 0
+        while n_finished < len(tasks):
+            # start tasks in order while they fit into the budget
+            while next_task < len(tasks) and len(running) < n_workers:
+                args, memory = tasks[next_task]
+                if len(running) != 0 and sum(
+                        [task_memory for _, task_memory in running.values()]) + memory > max_memory:
+                    break
+                process = multiprocessing.Process(
+                    target=_run_cube_task_worker,
+                    args=(function, args, next_task, result_queue))
+                process.start()
+                running[next_task] = (process, memory)
+                next_task += 1
+
+            try:
+                finished = [result_queue.get(timeout=POLL_INTERVAL)]
+            except queue.Empty:
+                # the result of a process that ended is in the queue before
+                # it exits, so a process that ended before the last poll
+                # without a result was killed
+                finished = []
+                for index, (process, _) in running.items():
+                    if process.is_alive():
+                        continue
+                    if index in ended:
+                        error = "Process of task {0} ended with exit code {1} without a result".format(
+                            index, process.exitcode)
+                        finished.append((index, None, error))
+                    else:
+                        ended.add(index)
+
+            for index, result, error in finished:
+                process, _ = running.pop(index)
+                process.join()
+                ended.discard(index)
+                n_finished += 1
+                if error is not None:
+                    logger.error(error)
+                results[index] = result, error
+    finally:
+        for process, _ in running.values():
+            process.terminate()
+            process.join()
+    return results
@@ -0,0 +1,186 @@
+"""
+Previews of a data cube, accumulated while reading it in blocks of channels
+
+To inspect a cube by eye, the full cube would have to be copied off the
+node it was made on. CubePreview gets every block of channels that
+get_channel_stats reads and builds small products for visual QA:
+
+- a moment-0 map, summing only the pixels that are more than
+  MOMENT_CLIP times the robust noise of their channel above its median
+- a map of the peak flux along the spectral axis
+- a preview cube, averaged over PREVIEW_SPATIAL_BIN x PREVIEW_SPATIAL_BIN
+  pixels and PREVIEW_SPECTRAL_BIN channels
+
+They are computed in the same pass over the cube as the statistics.
+"""
+
+import os
+import warnings
+import logging
+import numpy as np
+from astropy.io import fits
+from dataqa.line.channel_stats import get_mad_noise
+
+logger = logging.getLogger(__name__)
+
+# clipping threshold of the moment-0 map in units of the MAD sigma of a channel
+MOMENT_CLIP = 3.
+
+# number of pixels along x and y averaged into a pixel of the preview cube
+PREVIEW_SPATIAL_BIN = 4
+
+# number of channels averaged into a channel of the preview cube
+PREVIEW_SPECTRAL_BIN = 8
+
+
+def get_preview_files(plot_file):
+    """
+    Get the names of the preview products of a cube
+
+    Args:
+        plot_file (str): File name of the noise plot of the cube,
+            e.g. beam_00_cube0_noise.png
+
+    Returns:
+        tuple: Fits files of the moment-0 map, the peak flux map and the
+        preview cube and the plot of the maps, e.g. beam_00_cube0_mom0.fits
+    """
+    plot_dir, plot_name = os.path.split(plot_file)
+    if plot_name.endswith(".png"):
+        plot_name = plot_name[:-len(".png")]
+    base_name = os.path.join(plot_dir, plot_name.replace("_noise", "", 1))
+    return ("{0:s}_mom0.fits".format(base_name),
+            "{0:s}_peak.fits".format(base_name),
+            "{0:s}_preview.fits".format(base_name),
+            "{0:s}_preview.png".format(base_name))
+
+
+class CubePreview(object):
+    def __init__(self, shape, channel_width=1., clip=MOMENT_CLIP,
+                 spatial_bin=PREVIEW_SPATIAL_BIN, spectral_bin=PREVIEW_SPECTRAL_BIN):
+        """
+        Moment-0 map, peak flux map and binned cube of a cube
+
+        Args:
+            shape (tuple): Shape of the cube (channel, y, x)
+            channel_width (float): Width of a channel, for the moment-0 map
+            clip (float): Clipping threshold of the moment-0 map
+                in units of the MAD sigma of a channel
+            spatial_bin (int): Number of pixels along x and y per preview pixel
+            spectral_bin (int): Number of channels per preview channel
+        """
+        self.n_channels, self.ny, self.nx = shape
+        self.channel_width = channel_width
+        self.clip = clip
+        self.spatial_bin = spatial_bin
+        self.spectral_bin = spectral_bin
+        # start of the bins along y and x
+        self.bin_y = np.arange(0, self.ny, spatial_bin)
+        self.bin_x = np.arange(0, self.nx, spatial_bin)
+
+        self.moment0 = np.zeros((self.ny, self.nx))
+        self.peak = np.full((self.ny, self.nx), np.nan)
+
+        preview_shape = (int(np.ceil(self.n_channels / float(spectral_bin))),
+                         len(self.bin_y), len(self.bin_x))
+        self.preview_count = np.zeros(preview_shape)
+        self.preview_sum = np.zeros(preview_shape)
+
+    @staticmethod
+    def get_memory_estimate(cube_memory, block_memory):
+        """
+        Estimate the memory of the sums and of the buffers of add
+
+        Args:
+            cube_memory (float): Size of the cube in MB
+            block_memory (float): Size of a block of channels in MB
+
+        Returns:
+            tuple: Memory in MB of the sums, which are kept until the end,
+            and of the buffers of add, which only exist while adding a block
+        """
+        # the float64 count and sum of the preview cube, and the masks, a copy
+        # for the peak and the float64 values, for a cube of 32-bit floats
+        return (2 * 2 * cube_memory / (PREVIEW_SPATIAL_BIN**2 * PREVIEW_SPECTRAL_BIN),
+                4.5 * block_memory)
+
+    def get_bin_sums(self, values, channel_bins):
+        """Sum (channel, y, x) values over the pixels and channels of every bin"""
+        values = np.add.reduceat(values, channel_bins, axis=0)
+        values = np.add.reduceat(values, self.bin_y, axis=1)
+        return np.add.reduceat(values, self.bin_x, axis=2)
+
+    def add(self, block, start):
+        """
+        Add a block of channels
+
+        Args:
+            block (ChannelBlock): Data of the channels, with keep_order
+            start (int): First channel of the block
+        """
+        data = block.unsorted.reshape(block.n_channels, self.ny, self.nx)
+        valid = ~np.isnan(data)
+
+        # moment-0 of the pixels above the noise of their channel
+        median = block.median
+        mad_noise = get_mad_noise(block, in_place=False)['mad_noise']
+        with np.errstate(invalid='ignore'):
+            limit = (median + self.clip * mad_noise)[:, np.newaxis, np.newaxis]
+            emission = valid & (data > limit)
+        self.moment0 += np.where(emission, data, 0.).sum(axis=0, dtype=np.float64) * self.channel_width
+
+        # NaN only where all channels are NaN
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", RuntimeWarning)
+            self.peak = np.fmax(self.peak, np.nanmax(data, axis=0))
+
+        # the bins of the preview cube can continue in the next block
+        preview_channels = np.arange(start, start + block.n_channels) // self.spectral_bin
+        bins, channel_bins = np.unique(preview_channels, return_index=True)
+        self.preview_count[bins] += self.get_bin_sums(valid.astype(np.float64), channel_bins)
+        self.preview_sum[bins] += self.get_bin_sums(
+            np.where(valid, data, 0.).astype(np.float64), channel_bins)
+
+    @property
+    def preview(self):
+        """Binned cube (channel, y, x), NaN for bins without values"""
+        with np.errstate(invalid='ignore', divide='ignore'):
+            preview = self.preview_sum / self.preview_count
+        preview[self.preview_count == 0] = np.nan
+        return preview
+
+    def write(self, moment0_file, peak_file, preview_file, wcs, unit=None):
+        """
+        Write the maps and the preview cube to fits files
+
+        Args:
+            moment0_file (str): Fits file of the moment-0 map
+            peak_file (str): Fits file of the peak flux map
+            preview_file (str): Fits file of the preview cube
+            wcs (WCS): Coordinates of the cube, without stokes axis
+            unit (str): Unit of the data
+        """
+        header = wcs.celestial.to_header()
+        header['CLIP'] = (self.clip, 'Clipping threshold in MAD sigma')
+        if unit is not None:
+            spectral_unit = wcs.wcs.cunit[2].to_string()
+            header['BUNIT'] = "{0:s}.{1:s}".format(unit, spectral_unit) if spectral_unit else unit
+        fits.writeto(moment0_file, self.moment0.astype(np.float32),
+                     header, overwrite=True)
+
+        header = wcs.celestial.to_header()
+        if unit is not None:
+            header['BUNIT'] = unit
+        fits.writeto(peak_file, self.peak.astype(np.float32),
+                     header, overwrite=True)
+
+        # the bins are the pixels of a coarser grid
+        header = wcs.slice((slice(None, None, self.spectral_bin),
+                            slice(None, None, self.spatial_bin),
+                            slice(None, None, self.spatial_bin))).to_header()
+        header['SPATBIN'] = (self.spatial_bin, 'Pixels along x and y per bin')
+        header['SPECBIN'] = (self.spectral_bin, 'Channels per bin')
+        if unit is not None:
+            header['BUNIT'] = unit
+        fits.writeto(preview_file, self.preview.astype(np.float32),
+                     header, overwrite=True)
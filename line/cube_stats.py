@@ -3,8 +3,6 @@ This file contains functionality to analyze the quality of the data cube
 generated by the pipeline for each beam.
 """
 
-from astropy.io import fits
-from astropy.wcs import WCS
 from astropy.table import Table
 import numpy as np
 import os
@@ -12,24 +10,31 @@ import glob
 import socket
 import time
 import logging
+import warnings
 import glob
 from dataqa.scandata import get_default_imagepath
+from dataqa.observation_layout import get_observation_layout
+from dataqa.node_topology import get_topology
+from dataqa.line.channel_stats import open_cube, get_channel_stats, get_memory_estimate, BLOCKSIZE, DEFAULT_METRICS
+from dataqa.line.noise_maps import NoiseMaps, get_noise_map_files
+from dataqa.line.cube_preview import CubePreview, get_preview_files
+from dataqa.line.contsub_residuals import ContsubResiduals, get_residual_files
+from dataqa.line.cube_pool import run_cube_tasks
+from dataqa.line.cube_manifest import CubeManifest, get_fingerprint, MANIFEST_NAME
+from dataqa.line.cube_stats_store import CubeStatsStore, get_obs_store_name, STORE_NAME, N_CUBES
 
 import matplotlib.pyplot as plt
-# from scipy.optimize import curve_fit
 
 logger = logging.getLogger(__name__)
 
 
-# def gauss(x, *p):
-#    """Function to calculate a Gaussian value
-#    """
-#    A, mu, sigma = p
-#    return A*np.exp(-(x-mu)**2/(2.*sigma**2))
-
 def combine_cube_stats(obs_id, qa_dir, single_node=False):
     """
     Function to combine the statistic information from all cubes
+
+    The stores of the nodes are merged into the store of the observation,
+    from which the summary table is made. For nodes without a store,
+    the csv files of the cubes are read instead.
     """
 
     logger.info("Collecting cube statistics")
@@ -41,103 +46,62 @@ def combine_cube_stats(obs_id, qa_dir, single_node=False):
     # output file name
     table_file_name = os.path.join(
         qa_line_dir, "{}_HI_cube_noise_statistics.ecsv".format(obs_id))
+    store_file_name = os.path.join(qa_line_dir, get_obs_store_name(obs_id))
 
-    # list of data directories
-    if "/data" in qa_line_dir:
-        qa_line_dir_list = [qa_line_dir, qa_line_dir.replace(
-            "/data/", "/data2/"), qa_line_dir.replace("/data/", "/data3/"), qa_line_dir.replace("/data/", "/data4/")]
-    else:
-        qa_line_dir_list = [qa_line_dir, qa_line_dir.replace(
-            "/tank/", "/tank2/"), qa_line_dir.replace("/tank/", "/tank3/"), qa_line_dir.replace("/tank/", "/tank4/")]
+    # list of data directories, one per node
+    topology = get_topology()
+    qa_line_dir_list = topology.get_node_paths(qa_line_dir)
 
     # total number of expected beams
-    # catching the host should make it work on other happilis, too
-    if host_name == "happili-01" or single_node:
-        n_beams = 40
+    # catching the host should make it work on the other nodes, too
+    node = topology.get_node(host_name)
+    if topology.is_master(host_name) or single_node or node is None:
+        n_beams = topology.n_beams
     else:
-        happili_number = int(host_name.split("-")[-1])
-        n_beams = 10 * happili_number
-
-    # total number of cubes
-    n_cubes = 8
-
-    # define table columns
-    # this column will hold the beam number
-    beam = np.full(n_cubes * n_beams, -1)
-    # this one will specify the cube
-    cube = np.full(n_cubes * n_beams, -1)
-    # this one will store the median rms
-    median_rms = np.full(n_cubes * n_beams, -1.)
-    # this one will store the mean rms
-    mean_rms = np.full(n_cubes * n_beams, -1.)
-    # this one will store the min rms
-    min_rms = np.full(n_cubes * n_beams, -1.)
-    # this one will store the max rms
-    max_rms = np.full(n_cubes * n_beams, -1.)
-    # percentile below a limit of 2mJy/beam and 3mJy/beam
-    percentile_rms_below_2mJy = np.full(n_cubes * n_beams, -1.)
-    percentile_rms_below_3mJy = np.full(n_cubes * n_beams, -1.)
-    percentile_rms_below_4mJy = np.full(n_cubes * n_beams, -1.)
-
-    # now go through the different cubes
-    for cube_counter in range(n_cubes):
-
-        logger.info(
-            "Processing noise information for cube {}".format(cube_counter))
-
-        # now go through the data directories and get the cube files
-        for dir_counter in range(len(qa_line_dir_list)):
-            line_dir = qa_line_dir_list[dir_counter]
-
-            cube_list = glob.glob(os.path.join(
-                line_dir, "[0-3][0-9]/*cube{0:d}_info.csv".format(cube_counter)))
-
-            # first fill beam and cube column
-            # only 10 beams, because there are 4 happili directories
-            # here beam_counter is only the last digit in the beam number
-            for beam_counter in range(10):
-                table_index = n_beams * cube_counter + 10 * dir_counter + beam_counter
-                beam[table_index] = 10 * dir_counter + beam_counter
-                cube[table_index] = cube_counter
-
-            # in case there are no such cubes, fill only beam and cube column
-            if len(cube_list) == 0:
-                logger.warning("No cube files found in {}".format(line_dir))
-            # if there are cubes, go through them
-            else:
-                cube_list.sort()
-                for file_counter in range(len(cube_list)):
-                    cube_file = cube_list[file_counter]
-                    # read in the file
-                    cube_data = Table.read(cube_file, format="ascii.csv")
-                    # get only the non-nan values
-                    noise = cube_data['noise'][np.isnan(
-                        cube_data['noise']) == False]
-                    # the beam number is part of the file name
-                    beam_nr = int(os.path.basename(cube_file).split("_")[1])
-                    # get the table index based on the beam numbder
-                    table_index = n_beams * cube_counter + beam_nr
-                    beam[table_index] = beam_nr
-                    cube[table_index] = cube_counter
-
-                    median_rms[table_index] = np.nanmedian(noise)
-                    mean_rms[table_index] = np.nanmean(noise)
-                    min_rms[table_index] = np.nanmin(noise)
-                    max_rms[table_index] = np.nanmax(noise)
-
-                    percentile_rms_below_2mJy[table_index] = np.size(
-                        np.where(noise < 0.002)[0]) / float(np.size(noise))
-                    percentile_rms_below_3mJy[table_index] = np.size(
-                        np.where(noise < 0.003)[0]) / float(np.size(noise))
-                    percentile_rms_below_4mJy[table_index] = np.size(
-                        np.where(noise < 0.004)[0]) / float(np.size(noise))
-
-        logger.info(
-            "Processing noise information for cube {} ... Done".format(cube_counter))
+        n_beams = node.beams[-1] + 1
+
+    # beams that each data directory should have
+    if len(qa_line_dir_list) == len(topology.nodes):
+        dir_beam_list = [[b for b in node.beams if b < n_beams]
+                         for node in topology.nodes]
+    else:
+        dir_beam_list = [range(n_beams)]
+
+    obs_store = CubeStatsStore(topology.n_beams, n_cubes=N_CUBES)
+
+    # now go through the data directories and get the statistics
+    for line_dir in qa_line_dir_list:
+
+        node_store_file = os.path.join(line_dir, STORE_NAME)
+        if os.path.exists(node_store_file):
+            logger.info("Reading cube statistics from {}".format(node_store_file))
+            obs_store.update(CubeStatsStore.load(node_store_file))
+            continue
+
+        # without a store, read the csv files of the cubes
+        cube_list = glob.glob(os.path.join(
+            line_dir, "[0-3][0-9]/*cube[0-9]_info.csv"))
+
+        if len(cube_list) == 0:
+            logger.warning("No cube files found in {}".format(line_dir))
+            continue
+
+        cube_list.sort()
+        for cube_file in cube_list:
+            # the beam and cube number are part of the file name
+            file_name_parts = os.path.basename(cube_file).split("_")
+            beam_nr = int(file_name_parts[1])
+            cube_nr = int(file_name_parts[2][len("cube"):])
+            if cube_nr >= N_CUBES:
+                continue
+            obs_store.set_cube(beam_nr, cube_nr, Table.read(
+                cube_file, format="ascii.csv"))
+
+    obs_store.save(store_file_name)
 
     # create the table
-    cube_summary = Table([beam, cube, median_rms, mean_rms, min_rms, max_rms, percentile_rms_below_2mJy, percentile_rms_below_3mJy, percentile_rms_below_4mJy], names=(
-        'beam', 'cube', 'median_rms', 'mean_rms', 'min_rms', 'max_rms', 'precentile_rms_below_2mJy', 'precentile_rms_below_3mJy', 'precentile_rms_below_4mJy'))
+    cube_summary = obs_store.get_summary(
+        n_beams=n_beams, beams=[b for beams in dir_beam_list for b in beams])
 
     cube_summary.write(table_file_name, format="ascii.ecsv", overwrite=True)
 
@@ -145,26 +109,34 @@ def combine_cube_stats(obs_id, qa_dir, single_node=False):
         "Collecting cube statistics ... Done. Saving to {}".format(table_file_name))
 
 
-def get_cube_stats(qa_line_dir, data_base_dir_list):
-    """Function to get a simple rms per channel
+def find_cubes(qa_line_dir, data_base_dir_list, cube_name):
+    """Function to find the cubes of all beams
 
     Parameter:
         qa_line_dir : str
             Directory where the line QA output is stored
         data_base_dir_list : list
             List of data directories on happili 1 to 4
+        cube_name : str
+            File name of the cube in line/cubes, may contain wildcards
+
+    Returns:
+        list of (beam, qa_line_beam_dir, cube_file, file size) for every cube
     """
 
+    # index of the files in the data directories, only used to find the cubes
+    layout = get_observation_layout(data_base_dir_list)
+
+    cube_list = []
+
     # go through all four data directories
     # ++++++++++++++++++++++++++++++++++++
     for data_dir in data_base_dir_list:
 
-        start_time_data = time.time()
-
         logger.info("## Going through the beams in {0:s}".format(data_dir))
 
         # getting a list of beams
-        data_dir_beam_list = glob.glob("{0:s}/[0-3][0-9]".format(data_dir))
+        data_dir_beam_list = layout.glob("{0:s}/[0-3][0-9]".format(data_dir))
 
         # checking whether no beam was found
         if len(data_dir_beam_list) != 0:
@@ -172,8 +144,6 @@ def get_cube_stats(qa_line_dir, data_base_dir_list):
             # sort beam list
             data_dir_beam_list.sort()
 
-            start_time_beam = time.time()
-
             # going through all the beams that were found
             # +++++++++++++++++++++++++++++++++++++++++++
             for data_dir_beam in data_dir_beam_list:
@@ -181,8 +151,6 @@ def get_cube_stats(qa_line_dir, data_base_dir_list):
                 # getting the beam
                 beam = os.path.basename(data_dir_beam)
 
-                logger.info("Analyzing beam {0:s}".format(beam))
-
                 # setting the output directory for the beam
                 qa_line_beam_dir = "{0:s}/{1:s}".format(qa_line_dir, beam)
 
@@ -192,151 +160,522 @@ def get_cube_stats(qa_line_dir, data_base_dir_list):
                         "Creating directory {0:s}".format(qa_line_beam_dir))
                     os.mkdir(qa_line_beam_dir)
 
-                # set the name of the of the cube file to analyze
-                cube_file = "{0:s}/line/cubes/HI_image_cube.fits".format(
-                    data_dir_beam)
-
-                # there are several cubes
-                cube_file_list = glob.glob(cube_file.replace("cube", "cube*"))
+                # there can be several cubes
+                cube_file_list = layout.glob("{0:s}/line/cubes/{1:s}".format(
+                    data_dir_beam, cube_name))
 
                 # continue only if glob has found cubes
                 if len(cube_file_list) != 0:
-
                     cube_file_list.sort()
-
                     for cube_file in cube_file_list:
-
-                        # open fits file or at least try
+                        # the index may be older than a cube rewritten in place
                         try:
-                            fits_hdulist = fits.open(cube_file)
-                        except Exception as e:
-                            logger.exception(e)
-                            continue
-
-                        logger.info(
-                            "Getting statistics for cube {}".format(cube_file))
-
-                        # get wcs object
-                        wcs = WCS(fits_hdulist[0].header)
-
-                        # getting rid of stokes axis and check that it is a cube
-                        if wcs.naxis == 4:
-                            wcs = wcs.dropaxis(3)
-                            cube = fits_hdulist[0].data[0]
-                        elif wcs.naxis == 3:
-                            cube = fits_hdulist[0].data
-                        else:
-                            logger.warning(
-                                "Fits file {0:s} is not a cube".format(cube_file))
+                            cube_size = os.stat(cube_file).st_size
+                        except OSError as e:
+                            logger.warning("Could not access {0:s}: {1}".format(cube_file, e))
                             continue
-
-                        # get the shape of the cube
-                        cube_shape = np.shape(cube)
-
-                        # get the number of channels
-                        n_channels = cube_shape[0]
-
-                        # creating an astropy table to store information about the cube
-                        cube_info = Table([np.arange(n_channels), np.zeros(
-                            n_channels)], names=('channel', 'noise'))
-
-                        # define range for histogram
-                        # histrange = np.arange(-0.5, 0.5, 0.0001)
-                        # p0 is the initial guess for the fitting coefficients (A, mu and sigma above)
-                        # p0 = [1., 0., 0.001]
-
-                        # This determines the noise in each channel, using standard rms and also by
-                        # fitting the width of a histogram of image values.
-                        # These give same results for now, but gauss fit could be improved by
-                        # e.g. fitting only to part of histogram
-                        # +++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++
-
-                        for ch in range(n_channels):
-                            # get rms
-                            cube_info['noise'][ch] = np.std(cube[ch])
-                            # determine histogram and fit gaussian
-                            # values = cube[ch]
-                            # histch, binedges = np.histogram(
-                            #    values, bins=500, range=(-0.2, 0.2))
-                            # bin_centres = binedges[:-1] + np.diff(binedges) / 2
-                            # coeff, var_matrix = curve_fit(
-                            #    gauss, bin_centres, histch, p0=p0)
-                            # Get the fitted curve
-                            # hist_fit = gauss(bin_centres, *coeff)
-                            # print 'Fitted mean = ', coeff[1]
-                            # print 'Fitted standard deviation = ', coeff[2]
-                            # cube_info['gauss'][ch] = coeff[2]
-
-                        # write noise data
-                        cube_info.write(
-                            "{0:s}/beam_{1:s}_{2:s}_info.csv".format(qa_line_beam_dir, beam, os.path.basename(cube_file).rstrip(".fits").split("_")[-1]), format="csv", overwrite=True)
-
-                        themedian = np.nanmedian(cube_info['noise'])
-                        # print("Median is " + str(round(themedian*1000, 2)) + " mJy")
-
-                        # Create plot
-                        # +++++++++++
-                        ax = plt.subplot(111)
-
-                        # plot data and fit
-                        ax.plot(
-                            cube_info['channel'], cube_info['noise'] * 1.e3, color='blue', linestyle='-')
-                        # ax.plot(cube_info['channel'], cube_info['gauss'] *
-                        #        1.e3, color='orange', linestyle='--')
-
-                        # add axes labels
-                        ax.set_xlabel('Channel number')
-                        ax.set_ylabel('Noise (mJy/beam)')
-                        ax.set_xlim([0, n_channels-1])
-
-                        # add second axes with frequency
-                        ax_x2 = ax.twiny()
-
-                        # get frequency for first and last channel
-                        # freq_ticks = np.array(
-                        #     [wcs.wcs_pix2world([[0, 0, xtick]], 1)[0, 2]] for xtick in ax.get_xticks())
-                        freq_first_ch = wcs.wcs_pix2world([[0, 0, 0]], 1)[0, 2]
-                        freq_last_ch = wcs.wcs_pix2world(
-                            [[0, 0, n_channels-1]], 1)[0, 2]
-                        ax_x2.set_xlim([freq_first_ch/1.e6, freq_last_ch/1.e6])
-
-                        ax_x2.set_xlabel("Frequency [MHz]")
-
-                        # add legend
-                        ax.plot([0.73, 0.78], [0.95, 0.95], transform=ax.transAxes,
-                                color='blue', linestyle='-')
-                        ax.annotate('Data', xy=(0.8, 0.95), xycoords='axes fraction',
-                                    va='center', ha='left', color='blue')
-
-                        # ax.plot([0.73, 0.78], [0.9, 0.9], transform=ax.transAxes,
-                        #        color='orange', linestyle='--')
-                        ax.annotate('Median = %s mJy' % (str(round(themedian*1000, 2))), xy=(0.05, 0.9), xycoords='axes fraction',
-                                    va='center', ha='left', color='orange')
-
-                        ax_x2.tick_params(axis='both', bottom='off', top='on',
-                                          left='on', right='on', which='major', direction='in')
-
-                        ax.tick_params(axis='both', bottom='on', top='off', left='on', right='on',
-                                       which='major', direction='in')
-
-                        plt.savefig(
-                            '{0:s}/beam_{1:s}_{2:s}_noise.png'.format(qa_line_beam_dir, beam, os.path.basename(cube_file).rstrip(".fits").split("_")[-1]), dpi=300)
-                        plt.close('all')
-
-                        # close fits file
-                        fits_hdulist
-
-                        logger.info("Finished analyzing cube {0:s}".format(
-                            cube_file))
+                        cube_list.append(
+                            (beam, qa_line_beam_dir, cube_file, cube_size))
                 else:
                     logger.warning(
                         "No HI cube found for beam {0:s}".format(beam))
 
-                logger.info("Finished analyzing beam {0:s} ({1:.1f}s)".format(
-                            beam, time.time()-start_time_beam))
-
-            logger.info("Finished going through data directory {0:s} ({1:.1f}s)".format(
-                data_dir, time.time()-start_time_data))
-
         else:
             logger.warning("No beams found in {0:s}".format(data_dir))
+
+    return cube_list
+
+
+def plot_cube_noise(cube_info, wcs, plot_file):
+    """Function to plot the noise per channel of a cube
+
+    Parameter:
+        cube_info : astropy table
+            Statistics per channel
+        wcs : WCS
+            Coordinates of the cube, without stokes axis
+        plot_file : str
+            File name of the plot
+    """
+
+    n_channels = len(cube_info)
+
+    themedian = np.nanmedian(cube_info['noise'])
+
+    ax = plt.subplot(111)
+
+    # plot data and fit
+    ax.plot(
+        cube_info['channel'], cube_info['noise'] * 1.e3, color='blue', linestyle='-')
+    if 'gauss_noise' in cube_info.colnames:
+        ax.plot(cube_info['channel'], cube_info['gauss_noise'] *
+                1.e3, color='orange', linestyle='--')
+
+    # add axes labels
+    ax.set_xlabel('Channel number')
+    ax.set_ylabel('Noise (mJy/beam)')
+    ax.set_xlim([0, n_channels-1])
+
+    # add second axes with frequency
+    ax_x2 = ax.twiny()
+
+    # get frequency for first and last channel
+    # freq_ticks = np.array(
+    #     [wcs.wcs_pix2world([[0, 0, xtick]], 1)[0, 2]] for xtick in ax.get_xticks())
+    freq_first_ch = wcs.wcs_pix2world([[0, 0, 0]], 1)[0, 2]
+    freq_last_ch = wcs.wcs_pix2world(
+        [[0, 0, n_channels-1]], 1)[0, 2]
+    ax_x2.set_xlim([freq_first_ch/1.e6, freq_last_ch/1.e6])
+
+    ax_x2.set_xlabel("Frequency [MHz]")
+
+    # add legend
+    ax.plot([0.73, 0.78], [0.95, 0.95], transform=ax.transAxes,
+            color='blue', linestyle='-')
+    ax.annotate('Data', xy=(0.8, 0.95), xycoords='axes fraction',
+                va='center', ha='left', color='blue')
+
+    if 'gauss_noise' in cube_info.colnames:
+        ax.plot([0.73, 0.78], [0.9, 0.9], transform=ax.transAxes,
+                color='orange', linestyle='--')
+        ax.annotate('Gauss fit', xy=(0.8, 0.9), xycoords='axes fraction',
+                    va='center', ha='left', color='orange')
+
+    ax.annotate('Median = %s mJy' % (str(round(themedian*1000, 2))), xy=(0.05, 0.9), xycoords='axes fraction',
+                va='center', ha='left', color='orange')
+
+    ax_x2.tick_params(axis='both', bottom='off', top='on',
+                      left='on', right='on', which='major', direction='in')
+
+    ax.tick_params(axis='both', bottom='on', top='off', left='on', right='on',
+                   which='major', direction='in')
+
+    plt.savefig(plot_file, dpi=300)
+    plt.close('all')
+
+
+def plot_noise_maps(noise_maps, plot_file):
+    """Function to plot the rms map and the tile rms of a cube
+
+    Parameter:
+        noise_maps : NoiseMaps
+            Noise maps of the cube
+        plot_file : str
+            File name of the plot
+    """
+
+    rms_map = noise_maps.rms_map * 1.e3
+    tile_rms = noise_maps.tile_rms
+    n_channels = np.shape(tile_rms)[0]
+
+    # tile rms relative to the median of the tiles in the same channel
+    tile_rms = tile_rms.reshape(n_channels, -1)
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)
+        relative_tile_rms = tile_rms / np.nanmedian(tile_rms, axis=1)[:, np.newaxis]
+        vmin, vmax = np.nanpercentile(rms_map, [1, 99])
+
+    fig, (ax_map, ax_tiles) = plt.subplots(1, 2, figsize=(12, 5))
+
+    # rms along the spectral axis of every pixel
+    image = ax_map.imshow(rms_map, origin='lower', cmap='viridis',
+                          vmin=vmin, vmax=vmax, interpolation='nearest')
+    fig.colorbar(image, ax=ax_map, label='Noise (mJy/beam)')
+    ax_map.set_xlabel('x (pixel)')
+    ax_map.set_ylabel('y (pixel)')
+    ax_map.set_title('Rms along the spectral axis')
+
+    # rms of every tile per channel
+    image = ax_tiles.imshow(relative_tile_rms, origin='lower', aspect='auto', cmap='coolwarm',
+                            vmin=0., vmax=2., interpolation='nearest')
+    fig.colorbar(image, ax=ax_tiles, label='Tile rms / median tile rms')
+    ax_tiles.set_xlabel('Tile ({0:d}x{0:d} pixels, row by row)'.format(noise_maps.tile_size))
+    ax_tiles.set_ylabel('Channel number')
+    ax_tiles.set_title('Rms of the tiles per channel')
+
+    plt.tight_layout()
+    plt.savefig(plot_file, dpi=150)
+    plt.close('all')
+
+
+def plot_cube_preview(cube_preview, plot_file):
+    """Function to plot the moment-0 map and the peak flux map of a cube
+
+    Parameter:
+        cube_preview : CubePreview
+            Previews of the cube
+        plot_file : str
+            File name of the plot
+    """
+
+    fig, (ax_moment0, ax_peak) = plt.subplots(1, 2, figsize=(12, 5))
+
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)
+        vmax = np.nanpercentile(cube_preview.moment0, 99.5)
+        peak_vmin, peak_vmax = np.nanpercentile(cube_preview.peak * 1.e3, [0.5, 99.5])
+
+    # clipped moment-0 map
+    image = ax_moment0.imshow(cube_preview.moment0, origin='lower', cmap='gray_r',
+                              vmin=0., vmax=vmax if vmax > 0 else None, interpolation='nearest')
+    fig.colorbar(image, ax=ax_moment0, label='Integrated flux (Jy/beam Hz)')
+    ax_moment0.set_xlabel('x (pixel)')
+    ax_moment0.set_ylabel('y (pixel)')
+    ax_moment0.set_title('Moment 0 (clipped at {0:g} sigma)'.format(cube_preview.clip))
+
+    # peak flux along the spectral axis
+    image = ax_peak.imshow(cube_preview.peak * 1.e3, origin='lower', cmap='viridis',
+                           vmin=peak_vmin, vmax=peak_vmax, interpolation='nearest')
+    fig.colorbar(image, ax=ax_peak, label='Peak flux (mJy/beam)')
+    ax_peak.set_xlabel('x (pixel)')
+    ax_peak.set_ylabel('y (pixel)')
+    ax_peak.set_title('Peak flux')
+
+    plt.tight_layout()
+    plt.savefig(plot_file, dpi=150)
+    plt.close('all')
+
+
+def plot_contsub_residuals(residuals, threshold, plot_file):
+    """Function to plot the residuals of the continuum subtraction of a cube
+
+    Parameter:
+        residuals : dict
+            Residual maps, see ContsubResiduals.get_residuals
+        threshold : float
+            Residual score above which a pixel is flagged
+        plot_file : str
+            File name of the plot
+    """
+
+    fig, (ax_score, ax_mean, ax_slope) = plt.subplots(1, 3, figsize=(17, 5))
+
+    # residual score with the flagged pixels
+    image = ax_score.imshow(residuals['score'], origin='lower', cmap='magma',
+                            vmin=0., vmax=2 * threshold, interpolation='nearest')
+    fig.colorbar(image, ax=ax_score, label='Residual score (sigma)')
+    flagged = residuals['score'] > threshold
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)
+        n_flagged = np.sum(flagged)
+    if n_flagged != 0:
+        ax_score.contour(flagged, levels=[0.5], colors='cyan', linewidths=0.8)
+    ax_score.set_title('Residual score, {0:d} pixels above {1:g}'.format(int(n_flagged), threshold))
+
+    # mean and slope of the spectra
+    for ax, values, label, title in [(ax_mean, residuals['mean'] * 1.e3, 'Mean (mJy/beam)', 'Mean of the spectra'),
+                                     (ax_slope, residuals['slope'] * 1.e6, 'Slope (muJy/beam per channel)',
+                                      'Slope of the spectra')]:
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", RuntimeWarning)
+            vmax = np.nanpercentile(np.abs(values), 99.5)
+        image = ax.imshow(values, origin='lower', cmap='RdBu_r', vmin=-vmax, vmax=vmax,
+                          interpolation='nearest')
+        fig.colorbar(image, ax=ax, label=label)
+        ax.set_title(title)
+
+    for ax in (ax_score, ax_mean, ax_slope):
+        ax.set_xlabel('x (pixel)')
+        ax.set_ylabel('y (pixel)')
+
+    plt.tight_layout()
+    plt.savefig(plot_file, dpi=150)
+    plt.close('all')
+
+
+def analyse_cube(cube_file, info_file, plot_file, blocksize=BLOCKSIZE, metrics=DEFAULT_METRICS,
+                 noise_maps=True, previews=True, residuals=False):
+    """Function to get the statistics per channel of a single cube
+
+    The statistics are written to a csv file and the noise is plotted.
+    In the same pass, the noise maps, the previews and the residuals of
+    the continuum subtraction are computed and written next to the plot,
+    see noise_maps.get_noise_map_files, cube_preview.get_preview_files
+    and contsub_residuals.get_residual_files.
+
+    Parameter:
+        cube_file : str
+            Fits file of the cube
+        info_file : str
+            Csv file for the statistics per channel
+        plot_file : str
+            File name of the noise plot
+        blocksize : float
+            Amount of cube data in MB to read at once
+        metrics : list
+            Statistics to compute, see channel_stats.METRICS
+        noise_maps : bool
+            Compute the rms map and the tile rms cube
+        previews : bool
+            Compute the moment-0 map, the peak flux map and the preview cube
+        residuals : bool
+            Look for residuals of the continuum subtraction
+
+    Returns:
+        bool: True if the statistics were written, False if the file is not a cube
+    """
+
+    start_time_cube = time.time()
+
+    # open fits file as memory map
+    try:
+        fits_image, cube, wcs = open_cube(cube_file)
+    except ValueError as e:
+        logger.warning(e)
+        return False
+
+    logger.info(
+        "Getting statistics for cube {}".format(cube_file))
+
+    # get the number of channels
+    n_channels = np.shape(cube)[0]
+
+    unit = fits_image.header.get('BUNIT')
+
+    accumulators = []
+    if noise_maps:
+        cube_noise_maps = NoiseMaps(np.shape(cube))
+        accumulators.append(cube_noise_maps)
+    if previews:
+        cube_preview = CubePreview(np.shape(cube),
+                                   channel_width=np.abs(wcs.pixel_scale_matrix[2, 2]))
+        accumulators.append(cube_preview)
+    if residuals:
+        cube_residuals = ContsubResiduals(np.shape(cube))
+        accumulators.append(cube_residuals)
+
+    # This determines all statistics of each channel in a single pass,
+    # reading a block of channels at a time
+    # ++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++
+    try:
+        channel_stats = get_channel_stats(
+            cube, blocksize=blocksize, metrics=metrics, accumulators=accumulators)
+    finally:
+        # close fits file
+        del cube
+        fits_image.close()
+
+    # creating an astropy table to store information about the cube
+    cube_info = Table([np.arange(n_channels)], names=('channel',))
+    # noise first, as before
+    for name in sorted(channel_stats.keys(), key=lambda name: (name != 'noise', name)):
+        cube_info[name] = channel_stats[name]
+
+    # write noise data
+    cube_info.write(info_file, format="csv", overwrite=True)
+
+    # Create plot
+    # +++++++++++
+    if 'noise' in cube_info.colnames:
+        plot_cube_noise(cube_info, wcs, plot_file)
+
+    # Write and plot noise maps
+    # +++++++++++++++++++++++++
+    if noise_maps:
+        rms_map_file, tile_rms_file, noise_map_plot_file = get_noise_map_files(plot_file)
+        cube_noise_maps.write(rms_map_file, tile_rms_file, wcs, unit=unit)
+        plot_noise_maps(cube_noise_maps, noise_map_plot_file)
+
+    # Write and plot previews
+    # +++++++++++++++++++++++
+    if previews:
+        moment0_file, peak_file, preview_file, preview_plot_file = get_preview_files(plot_file)
+        cube_preview.write(moment0_file, peak_file, preview_file, wcs, unit=unit)
+        plot_cube_preview(cube_preview, preview_plot_file)
+
+    # Write and plot residuals of the continuum subtraction
+    # +++++++++++++++++++++++++++++++++++++++++++++++++++++
+    if residuals:
+        residual_file, residual_plot_file = get_residual_files(plot_file)
+        residual_maps = cube_residuals.get_residuals()
+        cube_residuals.write(residual_file, wcs, unit=unit, residuals=residual_maps)
+        plot_contsub_residuals(residual_maps, cube_residuals.threshold, residual_plot_file)
+
+    logger.info("Finished analyzing cube {0:s} ({1:.1f}s)".format(
+        cube_file, time.time()-start_time_cube))
+
+    return True
+
+
+def analyse_cubes(cube_list, blocksize=BLOCKSIZE, metrics=DEFAULT_METRICS, n_workers=1, max_memory=None,
+                  manifest_file=None, force=False, noise_maps=True, previews=True, residuals=False):
+    """Function to analyse cubes, in parallel with more than one worker
+
+    With a manifest, only cubes that are new or changed since the last run
+    are analysed, see cube_manifest.
+
+    Parameter:
+        cube_list : list
+            (cube_file, info_file, plot_file, file size) of every cube
+        blocksize : float
+            Amount of cube data in MB to read at once
+        metrics : list
+            Statistics to compute, see channel_stats.METRICS
+        n_workers : int
+            Number of cubes to analyse in parallel
+        max_memory : float
+            Memory in MB that the parallel workers may use,
+            None for the available memory
+        manifest_file : str
+            File with the fingerprints of the analysed cubes,
+            None to analyse all cubes
+        force : bool
+            Analyse all cubes, even if they did not change
+        noise_maps : bool
+            Compute the rms map and the tile rms cube of every cube
+        previews : bool
+            Compute the moment-0 map, the peak flux map and the preview cube of every cube
+        residuals : bool
+            Look for residuals of the continuum subtraction in every cube
+
+    Returns:
+        list of the info files that were written
+    """
+
+    start_time = time.time()
+
+    if manifest_file is not None:
+        manifest = CubeManifest(manifest_file)
+    else:
+        manifest = None
+
+    # list of cubes to analyse as (arguments, memory estimate)
+    cube_tasks = []
+    fingerprints = []
+    for cube_file, info_file, plot_file, cube_size in cube_list:
+        if manifest is not None:
+            # the blocksize is not part of the fingerprint, it does not
+            # change the per-channel results
+            try:
+                fingerprint = get_fingerprint(cube_file, metrics=sorted(metrics),
+                                              noise_maps=noise_maps, previews=previews,
+                                              residuals=residuals)
+            except (IOError, OSError) as e:
+                logger.warning("Could not get fingerprint of {0:s}: {1}".format(cube_file, e))
+                fingerprint = None
+            output_files = [info_file, plot_file]
+            if noise_maps:
+                output_files += list(get_noise_map_files(plot_file))
+            if previews:
+                output_files += list(get_preview_files(plot_file))
+            if residuals:
+                output_files += list(get_residual_files(plot_file))
+            if fingerprint is not None and not force and manifest.is_current(
+                    output_files, fingerprint):
+                logger.info("Cube {0:s} did not change. Skipping it".format(cube_file))
+                continue
+            # forget the old output until the new one is done
+            manifest.remove(info_file)
+            fingerprints.append(fingerprint)
+        accumulators = [accumulator for enabled, accumulator in [
+            (noise_maps, NoiseMaps), (previews, CubePreview), (residuals, ContsubResiduals)] if enabled]
+        cube_tasks.append(((cube_file, info_file, plot_file, blocksize, metrics, noise_maps, previews, residuals),
+                           get_memory_estimate(cube_size, blocksize=blocksize, accumulators=accumulators)))
+
+    logger.info("Analyzing {0:d} of {1:d} cubes".format(len(cube_tasks), len(cube_list)))
+
+    results = run_cube_tasks(analyse_cube, cube_tasks,
+                             n_workers=n_workers, max_memory=max_memory)
+
+    n_failed = len([error for _, error in results if error is not None])
+    if n_failed != 0:
+        logger.warning("Analyzing {0:d} of {1:d} cubes failed".format(
+            n_failed, len(cube_tasks)))
+
+    written_info_files = [args[1] for (args, _), (written, error) in zip(cube_tasks, results)
+                          if error is None and written]
+
+    if manifest is not None:
+        for (args, _), (written, error), fingerprint in zip(cube_tasks, results, fingerprints):
+            if error is None and written and fingerprint is not None:
+                manifest.update(args[1], fingerprint)
+        manifest.save()
+
+    logger.info("Finished analyzing cubes ({0:.1f}s)".format(
+        time.time()-start_time))
+
+    return written_info_files
+
+
+def get_cube_stats(qa_line_dir, data_base_dir_list, blocksize=BLOCKSIZE, metrics=DEFAULT_METRICS,
+                   n_workers=1, max_memory=None, force=False, noise_maps=True,
+                   previews=True):
+    """Function to get the rms and other statistics per channel of the HI cubes
+
+    Every cube of every beam is analysed as a separate task,
+    with more than one worker in parallel. Cubes that did not change
+    since the last run are skipped. The statistics of all cubes are
+    also stored in a single file in qa_line_dir, see cube_stats_store.
+
+    Parameter:
+        qa_line_dir : str
+            Directory where the line QA output is stored
+        data_base_dir_list : list
+            List of data directories on happili 1 to 4
+        blocksize : float
+            Amount of cube data in MB to read at once
+        metrics : list
+            Statistics to compute, see channel_stats.METRICS
+        n_workers : int
+            Number of cubes to analyse in parallel
+        max_memory : float
+            Memory in MB that the parallel workers may use,
+            None for the available memory
+        force : bool
+            Analyse all cubes, even if they did not change
+        noise_maps : bool
+            Compute the rms map and the tile rms cube of every cube
+        previews : bool
+            Compute the moment-0 map, the peak flux map and the preview cube of every cube
+    """
+
+    cube_list = []
+    # (beam, cube, info file) of the cubes that go into the store
+    store_list = []
+    for beam, qa_line_beam_dir, cube_file, cube_size in find_cubes(
+            qa_line_dir, data_base_dir_list, "HI_image_cube*.fits"):
+        cube_name = os.path.basename(cube_file).rstrip(".fits").split("_")[-1]
+        info_file = "{0:s}/beam_{1:s}_{2:s}_info.csv".format(
+            qa_line_beam_dir, beam, cube_name)
+        cube_list.append((cube_file,
+                          info_file,
+                          "{0:s}/beam_{1:s}_{2:s}_noise.png".format(
+                              qa_line_beam_dir, beam, cube_name),
+                          cube_size))
+        cube_nr = cube_name[len("cube"):]
+        if cube_nr.isdigit() and int(cube_nr) < N_CUBES:
+            store_list.append((int(beam), int(cube_nr), info_file))
+
+    written_info_files = analyse_cubes(cube_list, blocksize=blocksize, metrics=metrics,
+                                       n_workers=n_workers, max_memory=max_memory,
+                                       manifest_file=os.path.join(qa_line_dir, MANIFEST_NAME), force=force,
+                                       noise_maps=noise_maps, previews=previews)
+
+    # update the store with the cubes that were analysed
+    # +++++++++++++++++++++++++++++++++++++++++++++++++
+    store_file = os.path.join(qa_line_dir, STORE_NAME)
+    store = None
+    if os.path.exists(store_file):
+        try:
+            store = CubeStatsStore.load(store_file)
+        except Exception as e:
+            logger.warning("Could not read {0:s}: {1}".format(store_file, e))
+    if store is None:
+        store = CubeStatsStore(get_topology().n_beams, n_cubes=N_CUBES)
+
+    # forget cubes that were deleted or of beams that are no longer processed
+    current_cubes = set([(beam_nr, cube_nr) for beam_nr, cube_nr, info_file in store_list
+                         if os.path.exists(info_file)])
+    for beam_nr, cube_nr in zip(*np.nonzero(store.n_channels)):
+        if (beam_nr, cube_nr) not in current_cubes:
+            store.remove_cube(beam_nr, cube_nr)
+
+    for beam_nr, cube_nr, info_file in store_list:
+        if (beam_nr, cube_nr) not in current_cubes:
+            continue
+        if info_file in written_info_files or not store.has_cube(beam_nr, cube_nr):
+            store.set_cube(beam_nr, cube_nr, Table.read(
+                info_file, format="ascii.csv"))
+
+    store.save(store_file)
+    logger.info("Saved cube statistics to {0:s}".format(store_file))
@@ -0,0 +1,225 @@
+"""
+Columnar store of the statistics per channel of all cubes of an observation
+
+Every statistic of channel_stats is stored as one array with a
+(beam, cube, channel) layout, padded with NaN for cubes with fewer channels.
+get_cube_stats keeps a store of the cubes of a node in its line QA directory.
+combine_cube_stats merges the stores of all nodes into a single file per
+observation, from which the summary table and the compound beam plots are made.
+This replaces reading the csv file of every beam and cube.
+"""
+
+import os
+import socket
+import logging
+import warnings
+import numpy as np
+from astropy.table import Table
+
+logger = logging.getLogger(__name__)
+
+# name of the store of get_cube_stats in the line QA directory of a node
+STORE_NAME = "HI_cube_channel_stats.npz"
+
+# name of the store of an observation in the line QA directory
+STORE_NAME_OBS = "{0}_HI_cube_channel_stats.npz"
+
+# version of the store format
+STORE_VERSION = 1
+
+# total number of expected cubes per beam
+N_CUBES = 8
+
+# limits in Jy/beam for the fraction of channels with a lower rms
+RMS_LIMITS = (0.002, 0.003, 0.004)
+
+
+def get_obs_store_name(obs_id):
+    """
+    Get the file name of the store of an observation
+
+    Args:
+        obs_id (int or str): ID of the observation
+
+    Returns:
+        str: File name of the store in the line QA directory
+    """
+    return STORE_NAME_OBS.format(obs_id)
+
+
+class CubeStatsStore(object):
+    def __init__(self, n_beams, n_cubes=N_CUBES):
+        """
+        Statistics per channel of every beam and cube
+
+        Args:
+            n_beams (int): Number of beams
+            n_cubes (int): Number of cubes per beam
+        """
+        self.n_beams = n_beams
+        self.n_cubes = n_cubes
+        # number of channels of every cube, 0 for missing cubes
+        self.n_channels = np.zeros((n_beams, n_cubes), dtype=int)
+        # (beam, cube, channel) array of every statistic
+        self.columns = {}
+
+    @classmethod
+    def load(cls, store_file):
+        """
+        Read a store
+
+        Args:
+            store_file (str): File to read
+
+        Returns:
+            CubeStatsStore: The store
+        """
+        with np.load(store_file) as data:
+            if int(data['version']) != STORE_VERSION:
+                raise ValueError("Store {0} has version {1}, expected {2}".format(
+                    store_file, int(data['version']), STORE_VERSION))
+            n_channels = data['n_channels']
+            store = cls(*n_channels.shape)
+            store.n_channels[:] = n_channels
+            for key in data.files:
+                if key.startswith('stat_'):
+                    store.columns[key[len('stat_'):]] = data[key]
+        return store
+
+    def save(self, store_file):
+        """
+        Write the store
+
+        Args:
+            store_file (str): File to write
+        """
+        arrays = dict([('stat_' + name, column)
+                       for name, column in self.columns.items()])
+        # write to a temporary file first, so a store is never incomplete
+        tmp_file = "{0}.{1}.{2}.tmp".format(store_file, socket.gethostname(), os.getpid())
+        with open(tmp_file, 'wb') as f:
+            np.savez_compressed(f, version=STORE_VERSION,
+                                n_channels=self.n_channels, **arrays)
+        os.rename(tmp_file, store_file)
+
+    def has_cube(self, beam, cube):
+        """Check whether the store has the statistics of a cube"""
+        return self.n_channels[beam, cube] != 0
+
+    def set_cube(self, beam, cube, cube_info):
+        """
+        Set the statistics of a cube
+
+        Args:
+            beam (int): Beam number
+            cube (int): Cube number
+            cube_info (Table): Statistics per channel, as written by analyse_cube
+        """
+        n_channels = len(cube_info)
+        max_channels = max([n_channels] + [column.shape[2]
+                                           for column in self.columns.values()])
+        for name in cube_info.colnames:
+            if name == 'channel':
+                continue
+            if name not in self.columns:
+                self.columns[name] = np.full(
+                    (self.n_beams, self.n_cubes, max_channels), np.nan)
+        for name in self.columns:
+            column = self.columns[name]
+            if column.shape[2] < max_channels:
+                padding = np.full((self.n_beams, self.n_cubes,
+                                   max_channels - column.shape[2]), np.nan)
+                column = self.columns[name] = np.concatenate([column, padding], axis=2)
+            column[beam, cube] = np.nan
+            if name in cube_info.colnames:
+                column[beam, cube, :n_channels] = cube_info[name]
+        self.n_channels[beam, cube] = n_channels
+
+    def remove_cube(self, beam, cube):
+        """Forget the statistics of a cube"""
+        for column in self.columns.values():
+            column[beam, cube] = np.nan
+        self.n_channels[beam, cube] = 0
+
+    def update(self, other):
+        """
+        Take the statistics of all cubes of another store
+
+        Args:
+            other (CubeStatsStore): Store with the same number of beams and cubes
+        """
+        for beam, cube in zip(*np.nonzero(other.n_channels)):
+            self.set_cube(beam, cube, other.get_cube(beam, cube))
+
+    def get_cube(self, beam, cube):
+        """
+        Get the statistics of a cube
+
+        Args:
+            beam (int): Beam number
+            cube (int): Cube number
+
+        Returns:
+            Table: Statistics per channel, as written by analyse_cube
+        """
+        n_channels = self.n_channels[beam, cube]
+        cube_info = Table([np.arange(n_channels)], names=('channel',))
+        for name in sorted(self.columns.keys(), key=lambda name: (name != 'noise', name)):
+            cube_info[name] = self.columns[name][beam, cube, :n_channels]
+        return cube_info
+
+    def get_summary(self, n_beams=None, beams=None):
+        """
+        Get the noise summary of every cube
+
+        The table has a row for every cube of every beam, in the order
+        cube * n_beams + beam. Missing cubes have a value of -1.
+
+        Args:
+            n_beams (int): Number of beams in the table, None for all beams
+            beams (list(int)): Beams that are expected, their beam and cube
+                column are also set without statistics. None for all beams
+
+        Returns:
+            Table: Median, mean, minimum and maximum rms and the fraction
+            of channels with an rms below each of RMS_LIMITS
+        """
+        if n_beams is None:
+            n_beams = self.n_beams
+        exists = self.n_channels[:n_beams] != 0
+        if 'noise' in self.columns:
+            noise = self.columns['noise'][:n_beams]
+        else:
+            noise = np.full((n_beams, self.n_cubes, 0), np.nan)
+
+        # one reduction over the channels of all beams and cubes
+        n_valid = np.sum(~np.isnan(noise), axis=2)
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', RuntimeWarning)
+            with np.errstate(invalid='ignore', divide='ignore'):
+                values = [np.nanmedian(noise, axis=2),
+                          np.nanmean(noise, axis=2),
+                          np.nanmin(noise, axis=2),
+                          np.nanmax(noise, axis=2)]
+                values += [np.sum(noise < limit, axis=2) / n_valid.astype(float)
+                           for limit in RMS_LIMITS]
+
+        expected = exists.copy()
+        if beams is None:
+            expected[:] = True
+        else:
+            expected[[beam for beam in beams if beam < n_beams]] = True
+        beam_index, cube_index = np.indices((n_beams, self.n_cubes))
+
+        # columns in the order cube * n_beams + beam
+        def flatten(value):
+            return value.T.ravel()
+
+        columns = [flatten(np.where(expected, beam_index, -1)),
+                   flatten(np.where(expected, cube_index, -1))]
+        columns += [flatten(np.where(exists, value, -1.)) for value in values]
+        names = ['beam', 'cube', 'median_rms', 'mean_rms', 'min_rms', 'max_rms']
+        names += ['precentile_rms_below_{0:.0f}mJy'.format(limit * 1.e3)
+                  for limit in RMS_LIMITS]
+
+        return Table(columns, names=names)
@@ -0,0 +1,177 @@
+"""
+Spatial noise of a data cube, accumulated while reading it in blocks of channels
+
+The rms per channel hides spatial structure in the noise, e.g. at the edge
+of the primary beam, stripes of RFI or residuals of the continuum
+subtraction. NoiseMaps gets every block of channels that get_channel_stats
+reads and keeps running sums per pixel and per tile of a coarse grid.
+This gives the rms along the spectral axis of every pixel (the rms map)
+and the rms of every tile in every channel (the tile rms cube) without
+reading the cube again.
+
+Pixels that deviate more than NOISE_CLIP times the robust noise of their
+channel from the median of the channel are clipped, so line emission
+and bright artefacts do not dominate the maps.
+"""
+
+import warnings
+import logging
+import numpy as np
+from astropy.io import fits
+from dataqa.line.channel_stats import get_mad_noise
+
+logger = logging.getLogger(__name__)
+
+# clipping threshold in units of the MAD sigma of a channel
+NOISE_CLIP = 5.
+
+# size in pixels of the tiles of the tile rms cube
+TILE_SIZE = 32
+
+
+def get_noise_map_files(plot_file):
+    """
+    Get the names of the noise map products of a cube
+
+    Args:
+        plot_file (str): File name of the noise plot of the cube
+
+    Returns:
+        tuple: Fits file of the rms map, fits file of the tile rms cube
+        and the plot of both
+    """
+    base_name = plot_file[:-len(".png")] if plot_file.endswith(".png") else plot_file
+    return ("{0:s}_map.fits".format(base_name),
+            "{0:s}_tiles.fits".format(base_name),
+            "{0:s}_map.png".format(base_name))
+
+
+def get_rms(count, total, total_squared):
+    """Standard deviation from running sums, NaN with fewer than two values"""
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean = total / count
+            variance = np.maximum(total_squared / count - mean**2, 0.)
+    rms = np.sqrt(variance)
+    rms[count < 2] = np.nan
+    return rms
+
+
+class NoiseMaps(object):
+    def __init__(self, shape, tile_size=TILE_SIZE, clip=NOISE_CLIP):
+        """
+        Running sums of the pixel values per pixel and per tile
+
+        Args:
+            shape (tuple): Shape of the cube (channel, y, x)
+            tile_size (int): Size of the tiles in pixels
+            clip (float): Clipping threshold in units of the MAD sigma of
+                a channel, None to use all pixels
+        """
+        self.n_channels, self.ny, self.nx = shape
+        self.tile_size = tile_size
+        self.clip = clip
+        # start of the tiles along y and x
+        self.tile_y = np.arange(0, self.ny, tile_size)
+        self.tile_x = np.arange(0, self.nx, tile_size)
+
+        self.pixel_count = np.zeros((self.ny, self.nx))
+        self.pixel_sum = np.zeros((self.ny, self.nx))
+        self.pixel_sum_squared = np.zeros((self.ny, self.nx))
+
+        tile_shape = (self.n_channels, len(self.tile_y), len(self.tile_x))
+        self.tile_count = np.zeros(tile_shape)
+        self.tile_sum = np.zeros(tile_shape)
+        self.tile_sum_squared = np.zeros(tile_shape)
+
+    @staticmethod
+    def get_memory_estimate(cube_memory, block_memory):
+        """
+        Estimate the memory of the sums and of the buffers of add
+
+        Args:
+            cube_memory (float): Size of the cube in MB
+            block_memory (float): Size of a block of channels in MB
+
+        Returns:
+            tuple: Memory in MB of the sums, which are kept until the end,
+            and of the buffers of add, which only exist while adding a block
+        """
+        # the mask and the float64 values, their squares and the mask for the
+        # tile sums, for a cube of 32-bit floats. The maps of a channel are small.
+        return 0., 7 * block_memory
+
+    def get_tile_sums(self, values):
+        """Sum (channel, y, x) values over the pixels of every tile"""
+        values = np.add.reduceat(values, self.tile_y, axis=1)
+        return np.add.reduceat(values, self.tile_x, axis=2)
+
+    def add(self, block, start):
+        """
+        Add a block of channels
+
+        Args:
+            block (ChannelBlock): Data of the channels, with keep_order
+            start (int): First channel of the block
+        """
+        data = block.unsorted.reshape(block.n_channels, self.ny, self.nx)
+
+        valid = ~np.isnan(data)
+        if self.clip is not None:
+            median = block.median
+            mad_noise = get_mad_noise(block, in_place=False)['mad_noise']
+            with np.errstate(invalid='ignore'):
+                limit = (self.clip * mad_noise)[:, np.newaxis, np.newaxis]
+                valid &= np.abs(data - median[:, np.newaxis, np.newaxis]) <= limit
+
+        values = np.where(valid, data, 0.).astype(np.float64)
+        values_squared = values**2
+
+        self.pixel_count += valid.sum(axis=0)
+        self.pixel_sum += values.sum(axis=0)
+        self.pixel_sum_squared += values_squared.sum(axis=0)
+
+        end = start + block.n_channels
+        self.tile_count[start:end] = self.get_tile_sums(valid.astype(np.float64))
+        self.tile_sum[start:end] = self.get_tile_sums(values)
+        self.tile_sum_squared[start:end] = self.get_tile_sums(values_squared)
+
+    @property
+    def rms_map(self):
+        """Rms along the spectral axis of every pixel (y, x)"""
+        return get_rms(self.pixel_count, self.pixel_sum, self.pixel_sum_squared)
+
+    @property
+    def tile_rms(self):
+        """Rms of every tile in every channel (channel, tile y, tile x)"""
+        return get_rms(self.tile_count, self.tile_sum, self.tile_sum_squared)
+
+    def write(self, rms_map_file, tile_rms_file, wcs, unit=None):
+        """
+        Write the rms map and the tile rms cube to fits files
+
+        Args:
+            rms_map_file (str): Fits file of the rms map
+            tile_rms_file (str): Fits file of the tile rms cube
+            wcs (WCS): Coordinates of the cube, without stokes axis
+            unit (str): Unit of the data
+        """
+        header = wcs.celestial.to_header()
+        header['CLIP'] = (self.clip if self.clip is not None else 0.,
+                          'Clipping threshold in MAD sigma, 0 for none')
+        if unit is not None:
+            header['BUNIT'] = unit
+        fits.writeto(rms_map_file, self.rms_map.astype(np.float32),
+                     header, overwrite=True)
+
+        # the tiles are the pixels of a coarser grid
+        header = wcs.slice((slice(None), slice(None, None, self.tile_size),
+                            slice(None, None, self.tile_size))).to_header()
+        header['TILESIZE'] = (self.tile_size, 'Size of the tiles in pixels')
+        header['CLIP'] = (self.clip if self.clip is not None else 0.,
+                          'Clipping threshold in MAD sigma, 0 for none')
+        if unit is not None:
+            header['BUNIT'] = unit
+        fits.writeto(tile_rms_file, self.tile_rms.astype(np.float32),
+                     header, overwrite=True)
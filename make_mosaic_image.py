@@ -7,7 +7,7 @@ This script creates a mosaic file from apertif continuum images.
 - This script takes the obs_id as an argument, 
 - looks for continuum images from the pipeline (fits format), 
 - copies the images into a temporary directory, 
-- creates a mosaic image in /data/apertif/obs_id/mosaic/
+- creates a mosaic image in <data root>/obs_id/mosaic/ of this node
 - and deletes the temporary directory. 
 
 Parameter
@@ -25,6 +25,7 @@ import apercal.libs.lib as lib
 import subprocess  
 import socket
 import argparse
+from dataqa.node_topology import get_topology
 
 #------------------------------------------
 #data_dir = '190311152'
@@ -35,11 +36,12 @@ import argparse
 #-------------------------------------
 
 host_name = socket.gethostname()
+topology = get_topology()
 
-if host_name != "happili-01":
-	print("WARNING: You are not working on happili-01.")
+if not topology.is_master(host_name):
+	print("WARNING: You are not working on {0:s}.".format(topology.master))
 	print("WARNING: The script will not process all beams")
-	print("Please switch to happili-01")
+	print("Please switch to {0:s}".format(topology.master))
 
 
 # Create and parse argument list
@@ -60,48 +62,48 @@ args = parser.parse_args()
 data_dir = args.obs_id
 print(data_dir)
 
+# directory of the observation on this node
+obs_dir = os.path.join(topology.get_data_root(), str(data_dir))
+
 
 #-------------------------------------------
 # search for continuum files in standard pipeline directories
 # and copy the files into a temporary directory
 # if there is no fits file in the continuum folder, there will be an error message, but the script will continue running 
 
-if not os.path.exists('/data/apertif/'+str(data_dir)+'/mosaic/'):
-	os.mkdir('/data/apertif/'+str(data_dir)+'/mosaic/')
+if not os.path.exists(obs_dir+'/mosaic/'):
+	os.mkdir(obs_dir+'/mosaic/')
 
-if not os.path.exists('/data/apertif/'+str(data_dir)+'/mosaic/cont_tmp/'):
-	os.mkdir('/data/apertif/'+str(data_dir)+'/mosaic/cont_tmp/')
+if not os.path.exists(obs_dir+'/mosaic/cont_tmp/'):
+	os.mkdir(obs_dir+'/mosaic/cont_tmp/')
          
 
-beams_1 = os.listdir('/data/apertif/'+str(data_dir))
-beams_2 = os.listdir('/data2/apertif/'+str(data_dir))
-beams_3 = os.listdir('/data3/apertif/'+str(data_dir))
-beams_4 = os.listdir('/data4/apertif/'+str(data_dir))
-
-#print(beams_1)
+# data directories of the observation on all nodes
+node_dir_list = topology.get_node_paths(obs_dir)
 
-def copy_data(beams, n, data):
-	for i in beams:
-		if os.path.isdir('/'+str(data)+'/apertif/'+str(data_dir)+'/'+str(i)) == True and n in i:
-			os.system('cp -r /'+str(data)+'/apertif/'+str(data_dir)+'/'+str(i)+'/continuum/image_mf_*.fits /data/apertif/'+str(data_dir)+'/mosaic/cont_tmp/image_mf_'+str(i)+'.fits') 
+def copy_data(node_dir, beams):
+	for i in os.listdir(node_dir):
+		if os.path.isdir(node_dir+'/'+str(i)) == True and i.isdigit() and int(i) in beams:
+			os.system('cp -r '+node_dir+'/'+str(i)+'/continuum/image_mf_*.fits '+obs_dir+'/mosaic/cont_tmp/image_mf_'+str(i)+'.fits') 
 
 
-copy_data(beams_1, '0', 'data')
-copy_data(beams_2, '1', 'data2')
-copy_data(beams_3, '2', 'data3')
-copy_data(beams_4, '3', 'data4')
+if len(node_dir_list) == len(topology.nodes):
+	for node, node_dir in zip(topology.nodes, node_dir_list):
+		copy_data(node_dir, node.beams)
+else:
+	copy_data(obs_dir, range(topology.n_beams))
 
 #--------------------------------------
 # convert fits continuum images into miriad files
 # (this may not be needed)
 
-items = os.listdir('/data/apertif/'+str(data_dir)+'/mosaic/cont_tmp/')
+items = os.listdir(obs_dir+'/mosaic/cont_tmp/')
 
 def convert_fits():
 	for i in range(len(items)):
 		fits = lib.miriad('fits')
-		fits.in_ = '/data/apertif/'+str(data_dir)+'/mosaic/cont_tmp/'+str(items[i])
-		fits.out= '/data/apertif/'+str(data_dir)+'/mosaic/cont_tmp/'+str(items[i][:-5])+'.mir'
+		fits.in_ = obs_dir+'/mosaic/cont_tmp/'+str(items[i])
+		fits.out= obs_dir+'/mosaic/cont_tmp/'+str(items[i][:-5])+'.mir'
 		fits.op = 'xyin'
 		fits.go()
 
@@ -111,23 +113,23 @@ convert_fits()
 # create mosaic image with linmos
 
 linmos = lib.miriad('linmos')
-linmos.in_ = '/data/apertif/'+str(data_dir)+'/mosaic/cont_tmp/image_mf_*.mir'
-linmos.out = '/data/apertif/'+str(data_dir)+'/mosaic/'+str(data_dir)+'_mosaic_image'
+linmos.in_ = obs_dir+'/mosaic/cont_tmp/image_mf_*.mir'
+linmos.out = obs_dir+'/mosaic/'+str(data_dir)+'_mosaic_image'
 linmos.go()
 
 #-----------------------------------
 # convert mosaic miriad image into fits file
 
 fits = lib.miriad('fits')
-fits.in_ = '/data/apertif/'+str(data_dir)+'/mosaic/'+str(data_dir)+'_mosaic_image'
+fits.in_ = obs_dir+'/mosaic/'+str(data_dir)+'_mosaic_image'
 fits.op = 'xyout'
-fits.out = '/data/apertif/'+str(data_dir)+'/mosaic/'+str(data_dir)+'_mosaic_image.fits'
+fits.out = obs_dir+'/mosaic/'+str(data_dir)+'_mosaic_image.fits'
 fits.go()
 
 #-------------------------------------
 #clen up temporary files
 
-os.system('rm -rf /data/apertif/'+str(data_dir)+'/mosaic/cont_tmp/') 
+os.system('rm -rf '+obs_dir+'/mosaic/cont_tmp/') 
 
 
 print("DONE") 
\ No newline at end of file
@@ -0,0 +1,245 @@
+"""
+Description of the nodes that hold the data of an observation
+
+The data of the 40 beams is spread over the happili nodes, 10 beams per
+node. happili-01 mounts the data disks of the other nodes as /data2, /data3
+and /data4, so it can see all beams. Instead of hard-coding this, the QA
+gets the nodes, their mount points and beams from a NodeTopology.
+
+The default is the happili setup. Another topology can be given as a json
+file in the environment variable DATAQA_TOPOLOGY, e.g. to use more nodes
+or to run on a local copy of an observation spread over several
+directories:
+
+    {"master": null,
+     "data_dir": "apertif",
+     "nodes": [{"name": "node1", "mounts": ["/scratch/node1"], "beams": [0, 19]},
+               {"name": "node2", "mounts": ["/scratch/node2"], "beams": [20, 39]}]}
+
+The master node sees the mounts of all nodes, null means any host does.
+The first node is the local one: its mounts are where every node keeps
+its own data. "beams" gives the first and last beam of a node.
+"""
+
+import os
+import json
+import socket
+import logging
+
+logger = logging.getLogger(__name__)
+
+# environment variable with the path to a topology file
+TOPOLOGY_ENV = "DATAQA_TOPOLOGY"
+
+DEFAULT_TOPOLOGY = {
+    'master': 'happili-01',
+    'data_dir': 'apertif',
+    'nodes': [{'name': 'happili-01', 'mounts': ['/data', '/tank'], 'beams': [0, 9]},
+              {'name': 'happili-02', 'mounts': ['/data2', '/tank2'], 'beams': [10, 19]},
+              {'name': 'happili-03', 'mounts': ['/data3', '/tank3'], 'beams': [20, 29]},
+              {'name': 'happili-04', 'mounts': ['/data4', '/tank4'], 'beams': [30, 39]}]
+}
+
+# topology of this process, see get_topology
+_topology = None
+
+
+class Node(object):
+    def __init__(self, name, mounts, beams):
+        """
+        A node with data of an observation
+
+        Args:
+            name (str): Host name, e.g. "happili-02"
+            mounts (list(str)): Mount points of the data disks of this node
+                as seen from the master node, e.g. ["/data2", "/tank2"]
+            beams (list(int)): First and last beam of this node
+        """
+        self.name = name
+        self.mounts = mounts
+        self.beams = range(beams[0], beams[1] + 1)
+
+
+class NodeTopology(object):
+    def __init__(self, nodes, master=None, data_dir='apertif'):
+        """
+        Nodes, mount points and beams of the data of an observation
+
+        Args:
+            nodes (list(Node)): Nodes, the first one is the local view
+            master (str): Host name of the node that sees all nodes,
+                None if every host does
+            data_dir (str): Directory with observations on each mount
+        """
+        self.nodes = nodes
+        self.master = master
+        self.data_dir = data_dir
+        self.n_beams = max([node.beams[-1] for node in nodes]) + 1
+
+    @classmethod
+    def from_dict(cls, topology):
+        nodes = [Node(node['name'], node['mounts'], node['beams'])
+                 for node in topology['nodes']]
+        return cls(nodes, master=topology.get('master'),
+                   data_dir=topology.get('data_dir', 'apertif'))
+
+    @classmethod
+    def from_file(cls, topology_file):
+        """
+        Read a topology from a json file
+
+        Args:
+            topology_file (str): Path to the file, see the module description
+        """
+        with open(topology_file) as f:
+            return cls.from_dict(json.load(f))
+
+    def is_master(self, hostname=None):
+        """
+        Check whether a host sees the data of all nodes
+
+        Args:
+            hostname (str): Host name, None for this host
+        """
+        if self.master is None:
+            return True
+        if hostname is None:
+            hostname = socket.gethostname()
+        return hostname == self.master
+
+    def get_node(self, hostname=None):
+        """
+        Get a node by host name
+
+        Args:
+            hostname (str): Host name, None for this host
+
+        Returns:
+            Node: The node, None if the host is not part of the topology
+        """
+        if hostname is None:
+            hostname = socket.gethostname()
+        for node in self.nodes:
+            if node.name == hostname:
+                return node
+        return None
+
+    def get_beam_node(self, beam):
+        """
+        Get the node that processes a beam
+
+        Args:
+            beam (int): Beam number
+
+        Returns:
+            Node: The node, None if no node has the beam
+        """
+        for node in self.nodes:
+            if int(beam) in node.beams:
+                return node
+        return None
+
+    def get_data_root(self, node=None):
+        """
+        Directory with the observations of a node
+
+        Args:
+            node (Node): Node, None for the local data
+
+        Returns:
+            str: e.g. "/data2/apertif"
+        """
+        if node is None:
+            node = self.nodes[0]
+        return os.path.join(node.mounts[0], self.data_dir)
+
+    def get_scan_roots(self, scan, basedir=None, trigger_mode=False):
+        """
+        Get the data directories of a scan that are visible from this host
+
+        On the master the directories of all nodes are used,
+        on other hosts and in trigger mode only the local one.
+
+        Args:
+            scan (int): scan number, e.g. 190303083
+            basedir (str): Data directory, None for default
+            trigger_mode (bool): Only look for data processed by Apercal on this node
+
+        Returns:
+            list(str): Data directories of the scan
+        """
+        hostname = socket.gethostname()
+        # in case it runs on triggered mode, it should only look into
+        # the apertif dir of this node
+        if trigger_mode:
+            logging.info(
+                "--> Running in trigger mode. Looking only for data processed by Apercal on {0:s} <--".format(hostname))
+            return [os.path.join(self.get_data_root(), "{}".format(scan))]
+        elif not self.is_master(hostname):
+            logging.info(
+                'Not on {0}, only search local {1} for data'.format(self.master, hostname))
+            if basedir is not None:
+                return [os.path.join(basedir, "{}".format(scan))]
+            else:
+                return [os.path.join(self.get_data_root(), "{}".format(scan))]
+        elif basedir is not None:
+            return [os.path.join(basedir, "{}".format(scan))]
+        else:
+            # On the master, so search all nodes
+            logging.info(
+                "Running on {0:s}. Search for data from all nodes".format(hostname))
+            return [os.path.join(self.get_data_root(node), "{}".format(scan))
+                    for node in self.nodes]
+
+    def get_node_path(self, path, node):
+        """
+        Get the path on another node that corresponds to a local path
+
+        Args:
+            path (str): Path on a local mount, e.g. "/data/apertif/190303083/qa"
+            node (Node): Node
+
+        Returns:
+            str: Path on the mount of the node, e.g. "/data2/apertif/190303083/qa",
+                None if the path is not on a local mount
+        """
+        for local_mount, node_mount in zip(self.nodes[0].mounts, node.mounts):
+            if path == local_mount or path.startswith(local_mount.rstrip('/') + '/'):
+                return node_mount.rstrip('/') + path[len(local_mount.rstrip('/')):]
+        return None
+
+    def get_node_paths(self, path):
+        """
+        Get the corresponding paths of a local path on all nodes
+
+        Args:
+            path (str): Path on a local mount, e.g. "/data/apertif/190303083/qa"
+
+        Returns:
+            list(str): Path on each node, or only the given path if it
+                is not on a local mount
+        """
+        node_paths = [self.get_node_path(path, node) for node in self.nodes]
+        if None in node_paths:
+            logger.warning("{} is not on a data mount, only using this path".format(path))
+            return [path]
+        return node_paths
+
+
+def get_topology():
+    """
+    Get the node topology of this process
+
+    Returns:
+        NodeTopology: Topology from the file in DATAQA_TOPOLOGY,
+            or the happili topology
+    """
+    global _topology
+    if _topology is None:
+        topology_file = os.environ.get(TOPOLOGY_ENV)
+        if topology_file:
+            logger.info("Reading node topology from {}".format(topology_file))
+            _topology = NodeTopology.from_file(topology_file)
+        else:
+            _topology = NodeTopology.from_dict(DEFAULT_TOPOLOGY)
+    return _topology
@@ -0,0 +1,349 @@
+"""
+Index of the files of an observation on all data directories
+
+The QA steps need to know which beams exist and where their products are.
+Finding this out with os.listdir/glob in every step costs many metadata
+requests on the NFS-mounted happili directories. ObservationLayout scans the
+data directories of a taskid once (one thread per directory), keeps the
+result in memory and stores it in a manifest, so that the next step only
+has to check which directories changed.
+
+Measurement sets, calibration tables and miriad data sets are treated as a
+single entry; their content is not indexed.
+"""
+
+import os
+import stat
+import json
+import fnmatch
+import re
+import logging
+import socket
+from multiprocessing.pool import ThreadPool
+from node_topology import get_topology
+
+logger = logging.getLogger(__name__)
+
+# name of the manifest in the QA directory
+MANIFEST_NAME = "observation_layout.json"
+
+# version of the manifest format
+MANIFEST_VERSION = 1
+
+# layouts that were already created in this process, by manifest and roots
+_layouts = {}
+
+
+def is_table(names):
+    """
+    Check whether a directory is a casacore table or miriad data set
+
+    Args:
+        names (list(str)): Content of the directory
+
+    Returns:
+        bool: True if the directory should be indexed as a single entry
+    """
+    return 'table.dat' in names or 'header' in names
+
+
+def list_directory(path, mtime):
+    """
+    Index the content of a single directory
+
+    Args:
+        path (str): Directory
+        mtime (float): Modification time of the directory
+
+    Returns:
+        dict: Modification time ("mtime"), whether it is a table ("table"),
+        and for other directories the files as name: [size, mtime] ("files")
+        and the names of the subdirectories ("subdirs")
+    """
+    names = os.listdir(path)
+    if is_table(names):
+        return {'mtime': mtime, 'table': True}
+
+    files = {}
+    subdirs = []
+    for name in names:
+        try:
+            st = os.stat(os.path.join(path, name))
+        except OSError:
+            # e.g. a broken link or a file that was just removed
+            continue
+        if stat.S_ISDIR(st.st_mode):
+            subdirs.append(name)
+        else:
+            files[name] = [st.st_size, st.st_mtime]
+    return {'mtime': mtime, 'table': False, 'files': files, 'subdirs': sorted(subdirs)}
+
+
+def scan_root(root, old_dirs=None):
+    """
+    Index all directories below a data directory
+
+    Directories that did not change since old_dirs are not listed again,
+    only their subdirectories are checked.
+
+    Args:
+        root (str): Data directory, e.g. /data/apertif/190303083
+        old_dirs (dict): Previous result of scan_root for this root
+
+    Returns:
+        dict: Output of list_directory for every directory, by path relative to root
+    """
+    if old_dirs is None:
+        old_dirs = {}
+    if not os.path.isdir(root):
+        logger.warning("Data directory {} does not exist".format(root))
+        return {}
+
+    dirs = {}
+    visited = set()
+    todo = ['']
+    while len(todo) != 0:
+        reldir = todo.pop()
+        path = os.path.join(root, reldir) if reldir != '' else root
+        try:
+            st = os.stat(path)
+            # links can point to a directory that was already indexed
+            if (st.st_dev, st.st_ino) in visited:
+                continue
+            visited.add((st.st_dev, st.st_ino))
+            old = old_dirs.get(reldir)
+            if old is not None and old['mtime'] == st.st_mtime:
+                entry = old
+            else:
+                entry = list_directory(path, st.st_mtime)
+        except OSError as e:
+            logger.warning("Could not index {0}: {1}".format(path, e))
+            continue
+        dirs[reldir] = entry
+        if not entry['table']:
+            todo.extend([os.path.join(reldir, name) if reldir != '' else name
+                         for name in entry['subdirs']])
+    return dirs
+
+
+def _scan_root_worker(args):
+    return scan_root(*args)
+
+
+class ObservationLayout(object):
+    def __init__(self, roots, manifest_file=None, refresh=True, n_workers=None):
+        """
+        Index of the beams and products of an observation
+
+        Args:
+            roots (list(str)): Data directories of the observation,
+                e.g. ["/data/apertif/190303083", "/data2/apertif/190303083"]
+            manifest_file (str): File to load the index from and store it in,
+                None to not store it
+            refresh (bool): Update the index from disk, otherwise only the
+                manifest is used
+            n_workers (int): Number of threads for scanning the roots,
+                None for one per root
+        """
+        self.roots = [os.path.normpath(root) for root in roots]
+        self.manifest_file = manifest_file
+        self.dirs = dict([(root, {}) for root in self.roots])
+        self.entries = {}
+
+        if manifest_file is not None:
+            self.load_manifest()
+        if refresh:
+            self.refresh(n_workers=n_workers)
+            if manifest_file is not None:
+                self.save_manifest()
+        else:
+            self.build_index()
+
+    def load_manifest(self):
+        """Load the index of the roots from the manifest, if it exists"""
+        if not os.path.exists(self.manifest_file):
+            return
+        try:
+            with open(self.manifest_file) as f:
+                manifest = json.load(f)
+            if manifest.get('version') != MANIFEST_VERSION:
+                logger.info("Ignoring manifest {} of other version".format(self.manifest_file))
+                return
+            for root in self.roots:
+                self.dirs[root] = manifest['roots'].get(root, {})
+        except Exception as e:
+            logger.warning("Could not read manifest {0}: {1}".format(self.manifest_file, e))
+
+    def save_manifest(self):
+        """
+        Store the index, so it can be refreshed incrementally by the next step
+
+        Layouts of other roots share the manifest, their index is kept.
+        """
+        manifest_dir = os.path.dirname(self.manifest_file)
+        if not os.path.isdir(manifest_dir):
+            return
+        roots = {}
+        if os.path.exists(self.manifest_file):
+            try:
+                with open(self.manifest_file) as f:
+                    manifest = json.load(f)
+                if manifest.get('version') == MANIFEST_VERSION:
+                    roots = manifest['roots']
+            except Exception as e:
+                logger.warning("Could not read manifest {0}: {1}".format(self.manifest_file, e))
+        roots.update(self.dirs)
+        # write to a temporary file first, so a manifest is never incomplete
+        tmp_file = "{0}.{1}.{2}.tmp".format(self.manifest_file, socket.gethostname(), os.getpid())
+        try:
+            with open(tmp_file, 'w') as f:
+                json.dump({'version': MANIFEST_VERSION, 'roots': roots}, f)
+            os.rename(tmp_file, self.manifest_file)
+        except (IOError, OSError) as e:
+            logger.warning("Could not write manifest {0}: {1}".format(self.manifest_file, e))
+
+    def refresh(self, n_workers=None):
+        """
+        Update the index from disk
+
+        Only directories with a new modification time are listed again, so
+        the size of a file that changed in place is updated once a file is
+        added to or removed from its directory.
+
+        Args:
+            n_workers (int): Number of threads for scanning the roots,
+                None for one per root
+        """
+        if len(self.roots) == 0:
+            return
+        if n_workers is None:
+            n_workers = len(self.roots)
+        n_workers = max(1, min(n_workers, len(self.roots)))
+        args = [(root, self.dirs[root]) for root in self.roots]
+        if n_workers == 1:
+            results = [scan_root(*arg) for arg in args]
+        else:
+            pool = ThreadPool(n_workers)
+            try:
+                results = pool.map(_scan_root_worker, args)
+            finally:
+                pool.close()
+        for root, dirs in zip(self.roots, results):
+            self.dirs[root] = dirs
+        self.build_index()
+        logger.info("Indexed {0} files and directories in {1} data directories".format(
+            len(self.entries), len(self.roots)))
+
+    def build_index(self):
+        """Create the lookup of all paths from the directory listings"""
+        entries = {}
+        for root, dirs in self.dirs.items():
+            for reldir, entry in dirs.items():
+                path = os.path.join(root, reldir) if reldir != '' else root
+                if entry['table']:
+                    entries[path] = ('table', 0, entry['mtime'])
+                    continue
+                entries[path] = ('dir', 0, entry['mtime'])
+                for name, (size, mtime) in entry['files'].items():
+                    entries[os.path.join(path, name)] = ('file', size, mtime)
+        self.entries = entries
+
+    def glob(self, pattern):
+        """
+        Find the indexed paths that match a pattern, like glob.glob
+
+        Args:
+            pattern (str): Absolute path with shell wildcards
+
+        Returns:
+            list(str): Matching paths, sorted
+        """
+        parts = os.path.normpath(pattern).split(os.sep)
+        regexes = [re.compile(fnmatch.translate(part)) for part in parts]
+        matches = []
+        for path in self.entries:
+            path_parts = path.split(os.sep)
+            if len(path_parts) != len(parts):
+                continue
+            if all([regex.match(path_part) is not None
+                    for path_part, regex in zip(path_parts, regexes)]):
+                matches.append(path)
+        matches.sort()
+        return matches
+
+    def exists(self, path):
+        return os.path.normpath(path) in self.entries
+
+    def isdir(self, path):
+        """True for directories, including tables"""
+        entry = self.entries.get(os.path.normpath(path))
+        return entry is not None and entry[0] != 'file'
+
+    def getsize(self, path):
+        """Size of a file in bytes, 0 for directories"""
+        return self.entries[os.path.normpath(path)][1]
+
+    def getmtime(self, path):
+        return self.entries[os.path.normpath(path)][2]
+
+    def get_beams(self):
+        """
+        Get the beam directories of all roots
+
+        Returns:
+            list(tuple): (beam, path) of every beam directory, sorted by beam
+        """
+        beams = []
+        for root in self.roots:
+            for path in self.glob(os.path.join(root, "[0-9][0-9]")):
+                if self.entries[path][0] == 'dir':
+                    beams.append((os.path.basename(path), path))
+        beams.sort()
+        return beams
+
+
+def get_scan_paths(scan, basedir=None, trigger_mode=False):
+    """
+    Get the data directories of a scan that are visible from this node
+
+    On the master node of the topology the directories of all nodes are
+    used, on other nodes and in trigger mode only the local one.
+
+    Args:
+        scan (int): scan number, e.g. 190303083
+        basedir (str): Data directory, None for default
+        trigger_mode (bool): Only look for data processed by Apercal on this node
+
+    Returns:
+        list(str): Data directories of the scan
+    """
+    return get_topology().get_scan_roots(scan, basedir=basedir, trigger_mode=trigger_mode)
+
+
+def get_observation_layout(roots, manifest_file=None, refresh=False):
+    """
+    Get the layout of an observation, reusing the one of this process if possible
+
+    Args:
+        roots (list(str)): Data directories of the observation
+        manifest_file (str): Manifest to use, None for the default in the
+            QA directory of the first root
+        refresh (bool): Update an existing layout of this process from disk,
+            e.g. to find files written by an earlier step
+
+    Returns:
+        ObservationLayout: Index of the observation
+    """
+    if manifest_file is None and len(roots) != 0:
+        qa_dir = os.path.join(roots[0], 'qa')
+        if os.path.isdir(qa_dir):
+            manifest_file = os.path.join(qa_dir, MANIFEST_NAME)
+
+    key = (manifest_file, tuple(os.path.normpath(root) for root in roots))
+    if key not in _layouts:
+        _layouts[key] = ObservationLayout(roots, manifest_file=manifest_file)
+    elif refresh:
+        _layouts[key].refresh()
+        if manifest_file is not None:
+            _layouts[key].save_manifest()
+    return _layouts[key]
@@ -6,9 +6,10 @@ import numpy as np
 import matplotlib
 matplotlib.use('Agg')
 import matplotlib.pyplot as plt
-import socket
 import glob
 import logging
+from dataqa.observation_layout import get_observation_layout
+from dataqa.node_topology import get_topology
 
 logger = logging.getLogger(__name__)
 
@@ -31,15 +32,18 @@ def combine_preflag_plots(qa_preflag_dir, trigger_mode=False):
     # ==============
 
     # set the list of preflag directories to search
-    if socket.gethostname() != 'happili-01' or trigger_mode:
+    if not get_topology().is_master() or trigger_mode:
         qa_preflag_dir_list = [qa_preflag_dir]
     else:
-        qa_preflag_dir_list = [qa_preflag_dir, qa_preflag_dir.replace(
-            "data", "data2"), qa_preflag_dir.replace("data", "data3"), qa_preflag_dir.replace("data", "data4")]
+        qa_preflag_dir_list = get_topology().get_node_paths(qa_preflag_dir)
+
+    # index of the preflag directories, refreshed as the plots
+    # were made by an earlier step
+    layout = get_observation_layout(qa_preflag_dir_list, refresh=True)
 
     # get a list of beam directories
     qa_preflag_beam_dir_list = np.array([
-        glob.glob(os.path.join(preflag_dir, "[0-3][0-9]")) for preflag_dir in qa_preflag_dir_list])
+        layout.glob(os.path.join(preflag_dir, "[0-3][0-9]")) for preflag_dir in qa_preflag_dir_list])
 
     # combine the beam directory arrays arrays
     qa_preflag_beam_dir_list = np.concatenate(qa_preflag_beam_dir_list)
@@ -55,7 +59,7 @@ def combine_preflag_plots(qa_preflag_dir, trigger_mode=False):
                           for beam_dir in qa_preflag_beam_dir_list])
 
     # get a list of pngs:
-    qa_preflag_beam_png_list = np.array([glob.glob(os.path.join(
+    qa_preflag_beam_png_list = np.array([layout.glob(os.path.join(
         beam_dir, "*.png")) for beam_dir in qa_preflag_beam_dir_list])
 
     # combine the list
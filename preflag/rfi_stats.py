@@ -0,0 +1,547 @@
+"""
+RFI statistics of the fluxcal MS, read in a single pass
+
+RFinder runs as an external program per beam and the preflag plots only
+show what the pipeline flagged. read_rfi_stats reads the main table of the
+fluxcal MS once in blocks of rows, like visibility_stats, and counts per
+antenna, time bin and channel bin:
+
+- the number of visibilities
+- the number of flagged visibilities (flag occupancy)
+- the number of unflagged visibilities with an amplitude more than
+  OUTLIER_CLIP times the robust noise of their channel away from the
+  median of the channel (amplitude outliers)
+
+The median and the MAD noise of a channel are taken over the unflagged
+cross-correlations of a time bin, so the counts do not depend on the
+number of rows read at once.
+RFIStats reads the MS of all beams with the worker pool of ScanData,
+writes the counts of the observation to a single file and plots the
+occupancy and outlier fractions as waterfalls.
+
+Every node only reads the beams it processed and writes its own file.
+merge_rfi_stats combines the files of all nodes into a single file of the
+observation on the master node.
+"""
+
+from __future__ import print_function
+
+import os
+import socket
+import logging
+import warnings
+import numpy as np
+import casacore.tables as pt
+import matplotlib
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt
+from dataqa.scandata import ScanData
+
+logger = logging.getLogger(__name__)
+
+# default number of MS rows read at once
+BLOCKSIZE = 10000
+
+# default width of the time bins in seconds
+TIME_BIN = 60.
+
+# default number of channels per channel bin
+CHANNEL_BIN = 16
+
+# clipping threshold of the amplitude outliers in units of the MAD sigma of a channel
+OUTLIER_CLIP = 5.
+
+# rows over which the median and MAD noise of the outliers are taken
+OUTLIER_REFERENCE = "time_bin"
+
+# conversion of the median absolute deviation to the sigma of a Gaussian
+MAD_TO_SIGMA = 1.4826
+
+# name of the file with the RFI statistics of an observation in the preflag QA directory
+RFI_STATS_NAME = "{0}_rfi_stats.npz"
+
+# name of the file with the RFI statistics of all nodes on the master node
+RFI_STATS_COMBINED_NAME = "{0}_rfi_stats_combined.npz"
+
+# counts per antenna, time bin and channel bin
+COUNTS = ['n_vis', 'n_flagged', 'n_outliers']
+
+
+def get_rfi_stats_name(scan, combined=False):
+    """
+    Get the file name of the RFI statistics of an observation
+
+    Args:
+        scan (int or str): Task id of the observation
+        combined (bool): Name of the file with the beams of all nodes,
+            otherwise of the file of a single node
+
+    Returns:
+        str: File name in the preflag QA directory
+    """
+    if combined:
+        return RFI_STATS_COMBINED_NAME.format(scan)
+    return RFI_STATS_NAME.format(scan)
+
+
+def get_outliers(amp, flags, clip=OUTLIER_CLIP):
+    """
+    Find the amplitudes far from the median of their channel
+
+    Args:
+        amp (array): Amplitudes (row, channel, polarisation)
+        flags (array): Flags of the amplitudes
+        clip (float): Threshold in units of the MAD sigma of a channel
+
+    Returns:
+        array: True for unflagged amplitudes that are outliers
+    """
+    amp = np.where(flags, np.nan, amp)
+    with warnings.catch_warnings():
+        # fully flagged channels have no median
+        warnings.simplefilter("ignore", RuntimeWarning)
+        median = np.nanmedian(amp, axis=0)
+        deviation = np.abs(amp - median)
+        mad_noise = np.nanmedian(deviation, axis=0) * MAD_TO_SIGMA
+    with np.errstate(invalid='ignore'):
+        return deviation > clip * mad_noise
+
+
+def get_time_bin_chunks(time_index, blocksize):
+    """
+    Split rows sorted by time bin into chunks of whole time bins
+
+    Args:
+        time_index (array): Time bin of every row, in increasing order
+        blocksize (int): Maximum number of rows of a chunk, a time bin with
+            more rows is a chunk of its own
+
+    Returns:
+        list(tuple): First row and number of rows of every chunk
+    """
+    bin_ends = np.append(np.flatnonzero(np.diff(time_index)) + 1, len(time_index))
+    chunks = []
+    start = 0
+    end = 0
+    for bin_end in bin_ends:
+        if bin_end - start > blocksize and end > start:
+            chunks.append((start, end - start))
+            start = end
+        end = int(bin_end)
+    if end > start:
+        chunks.append((start, end - start))
+    return chunks
+
+
+def read_rfi_stats(msfile, time_bin=TIME_BIN, channel_bin=CHANNEL_BIN,
+                   clip=OUTLIER_CLIP, blocksize=BLOCKSIZE):
+    """
+    Count flags and amplitude outliers of the cross-correlations of an MS
+
+    A baseline counts for both of its antennas, the polarisations
+    are counted separately. The median and MAD noise of the outliers are
+    taken per time bin, rows are read in chunks of whole time bins.
+
+    Args:
+        msfile (str): Path to the measurement set
+        time_bin (float): Width of the time bins in seconds
+        channel_bin (int): Number of channels per channel bin
+        clip (float): Threshold of the amplitude outliers in units of
+            the MAD sigma of a channel
+        blocksize (int): Number of rows read at once, this sets the memory use
+            to about blocksize * n_chan * n_pol * 30 bytes. At least the rows
+            of a time bin are read at once.
+
+    Returns:
+        dict: Antenna names ("ant_names"), mean frequency of every channel bin
+        ("freqs"), start time of every time bin ("times") and the counts
+        "n_vis", "n_flagged" and "n_outliers" with shape
+        (n_ant, n_time_bins, n_channel_bins)
+    """
+
+    t = pt.taql("SELECT NAME FROM {0}::ANTENNA".format(msfile))
+    ant_names = t.getcol("NAME")
+    if ant_names is None:
+        raise RuntimeError("No antenna names in {}".format(msfile))
+    n_ant = len(ant_names)
+
+    t = pt.taql("SELECT CHAN_FREQ FROM {0}::SPECTRAL_WINDOW".format(msfile))
+    freqs = t.getcol('CHAN_FREQ')[0, :]
+    n_chan = len(freqs)
+    # start of the channel bins and number of channels in every bin
+    channel_bins = np.arange(0, n_chan, channel_bin)
+    bin_width = np.diff(np.append(channel_bins, n_chan))
+    freqs = np.add.reduceat(freqs, channel_bins) / bin_width
+
+    t = pt.taql("SELECT TIME_RANGE FROM {0}::OBSERVATION".format(msfile))
+    start_time, end_time = t.getcol('TIME_RANGE')[0]
+    n_time = max(1, int(np.ceil((end_time - start_time) / time_bin)))
+    times = start_time + np.arange(n_time) * time_bin
+
+    t = pt.table(msfile, ack=False)
+    sorted_table = None
+    try:
+        if 'DATA' not in t.colnames():
+            raise RuntimeError("No DATA in {}".format(msfile))
+        nrows = t.nrows()
+        if nrows == 0:
+            raise RuntimeError("No rows in {}".format(msfile))
+        n_pol = t.getcell('FLAG', 0).shape[1]
+
+        # the rows of a time bin have to be read together
+        table = t
+        row_times = t.getcol('TIME')
+        if np.any(np.diff(row_times) < 0):
+            logger.info("Sorting the rows of {} by time".format(msfile))
+            sorted_table = t.sort('TIME')
+            table = sorted_table
+            row_times = table.getcol('TIME')
+        row_time_index = np.clip(((row_times - start_time) // time_bin).astype(int), 0, n_time - 1)
+        del row_times
+
+        # counts with a row for every antenna and time bin
+        counts = dict([(name, np.zeros((n_ant * n_time, len(channel_bins)), dtype=np.int64))
+                       for name in COUNTS])
+
+        for startrow, nrow in get_time_bin_chunks(row_time_index, blocksize):
+            ant1 = table.getcol('ANTENNA1', startrow=startrow, nrow=nrow)
+            ant2 = table.getcol('ANTENNA2', startrow=startrow, nrow=nrow)
+            cross = ant1 != ant2
+            if not np.any(cross):
+                continue
+            ant1 = ant1[cross]
+            ant2 = ant2[cross]
+            time_index = row_time_index[startrow:startrow + nrow][cross]
+            flags = table.getcol('FLAG', startrow=startrow, nrow=nrow)[cross]
+            amp = np.abs(table.getcol('DATA', startrow=startrow, nrow=nrow)[cross])
+            outliers = np.zeros(flags.shape, dtype=bool)
+            bin_edges = np.concatenate([[0], np.flatnonzero(np.diff(time_index)) + 1,
+                                        [len(time_index)]])
+            for bin_start, bin_end in zip(bin_edges[:-1], bin_edges[1:]):
+                outliers[bin_start:bin_end] = get_outliers(amp[bin_start:bin_end],
+                                                           flags[bin_start:bin_end], clip=clip)
+            del amp
+
+            # counts per row and channel bin, summed over the polarisations
+            row_counts = {'n_flagged': np.add.reduceat(flags.sum(axis=2), channel_bins, axis=1),
+                          'n_outliers': np.add.reduceat(outliers.sum(axis=2), channel_bins, axis=1)}
+            del flags, outliers
+
+            # a baseline counts for both antennas, the rows are sorted by
+            # antenna and time bin to sum them in one go
+            keys = np.concatenate([ant1 * n_time + time_index, ant2 * n_time + time_index])
+            order = np.argsort(keys, kind='mergesort')
+            keys, starts = np.unique(keys[order], return_index=True)
+            n_rows = np.diff(np.append(starts, len(order)))
+            counts['n_vis'][keys] += n_rows[:, np.newaxis] * n_pol * bin_width
+            for name, values in row_counts.items():
+                values = np.concatenate([values, values])[order]
+                counts[name][keys] += np.add.reduceat(values, starts, axis=0)
+    finally:
+        if sorted_table is not None:
+            sorted_table.close()
+        t.close()
+
+    stats = {'ant_names': ant_names, 'freqs': freqs, 'times': times}
+    for name in COUNTS:
+        stats[name] = counts[name].reshape(n_ant, n_time, len(channel_bins))
+    n_vis = stats['n_vis'].sum()
+    if n_vis > 0:
+        logger.info("{0:.1f}% of the cross-correlations in {1} are flagged, "
+                    "{2:.2f}% are amplitude outliers".format(
+                        100. * stats['n_flagged'].sum() / n_vis, msfile,
+                        100. * stats['n_outliers'].sum() / n_vis))
+
+    return stats
+
+
+def get_fractions(stats):
+    """
+    Flag occupancy and outlier fraction of RFI statistics
+
+    Args:
+        stats (dict): Counts as returned by read_rfi_stats
+
+    Returns:
+        tuple: Fraction of the visibilities that is flagged and fraction of
+        the unflagged visibilities that is an outlier, NaN without visibilities
+    """
+    n_vis = stats['n_vis'].astype(float)
+    n_unflagged = n_vis - stats['n_flagged']
+    with np.errstate(divide='ignore', invalid='ignore'):
+        occupancy = np.where(n_vis > 0, stats['n_flagged'] / n_vis, np.nan)
+        outlier_fraction = np.where(n_unflagged > 0, stats['n_outliers'] / n_unflagged, np.nan)
+    return occupancy, outlier_fraction
+
+
+def plot_waterfalls(filename, title, waterfalls, freqs, times, nx=4, vmax=1.):
+    """
+    Plot a grid of waterfalls
+
+    Args:
+        filename (str): Name of the plot
+        title (str): Title of the plot
+        waterfalls (list(tuple)): Title of the panel and its (time, channel) image
+        freqs (array): Frequency in Hz of the channels
+        times (array): Start time in seconds of the time bins
+        nx (int): Number of panels per row
+        vmax (float): Upper limit of the color scale, None for the highest value
+    """
+    nx = min(nx, len(waterfalls))
+    ny = int(np.ceil(len(waterfalls) / float(nx)))
+    fig, axes = plt.subplots(ny, nx, figsize=(nx * 4, ny * 4), squeeze=False,
+                             sharex=True, sharey=True)
+    fig.suptitle(title, size=20)
+
+    # frequency in MHz along x, minutes since the start along y
+    time_step = times[1] - times[0] if len(times) > 1 else 1.
+    extent = [freqs[0] / 1.e6, freqs[-1] / 1.e6,
+              (times[-1] - times[0] + time_step) / 60., 0.]
+    for ax, (panel_title, waterfall) in zip(axes.ravel(), waterfalls):
+        image = ax.imshow(waterfall, aspect='auto', interpolation='nearest', extent=extent,
+                          vmin=0., vmax=vmax, cmap='viridis')
+        ax.set_title(panel_title)
+    for ax in axes.ravel()[len(waterfalls):]:
+        ax.axis('off')
+    for ax in axes[-1]:
+        ax.set_xlabel('Frequency [MHz]')
+    for ax in axes[:, 0]:
+        ax.set_ylabel('Time [min]')
+    fig.colorbar(image, ax=axes.ravel().tolist(), shrink=0.6)
+
+    fig.savefig(filename)
+    plt.close(fig)
+
+
+def write_rfi_stats(rfi_file, beam_stats, time_bin, channel_bin, clip):
+    """
+    Write the counts of several beams to a single file
+
+    The counts have shape (beam, antenna, time bin, channel bin), with
+    zeros for beams without data and for time bins after the end of a beam.
+    Frequencies and times of every beam are padded with NaN.
+
+    Args:
+        rfi_file (str): File to write
+        beam_stats (list(tuple)): Beam number and output of read_rfi_stats of every beam
+        time_bin (float): Width of the time bins in seconds
+        channel_bin (int): Number of channels per channel bin
+        clip (float): Threshold of the amplitude outliers in MAD sigma
+    """
+    if len(beam_stats) == 0:
+        logger.warning("No RFI statistics to write to {}".format(rfi_file))
+        return
+
+    n_beams = max([beam for beam, _ in beam_stats]) + 1
+    n_ant = max([len(stats['ant_names']) for _, stats in beam_stats])
+    n_time = max([len(stats['times']) for _, stats in beam_stats])
+    n_chan = max([len(stats['freqs']) for _, stats in beam_stats])
+
+    ant_names = np.array(max([list(stats['ant_names']) for _, stats in beam_stats], key=len))
+    freqs = np.full((n_beams, n_chan), np.nan)
+    times = np.full((n_beams, n_time), np.nan)
+    counts = dict([(name, np.zeros((n_beams, n_ant, n_time, n_chan), dtype=np.int32))
+                   for name in COUNTS])
+    for beam, stats in beam_stats:
+        freqs[beam, :len(stats['freqs'])] = stats['freqs']
+        times[beam, :len(stats['times'])] = stats['times']
+        for name in COUNTS:
+            ant, time, chan = stats[name].shape
+            counts[name][beam, :ant, :time, :chan] = stats[name]
+
+    # write to a temporary file first, so the file is never incomplete
+    tmp_file = "{0}.{1}.{2}.tmp".format(rfi_file, socket.gethostname(), os.getpid())
+    with open(tmp_file, 'wb') as f:
+        np.savez_compressed(f, beams=np.array([beam for beam, _ in beam_stats]),
+                            ant_names=ant_names, freqs=freqs, times=times,
+                            time_bin=time_bin, channel_bin=channel_bin,
+                            clip=clip, reference=OUTLIER_REFERENCE, **counts)
+    os.rename(tmp_file, rfi_file)
+    logger.info("Wrote RFI statistics of {0:d} beams to {1}".format(len(beam_stats), rfi_file))
+
+
+def read_rfi_stats_file(rfi_file):
+    """
+    Read the counts of the beams in a file of write_rfi_stats
+
+    Args:
+        rfi_file (str): File to read
+
+    Returns:
+        tuple: Beam number and statistics as in read_rfi_stats of every beam,
+        without the padding of the frequencies and times, and the
+        time bin, channel bin, clip and outlier reference of the file.
+        Files of before the reference was stored took it per block of rows.
+    """
+    with np.load(rfi_file) as data:
+        beam_stats = []
+        for beam in data['beams']:
+            freqs = data['freqs'][beam]
+            times = data['times'][beam]
+            n_time = np.sum(~np.isnan(times))
+            n_chan = np.sum(~np.isnan(freqs))
+            stats = {'ant_names': data['ant_names'],
+                     'freqs': freqs[:n_chan],
+                     'times': times[:n_time]}
+            for name in COUNTS:
+                stats[name] = data[name][beam, :, :n_time, :n_chan]
+            beam_stats.append((int(beam), stats))
+        reference = str(data['reference']) if 'reference' in data.files else "block"
+        binning = (float(data['time_bin']), int(data['channel_bin']), float(data['clip']),
+                   reference)
+    return beam_stats, binning
+
+
+def merge_rfi_stats(rfi_files, rfi_file):
+    """
+    Merge the RFI statistics of several nodes into a single file
+
+    Files that do not exist are skipped, e.g. of nodes without beams.
+    A beam that is in more than one file is taken from the last one.
+
+    Args:
+        rfi_files (list(str)): Files of write_rfi_stats of the nodes
+        rfi_file (str): File to write
+
+    Returns:
+        int: Number of beams in the merged file
+
+    Raises:
+        ValueError: If the files have different bins, clipping thresholds
+            or outlier references
+    """
+    merged = {}
+    merged_binning = None
+    for node_file in rfi_files:
+        if not os.path.exists(node_file):
+            logger.warning("Could not find {}".format(node_file))
+            continue
+        beam_stats, binning = read_rfi_stats_file(node_file)
+        if merged_binning is not None and binning != merged_binning:
+            raise ValueError("Time bin, channel bin, clip or outlier reference of {0} differ "
+                             "from the other files".format(node_file))
+        merged_binning = binning
+        logger.info("Found RFI statistics of {0:d} beams in {1}".format(len(beam_stats), node_file))
+        merged.update(dict(beam_stats))
+
+    if merged_binning is None:
+        logger.warning("No RFI statistics to merge into {}".format(rfi_file))
+        return 0
+    if merged_binning[3] != OUTLIER_REFERENCE:
+        raise ValueError("Outliers of {0} are taken per {1}, not per {2}".format(
+            rfi_file, merged_binning[3], OUTLIER_REFERENCE))
+    write_rfi_stats(rfi_file, sorted(merged.items()), *merged_binning[:3])
+    return len(merged)
+
+
+class RFIStats(ScanData):
+    def __init__(self, scan, fluxcal, trigger_mode, basedir=None, time_bin=TIME_BIN,
+                 channel_bin=CHANNEL_BIN, clip=OUTLIER_CLIP, blocksize=BLOCKSIZE):
+        """
+        Flag occupancy and amplitude outliers of the fluxcal MS for all beams
+
+        Args:
+            scan (int): scan number, e.g. 190303083
+            fluxcal (str): name of fluxcal, e.g. "3C147"
+            trigger_mode (bool): To run automatically after Apercal
+            basedir (str): Data directory, None for default
+            time_bin (float): Width of the time bins in seconds
+            channel_bin (int): Number of channels per channel bin
+            clip (float): Threshold of the amplitude outliers in MAD sigma
+            blocksize (int): Number of MS rows read at once
+        """
+        ScanData.__init__(self, scan, fluxcal,
+                          trigger_mode=trigger_mode, basedir=basedir)
+        self.imagepathsuffix = "preflag"
+        self.time_bin = time_bin
+        self.channel_bin = channel_bin
+        self.clip = clip
+        self.blocksize = blocksize
+        self.stats = np.empty(len(self.dirlist), dtype=object)
+
+    def get_beam_data(self, path, beam):
+        msfile = "{0}/raw/{1}.MS".format(path, self.sourcename)
+        if os.path.isdir(msfile):
+            logger.info("Processing {}".format(msfile))
+            return {'stats': read_rfi_stats(
+                msfile, time_bin=self.time_bin, channel_bin=self.channel_bin,
+                clip=self.clip, blocksize=self.blocksize)}
+        else:
+            logger.warning("Could not find {}".format(msfile))
+            return {}
+
+    def get_beam(self, beam):
+        """
+        Get the RFI statistics of a beam
+
+        Args:
+            beam (str): Beam, e.g. "00"
+
+        Returns:
+            dict: Output of read_rfi_stats, None if not available
+        """
+        if beam not in self.beamlist:
+            return None
+        return self.stats[self.beamlist.index(beam)]
+
+    def write(self, rfi_file):
+        """
+        Write the counts of all beams to a single file, see write_rfi_stats
+
+        Args:
+            rfi_file (str): File to write
+        """
+        beam_stats = [(int(beam), stats) for beam, stats in zip(self.beamlist, self.stats)
+                      if stats is not None]
+        write_rfi_stats(rfi_file, beam_stats, self.time_bin, self.channel_bin, self.clip)
+
+    def plot_waterfalls(self, imagepath=None):
+        """
+        Plot waterfalls of the flag occupancy and the outlier fraction
+
+        For every beam, one plot of each with a panel per antenna, and one
+        plot of each with a panel per beam, averaged over the antennas.
+
+        Args:
+            imagepath (str): Directory of the plots, None for the default
+        """
+        logger.info("Creating RFI waterfall plots")
+
+        imagepath = self.create_imagepath(imagepath)
+
+        beam_waterfalls = {'occupancy': [], 'outliers': []}
+        for beam, stats in zip(self.beamlist, self.stats):
+            if stats is None:
+                continue
+            occupancy, outlier_fraction = get_fractions(stats)
+            for name, title, fractions, vmax in [
+                    ('occupancy', 'Flag occupancy', occupancy, 1.),
+                    ('outliers', 'Amplitude outlier fraction', outlier_fraction, None)]:
+                plot_waterfalls('{0}/RFI_{1}_B{2}_{3}.png'.format(imagepath, name, beam, self.scan),
+                                '{0} of beam {1}'.format(title, beam),
+                                [('Antenna {0}'.format(ant), fractions[a])
+                                 for a, ant in enumerate(stats['ant_names'])],
+                                stats['freqs'], stats['times'], vmax=vmax)
+
+            # average over the antennas, from the counts
+            beam_total = dict([(name, stats[name].sum(axis=0)[np.newaxis]) for name in COUNTS])
+            occupancy, outlier_fraction = get_fractions(beam_total)
+            beam_waterfalls['occupancy'].append(
+                ('Beam {0}'.format(beam), occupancy[0], stats['freqs'], stats['times']))
+            beam_waterfalls['outliers'].append(
+                ('Beam {0}'.format(beam), outlier_fraction[0], stats['freqs'], stats['times']))
+
+        if len(beam_waterfalls['occupancy']) == 0:
+            logger.warning("No RFI statistics to plot")
+            return
+
+        for name, title, vmax in [('occupancy', 'Flag occupancy', 1.),
+                                  ('outliers', 'Amplitude outlier fraction', None)]:
+            waterfalls = beam_waterfalls[name]
+            _, _, freqs, times = waterfalls[0]
+            n_time = min([len(beam_times) for _, _, _, beam_times in waterfalls])
+            plot_waterfalls('{0}/RFI_{1}_{2}.png'.format(imagepath, name, self.scan),
+                            '{0} per beam'.format(title),
+                            [(panel_title, waterfall[:n_time])
+                             for panel_title, waterfall, _, _ in waterfalls],
+                            freqs, times[:n_time], nx=8, vmax=vmax)
@@ -0,0 +1,213 @@
+"""
+Run RFinder for many beams at once, each with a time limit
+
+Every beam is an independent RFinder process. A pool of threads starts up
+to n_workers of them at the same time and waits for each with os.wait4,
+which gives the exit status and the peak memory of the process. A process
+that runs longer than the timeout is killed with its children, so a hung
+beam does not block the RFI QA of the other beams. The runtime, status
+and peak memory of every beam are collected in a table.
+"""
+
+import os
+import sys
+import time
+import signal
+import logging
+from multiprocessing.pool import ThreadPool
+from multiprocessing import cpu_count
+from astropy.table import Table
+
+try:
+    # Popen of Python 2 is not safe in threads, subprocess32 is
+    import subprocess32 as subprocess
+except ImportError:
+    import subprocess
+
+logger = logging.getLogger(__name__)
+
+# command to run RFinder
+RFINDER_COMMAND = "/home/apercal/pipeline/bin/rfinder"
+
+# default time limit of a single RFinder run in seconds
+RFINDER_TIMEOUT = 3600
+
+# name of the table with the runs of all beams in the preflag QA directory
+RFINDER_TABLE_NAME = "rfinder_runs.csv"
+
+# seconds between checks whether a process has finished
+POLL_INTERVAL = 1.
+
+# seconds between asking a process to stop and killing it
+KILL_GRACE = 10.
+
+# whether Popen can start the program in a new session, without preexec_fn
+NEW_SESSION = sys.version_info[0] >= 3 or subprocess.__name__ == 'subprocess32'
+
+
+def get_rfinder_args(data_path, ms_file, output_path):
+    """
+    Get the command line of RFinder for a beam
+
+    Args:
+        data_path (str): Directory with the measurement set
+        ms_file (str): Name of the measurement set
+        output_path (str): Directory for the output of RFinder
+
+    Returns:
+        list(str): Program and arguments
+    """
+    return ["python", RFINDER_COMMAND, "-idir", data_path, "-i", ms_file, "-tel", "apertif",
+            "-mode", "use_flags", "-odir", output_path, "-fl", "0", "-tStep", "5", "-yesClp"]
+
+
+def stop_process_group(pid):
+    """
+    Ask a process group to stop, kill it if it does not and collect the process
+
+    Args:
+        pid (int): Process id of the leader of the group
+
+    Returns:
+        tuple: Result of os.wait4 for the process
+    """
+    try:
+        os.killpg(pid, signal.SIGTERM)
+    except OSError:
+        pass
+    deadline = time.time() + KILL_GRACE
+    while time.time() < deadline:
+        result = os.wait4(pid, os.WNOHANG)
+        if result[0] != 0:
+            return result
+        time.sleep(POLL_INTERVAL / 10.)
+    try:
+        os.killpg(pid, signal.SIGKILL)
+    except OSError:
+        pass
+    return os.wait4(pid, 0)
+
+
+def run_with_timeout(args, timeout=RFINDER_TIMEOUT, log_file=None):
+    """
+    Run a program, killing it when it takes too long
+
+    Args:
+        args (list(str)): Program and arguments
+        timeout (float): Time limit in seconds, None for no limit
+        log_file (str): File for the output of the program, None to keep it
+
+    Returns:
+        dict: status (done, failed or timeout), exit code (negative for a
+        signal), runtime in seconds and peak memory in MB of the process
+    """
+    start_time = time.time()
+    output = open(log_file, 'w') if log_file is not None else None
+    try:
+        # a group of its own, to stop the children of the program as well.
+        # This runs in threads, where forking with preexec_fn can deadlock
+        stderr = subprocess.STDOUT if output else None
+        if NEW_SESSION:
+            process = subprocess.Popen(args, stdout=output, stderr=stderr,
+                                       start_new_session=True)
+        else:
+            # the child of Popen is no group leader, so setsid runs
+            # the program in the same process, as leader of a new group
+            process = subprocess.Popen(["setsid"] + args, stdout=output, stderr=stderr)
+        timed_out = False
+        while True:
+            pid, status, usage = os.wait4(process.pid, os.WNOHANG)
+            if pid != 0:
+                break
+            if timeout is not None and time.time() - start_time > timeout:
+                timed_out = True
+                pid, status, usage = stop_process_group(process.pid)
+                break
+            time.sleep(POLL_INTERVAL)
+    finally:
+        if output is not None:
+            output.close()
+
+    if os.WIFSIGNALED(status):
+        exit_code = -os.WTERMSIG(status)
+    else:
+        exit_code = os.WEXITSTATUS(status)
+    # the process is collected already
+    process.returncode = exit_code
+
+    if timed_out:
+        run_status = "timeout"
+    elif exit_code == 0:
+        run_status = "done"
+    else:
+        run_status = "failed"
+
+    return {'status': run_status,
+            'exit_code': exit_code,
+            'runtime': time.time() - start_time,
+            # ru_maxrss is in kB on Linux
+            'peak_memory': usage.ru_maxrss / 1024.}
+
+
+def _run_beam(beam_run):
+    """
+    Run RFinder for a single beam in a thread of the pool
+
+    Args:
+        beam_run (tuple): beam, arguments, log file and timeout
+
+    Returns:
+        dict: Result of run_with_timeout with the beam
+    """
+    beam, args, log_file, timeout = beam_run
+    logger.info("Running RFinder for beam {0:s}".format(beam))
+    try:
+        result = run_with_timeout(args, timeout=timeout, log_file=log_file)
+    except Exception as e:
+        logger.exception(e)
+        result = {'status': "failed", 'exit_code': -1,
+                  'runtime': 0., 'peak_memory': 0.}
+    result['beam'] = beam
+    if result['status'] == "done":
+        logger.info("Running RFinder for beam {0:s} ... Done ({1:.0f}s, {2:.0f} MB)".format(
+            beam, result['runtime'], result['peak_memory']))
+    elif result['status'] == "timeout":
+        logger.error("Running RFinder for beam {0:s} was stopped after {1:.0f}s".format(
+            beam, result['runtime']))
+    else:
+        logger.error("Running RFinder for beam {0:s} failed with exit code {1:d}".format(
+            beam, result['exit_code']))
+    return result
+
+
+def run_rfinder_beams(beam_runs, n_workers=1, timeout=RFINDER_TIMEOUT):
+    """
+    Run RFinder for several beams in parallel
+
+    Args:
+        beam_runs (list(tuple)): Beam, arguments of RFinder and log file of every beam
+        n_workers (int): Number of beams to run at the same time
+        timeout (float): Time limit of a beam in seconds, None for no limit
+
+    Returns:
+        Table: Beam, status, exit code, runtime in seconds and
+        peak memory in MB of every beam
+    """
+    n_workers = max(1, min(n_workers, len(beam_runs), cpu_count()))
+    logger.info("Running RFinder for {0:d} beams with {1:d} processes".format(
+        len(beam_runs), n_workers))
+
+    tasks = [(beam, args, log_file, timeout) for beam, args, log_file in beam_runs]
+    if n_workers == 1:
+        results = [_run_beam(task) for task in tasks]
+    else:
+        pool = ThreadPool(n_workers)
+        try:
+            results = pool.map(_run_beam, tasks, chunksize=1)
+        finally:
+            pool.terminate()
+
+    names = ['beam', 'status', 'exit_code', 'runtime', 'peak_memory']
+    if len(results) == 0:
+        return Table(names=names, dtype=[str, str, int, float, float])
+    return Table(rows=[[result[name] for name in names] for result in results], names=names)
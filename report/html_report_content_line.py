@@ -10,63 +10,22 @@ import numpy as np
 logger = logging.getLogger(__name__)
 
 
-def write_obs_content_line(html_code, qa_report_obs_path, page_type):
-    """Function to create the html page for line
+def write_cube_gallery(html_code, qa_report_obs_path, page_type, gallery_name, title, plot_name):
+    """Function to create a gallery with a plot of every beam for each cube
 
     Args:
-        html_code (str): HTML code with header and title
+        html_code (str): HTML code of the page
         qa_report_obs_path (str): Path to the report directory
         page_type (str): The type of report page
+        gallery_name (str): Name of the gallery in the HTML code
+        title (str): Title of the gallery
+        plot_name (str): End of the plot file names, e.g. noise
+            for beam_00_cube0_noise.png
 
     Return:
-        html_code (str): Body of HTML code for this page
+        html_code (str): HTML code with the gallery added
     """
 
-    logger.info("Writing html code for page {0:s}".format(page_type))
-
-    html_code += """
-        <div class="w3-container w3-large">
-            <p>
-                This page provides information on the performance of the line module. You can find the following information here: 
-            </p>
-            <div class="w3-container w3-large">
-                1. A summary table (not yet available)<br>
-                2. For each cube, the spectra of the channal rms per beam. This allows you to look for difference between beams<br>
-                3. For each beam, the spectra of the channal rms per cube. <br>
-            </div>
-        </div>\n
-        """
-
-    # Create html code for summary table
-    # ==================================
-
-    table_found = False
-
-    if table_found:
-        html_code += """
-            <div class="w3-container">
-                    <button class="w3-btn w3-large w3-center w3-block w3-border-gray w3-amber w3-hover-yellow w3-margin-bottom" onclick="show_hide_plots('gallery-1')">
-                        Line summary table
-                    </button>
-                </div>
-            <div class="w3-container w3-margin-top w3-show" name="gallery-1">\n"""
-
-        html_code += """
-            <p> No table here yet.
-            </p>\n"""
-        html_code += """</div>\n"""
-    else:
-        logger.warning("No line table found")
-        html_code += """
-            <div class="w3-container">
-                <button class="w3-btn w3-large w3-center w3-block w3-border-gray w3-amber w3-hover-yellow w3-margin-bottom w3-disabled" onclick="show_hide_plots('gallery-1')">
-                    Line summary table
-                </button>
-            </div>\n"""
-
-    # Create html code for cube gallery
-    # =================================
-
     # get beams
     beam_list = glob.glob(
         "{0:s}/{1:s}/[0-3][0-9]".format(qa_report_obs_path, page_type))
@@ -84,16 +43,16 @@ def write_obs_content_line(html_code, qa_report_obs_path, page_type):
                 <button class="w3-btn w3-large w3-center w3-block w3-border-gray w3-amber w3-hover-yellow w3-margin-bottom" onclick="show_hide_plots('{0:s}')">{1:s}
                 </button>
             </div>
-            <div class="w3-container w3-margin-top w3-hide" name="{0:s}">\n""".format("gallery_cubes", "Cubes")
+            <div class="w3-container w3-margin-top w3-hide" name="{0:s}">\n""".format(gallery_name, title)
 
         # go through the list of cubes
         for cube_counter in range(n_cubes):
 
             # get a list of cubes
             cube_list = glob.glob(
-                "{0:s}/{1:s}/[0-3][0-9]/*cube{2:d}*.png".format(qa_report_obs_path, page_type, cube_counter))
+                "{0:s}/{1:s}/[0-3][0-9]/*cube{2:d}_{3:s}.png".format(qa_report_obs_path, page_type, cube_counter, plot_name))
 
-            div_name = "gallery_cube_{0}".format(cube_counter)
+            div_name = "{0:s}_{1:d}".format(gallery_name, cube_counter)
 
             # if there plots for this cube, create the gallery
             if len(cube_list) != 0:
@@ -154,13 +113,88 @@ def write_obs_content_line(html_code, qa_report_obs_path, page_type):
 
         html_code += """</div>\n"""
     else:
-        logger.warning("No beams found for line cube gallery")
+        logger.warning("No beams found for line {0:s} gallery".format(title))
         html_code += """
             <div class="w3-container">
                 <button class="w3-btn w3-large w3-center w3-block w3-border-gray w3-amber w3-hover-yellow w3-margin-bottom w3-disabled" onclick="show_hide_plots('{0:s}')">
             {1:s}
                 </button>
-            </div>\n""".format("gallery_cubes", "Cubes")
+            </div>\n""".format(gallery_name, title)
+
+    return html_code
+
+
+def write_obs_content_line(html_code, qa_report_obs_path, page_type):
+    """Function to create the html page for line
+
+    Args:
+        html_code (str): HTML code with header and title
+        qa_report_obs_path (str): Path to the report directory
+        page_type (str): The type of report page
+
+    Return:
+        html_code (str): Body of HTML code for this page
+    """
+
+    logger.info("Writing html code for page {0:s}".format(page_type))
+
+    html_code += """
+        <div class="w3-container w3-large">
+            <p>
+                This page provides information on the performance of the line module. You can find the following information here: 
+            </p>
+            <div class="w3-container w3-large">
+                1. A summary table (not yet available)<br>
+                2. For each cube, the spectra of the channal rms per beam. This allows you to look for difference between beams<br>
+                3. For each cube, the noise maps per beam: the rms of every pixel along the spectral axis and the rms of tiles in every channel relative to the other tiles. These show spatial structure in the noise such as the edge of the beam, RFI or residuals of the continuum subtraction<br>
+                4. For each cube, a preview per beam: the moment-0 map of the emission above 3 sigma and the peak flux along the spectral axis. The fits files of these maps and of a binned preview cube are in the line QA directory of the beam<br>
+                5. For each beam, the spectra of the channal rms per cube. <br>
+            </div>
+        </div>\n
+        """
+
+    # Create html code for summary table
+    # ==================================
+
+    table_found = False
+
+    if table_found:
+        html_code += """
+            <div class="w3-container">
+                    <button class="w3-btn w3-large w3-center w3-block w3-border-gray w3-amber w3-hover-yellow w3-margin-bottom" onclick="show_hide_plots('gallery-1')">
+                        Line summary table
+                    </button>
+                </div>
+            <div class="w3-container w3-margin-top w3-show" name="gallery-1">\n"""
+
+        html_code += """
+            <p> No table here yet.
+            </p>\n"""
+        html_code += """</div>\n"""
+    else:
+        logger.warning("No line table found")
+        html_code += """
+            <div class="w3-container">
+                <button class="w3-btn w3-large w3-center w3-block w3-border-gray w3-amber w3-hover-yellow w3-margin-bottom w3-disabled" onclick="show_hide_plots('gallery-1')">
+                    Line summary table
+                </button>
+            </div>\n"""
+
+    # Create html code for cube galleries
+    # ===================================
+
+    # noise spectra of the cubes
+    html_code = write_cube_gallery(
+        html_code, qa_report_obs_path, page_type, "gallery_cubes", "Cubes", "noise")
+
+    # rms maps and tile rms of the cubes
+    html_code = write_cube_gallery(
+        html_code, qa_report_obs_path, page_type, "gallery_noise_maps", "Noise maps", "noise_map")
+
+    # moment-0 and peak flux maps of the cubes
+    html_code = write_cube_gallery(
+        html_code, qa_report_obs_path, page_type, "gallery_previews", "Previews", "preview")
+
 
     # Create html code for image gallery
     # ==================================
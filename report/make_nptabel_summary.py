@@ -5,7 +5,8 @@ import os
 import numpy as np
 import logging
 import csv
-import socket
+from dataqa.observation_layout import get_observation_layout
+from dataqa.node_topology import get_topology
 
 # ----------------------------------------------
 # read data from np file
@@ -51,7 +52,7 @@ def simplify_data(d, beamnum):
     return dict
 
 
-def extract_beam(path, beamnum, module, source):
+def extract_beam(path, beamnum, module, source, layout=None):
     """
     Function to return numpy files contents as a dictionary filtered for certain keys
 
@@ -60,6 +61,7 @@ def extract_beam(path, beamnum, module, source):
         beamnum (int): Beam number
         module (str): name of the apercal module e.g. 'preflag', 'convert', 'croscal'
         source (str): name of the source or calibrators for preflag, for other modules it should be an empty string ('')
+        layout (ObservationLayout): Index of the data directories, None to search the disk
 
     Returns:
         a dictionary with information extracted from a numpy log file
@@ -73,16 +75,22 @@ def extract_beam(path, beamnum, module, source):
     crosscal_filters = ['calibration_calibrator_finished', 'calibration_restart', 'calibration_try_counter', 'fluxcal_apgains', 'fluxcal_bandpass', 'fluxcal_calibration_restart', 'fluxcal_calibration_try_counter',
                         'fluxcal_globaldelay', 'fluxcal_initialphase', 'fluxcal_leakage', 'fluxcal_model', 'fluxcal_transfer', 'polcal_crosshanddelay', 'polcal_model', 'polcal_polarisationangle', 'polcal_transfer', 'targetbeams_transfer']
 
+    # look up the files in the index if there is one
+    if layout is not None:
+        find_files = layout.glob
+    else:
+        find_files = glob.glob
+
     if module == 'selfcal' or module == 'continuum' or module == 'transfer':
-        f = glob.glob(os.path.join(path, 'param_{:02d}.npy'.format(beamnum)))
+        f = find_files(os.path.join(path, 'param_{:02d}.npy'.format(beamnum)))
     elif module == "crosscal":
-        f = glob.glob(os.path.join(
+        f = find_files(os.path.join(
             path, 'param_{:02d}_crosscal.npy'.format(beamnum)))
         if len(f) == 0:
-            f = glob.glob(os.path.join(
+            f = find_files(os.path.join(
                 path, 'param_{:02d}.npy'.format(beamnum)))
     else:
-        f = glob.glob(os.path.join(
+        f = find_files(os.path.join(
             path, 'param_{:02d}*{}*{}.npy'.format(beamnum, module, source)))
 
     res = {}
@@ -146,42 +154,30 @@ def extract_all_beams(obs_id, module, qa_dir):
     Returns
         a dictionary with information extracted from a numpy log file
     """
-    if "data" in qa_dir:
-        # beams_1 = '/data/apertif/'+str(obs_id)+'/'
-        # beams_2 = '/data2/apertif/'+str(obs_id)+'/'
-        # beams_3 = '/data3/apertif/'+str(obs_id)+'/'
-        # beams_4 = '/data4/apertif/'+str(obs_id)+'/'
-
-        # if not on happili, asssume all beamse
-        # are on the same node. Not the best solution
-        # for this, but requires the least amount of
-        # changes to the logic below
-        obs_dir = os.path.dirname(qa_dir.rstrip("/"))
-        if socket.gethostname() == "happili-01":
-            # this gives /data/apertif/<taskid>
-            beams_1 = obs_dir + "/"
-            beams_2 = obs_dir.replace("/data", "/data2") + "/"
-            beams_3 = obs_dir.replace("/data", "/data3") + "/"
-            beams_4 = obs_dir.replace("/data", "/data4") + "/"
-        else:
-            beams_1 = obs_dir + "/"
-            beams_2 = obs_dir + "/"
-            beams_3 = obs_dir + "/"
-            beams_4 = obs_dir + "/"
-
+    # this gives /data/apertif/<taskid>
+    obs_dir = os.path.dirname(qa_dir.rstrip("/"))
+
+    # if not on the master node, asssume all beams
+    # are on the same node
+    topology = get_topology()
+    if topology.is_master():
+        node_dir_list = topology.get_node_paths(obs_dir)
     else:
-        if socket.gethostname() == "happili-01":
-            beams_1 = obs_dir + "/"
-            beams_2 = obs_dir.replace("/tank", "/tank2") + "/"
-            beams_3 = obs_dir.replace("/tank", "/tank3") + "/"
-            beams_4 = obs_dir.replace("/tank", "/tank4") + "/"
+        node_dir_list = [obs_dir]
+
+    beamnum = np.arange(topology.n_beams)
+
+    # data directory of each beam
+    beam_dir_list = []
+    for i in beamnum:
+        node = topology.get_beam_node(i)
+        if len(node_dir_list) == len(topology.nodes) and node is not None:
+            beam_dir_list.append(node_dir_list[topology.nodes.index(node)] + "/")
         else:
-            beams_1 = obs_dir + "/"
-            beams_2 = obs_dir + "/"
-            beams_3 = obs_dir + "/"
-            beams_4 = obs_dir + "/"
+            beam_dir_list.append(node_dir_list[0] + "/")
 
-    beamnum = np.arange(40)
+    # index the data directories once instead of searching them for every beam
+    layout = get_observation_layout(sorted(set(beam_dir_list)))
 
     dict_beams = []
 
@@ -189,45 +185,16 @@ def extract_all_beams(obs_id, module, qa_dir):
         source_list = find_sources(obs_id, os.path.dirname(qa_dir))
         for j in range(len(source_list)):
             for i in beamnum:
-                if i < 10:
-                    dict_beams_v1 = (extract_beam(
-                        beams_1, i, module, source_list[j]))
-                    dict_beams_v1.update({'source': source_list[j]})
-                    dict_beams.append(dict_beams_v1)
-
-                if i >= 10 and i < 20:
-                    dict_beams_v1 = (extract_beam(
-                        beams_2, i, module, source_list[j]))
-                    dict_beams_v1.update({'source': source_list[j]})
-                    dict_beams.append(dict_beams_v1)
-
-                if i >= 20 and i < 30:
-                    dict_beams_v1 = (extract_beam(
-                        beams_3, i, module, source_list[j]))
-                    dict_beams_v1.update({'source': source_list[j]})
-                    dict_beams.append(dict_beams_v1)
-
-                if i >= 30 and i < 40:
-                    dict_beams_v1 = (extract_beam(
-                        beams_4, i, module, source_list[j]))
-                    dict_beams_v1.update({'source': source_list[j]})
-                    dict_beams.append(dict_beams_v1)
+                dict_beams_v1 = (extract_beam(
+                    beam_dir_list[i], i, module, source_list[j], layout=layout))
+                dict_beams_v1.update({'source': source_list[j]})
+                dict_beams.append(dict_beams_v1)
 
     else:
         source = ''
 
         for i in beamnum:
-            if i < 10:
-                dict_beams.append(extract_beam(beams_1, i, module, source))
-
-            if i >= 10 and i < 20:
-                dict_beams.append(extract_beam(beams_2, i, module, source))
-
-            if i >= 20 and i < 30:
-                dict_beams.append(extract_beam(beams_3, i, module, source))
-
-            if i >= 30 and i < 40:
-                dict_beams.append(extract_beam(beams_4, i, module, source))
+            dict_beams.append(extract_beam(beam_dir_list[i], i, module, source, layout=layout))
 
     return dict_beams
 
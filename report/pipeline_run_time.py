@@ -8,6 +8,7 @@ import os
 from astropy.table import Table, hstack, vstack
 from apercal import parselog
 from scandata import get_default_imagepath
+from node_topology import get_topology
 import socket
 import numpy as np
 import glob
@@ -29,15 +30,15 @@ def get_pipeline_run_time(obs_id, trigger_mode=False):
     qa_dir = get_default_imagepath(obs_id)
 
     host_name = socket.gethostname()
-
-    if trigger_mode:
-        data_dir_list = [qa_dir.replace("qa/", "")]
-        host_name_list = [host_name]
-    elif host_name == "happili-01" and not trigger_mode:
-        data_dir_list = [qa_dir.replace(
-            "qa/", ""), qa_dir.replace("qa/", "").replace("/data", "/data2"), qa_dir.replace("qa/", "").replace("/data", "/data3"), qa_dir.replace("qa/", "").replace("/data", "/data4")]
-        host_name_list = ["happili-01",
-                          "happili-02", "happili-03", "happili-04"]
+    topology = get_topology()
+
+    if topology.is_master(host_name) and not trigger_mode:
+        data_dir_list = [data_dir.replace("qa/", "")
+                         for data_dir in topology.get_node_paths(qa_dir)]
+        host_name_list = [node.name for node in topology.nodes]
+        # qa_dir is not on a data mount, so only the local data is used
+        if len(data_dir_list) != len(host_name_list):
+            host_name_list = [host_name]
     else:
         data_dir_list = [qa_dir.replace("qa/", "")]
         host_name_list = [host_name]
@@ -28,6 +28,21 @@ parser.add_argument('-p', '--path', default=None,
 parser.add_argument('-b', '--basedir', default=None,
                     help='Data directory')
 
+parser.add_argument('-n', '--n_workers', default=1, type=int,
+                    help='Number of processes reading the beams and rendering the plots in parallel')
+
+parser.add_argument('--timeout', default=None, type=float,
+                    help='Time in seconds to wait for the beams of a table')
+
+parser.add_argument('--blocksize', default=10000, type=int,
+                    help='Number of MS rows read at once, limits the memory use')
+
+parser.add_argument('--cache_dir', default=None,
+                    help='Directory for caching calibration solutions')
+
+parser.add_argument("--no_cache", action="store_true", default=False,
+                    help='Always read the calibration tables instead of using cached solutions')
+
 
 # this mode will make the script look only for the beams processed by Apercal on a given node
 parser.add_argument("--trigger_mode", action="store_true", default=False,
@@ -55,7 +70,9 @@ logger = logging.getLogger(__name__)
 
 # Create crosscal plots
 crosscal_plots.make_all_ccal_plots(
-    args.scan, args.fluxcal, args.polcal, output_path=output_path, basedir=args.basedir, trigger_mode=args.trigger_mode)
+    args.scan, args.fluxcal, args.polcal, output_path=output_path, basedir=args.basedir, trigger_mode=args.trigger_mode,
+    n_workers=args.n_workers, cache_dir=args.cache_dir, use_cache=not args.no_cache,
+    blocksize=args.blocksize, timeout=args.timeout)
 
 end = timer()
 logger.info('Elapsed time to generate cross-calibration data QA inpection plots is {} minutes'.format(
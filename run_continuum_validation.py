@@ -31,7 +31,9 @@ from apercal.libs import lib
 import sys
 import glob
 from dataqa.scandata import get_default_imagepath
-from dataqa.continuum.qa_continuum import qa_continuum_run_validation
+from dataqa.observation_layout import get_scan_paths
+from dataqa.node_topology import get_topology
+from dataqa.continuum.qa_continuum import qa_continuum_run_validation, VALIDATION_TIMEOUT
 from dataqa.continuum.qa_continuum import qa_get_image_noise_dr_gaussianity
 from dataqa.mosaic.qa_mosaic import qa_mosaic_run_validation
 
@@ -73,8 +75,14 @@ if __name__ == '__main__':
     parser.add_argument("-b", "--basedir", type=str, default=None,
                         help='Data directory without taskid')
 
-    # parser.add_argument("--n_processes", type=int, default=1,
-    #                     help='Number of cores to use for processing')
+    parser.add_argument("-n", "--n_workers", type=int, default=1,
+                        help='Number of beams to process at the same time')
+
+    parser.add_argument("--n_cores", type=int, default=None,
+                        help='Number of cores for all beams together, default all cores')
+
+    parser.add_argument("--timeout", type=float, default=VALIDATION_TIMEOUT,
+                        help='Time limit in seconds of a beam with more than one worker (default: %(default)s)')
 
     args = parser.parse_args()
 
@@ -82,11 +90,12 @@ if __name__ == '__main__':
     # ++++++++++++++++++++++++++++++
 
     host_name = socket.gethostname()
+    topology = get_topology()
 
-    if host_name != "happili-01" and not args.trigger_mode:
-        print("INFO: You are not working on happili-01.")
+    if not topology.is_master(host_name) and not args.trigger_mode:
+        print("INFO: You are not working on {0:s}.".format(topology.master))
         print("INFO: The script will not process all beams")
-        print("Please switch to happili-01")
+        print("Please switch to {0:s}".format(topology.master))
 
     # Basic parameters
     # ++++++++++++++++
@@ -157,17 +166,14 @@ if __name__ == '__main__':
         if args.trigger_mode:
             logger.info(
                 "--> Running continuum QA in trigger mode. Looking only for data processed by Apercal on {0:s} <--".format(host_name))
-            data_basedir_list = ['/data/apertif/{0:s}'.format(obs_id)]
-        elif host_name != "happili-01":
-            data_basedir_list = ['/data/apertif/{0:s}'.format(obs_id)]
-
-        else:
-            data_basedir_list = ['/data/apertif/{0:s}'.format(obs_id), '/data2/apertif/{0:s}'.format(obs_id),
-                                 '/data3/apertif/{0:s}'.format(obs_id), '/data4/apertif/{0:s}'.format(obs_id)]
+        data_basedir_list = get_scan_paths(
+            obs_id, trigger_mode=args.trigger_mode)
 
         # run the continuum validation (with pybdsf)
         try:
-            qa_continuum_run_validation(data_basedir_list, qa_validation_dir)
+            qa_continuum_run_validation(data_basedir_list, qa_validation_dir,
+                                        n_workers=args.n_workers, n_cores=args.n_cores,
+                                        timeout=args.timeout)
         except Exception as e:
             logger.error(e)
             logger.error("Running continuum validation was not successful")
@@ -182,8 +188,8 @@ if __name__ == '__main__':
     # run through mosaic mode
     else:
         if args.mosaic_name == '':
-            mosaic_name = "/data/apertif/{0:s}/mosaic/{0:s}_mosaic_image.fits".format(
-                obs_id)
+            mosaic_name = os.path.join(topology.get_data_root(), "{0:s}/mosaic/{0:s}_mosaic_image.fits".format(
+                obs_id))
         else:
             mosaic_name = args.mosaic_name
         # check that the file name exists
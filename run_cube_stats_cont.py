@@ -8,7 +8,10 @@ import time
 import logging
 from apercal.libs import lib
 from dataqa.scandata import get_default_imagepath
+from dataqa.observation_layout import get_scan_paths
+from dataqa.node_topology import get_topology
 from dataqa.line.cube_stats_cont import get_cube_stats_cont
+from dataqa.line.channel_stats import BLOCKSIZE, DEFAULT_METRICS, METRICS
 
 
 import matplotlib.pyplot as plt
@@ -34,6 +37,31 @@ if __name__ == '__main__':
     parser.add_argument("--trigger_mode", action="store_true", default=False,
                         help='Set it to run Autocal triggering mode automatically after Apercal')
 
+    parser.add_argument("--blocksize", type=float, default=BLOCKSIZE,
+                        help='Amount of cube data in MB to read at once (default: %(default)s)')
+
+    parser.add_argument("--metrics", type=str, nargs="+", default=list(DEFAULT_METRICS),
+                        choices=[name for name, _ in METRICS],
+                        help='Statistics to compute per channel (default: %(default)s)')
+
+    parser.add_argument("-n", "--n_workers", type=int, default=1,
+                        help='Number of cubes to analyse in parallel')
+
+    parser.add_argument("--max_memory", type=float, default=None,
+                        help='Memory in MB for analysing cubes in parallel (default: available memory)')
+
+    parser.add_argument("--force", action="store_true", default=False,
+                        help='Analyse all cubes, also those that did not change since the last run')
+
+    parser.add_argument("--no_noise_maps", action="store_true", default=False,
+                        help='Do not compute the rms map and the tile rms cube of the cubes')
+
+    parser.add_argument("--no_previews", action="store_true", default=False,
+                        help='Do not compute the moment-0 map, the peak flux map and the preview cube of the cubes')
+
+    parser.add_argument("--no_residuals", action="store_true", default=False,
+                        help='Do not look for residuals of the continuum subtraction')
+
     args = parser.parse_args()
 
     # get taskid/obs_id/scan
@@ -58,23 +86,23 @@ if __name__ == '__main__':
     host_name = socket.gethostname()
 
     # get data directories depending on the host name
+    topology = get_topology()
     if args.trigger_mode:
         logger.info(
             "--> Running line QA in trigger mode. Looking only for data processed by Apercal on {0:s} <--".format(host_name))
-        data_base_dir_list = ['/data/apertif/{0:s}'.format(obs_id)]
-    elif host_name != "happili-01" and not args.trigger_mode:
-        logger.warning("You are not working on happili-01.")
+    elif not topology.is_master(host_name):
+        logger.warning("You are not working on {0:s}.".format(topology.master))
         logger.warning("The script will not process all beams")
-        logger.warning("Please switch to happili-01")
-        data_base_dir_list = ['/data/apertif/{0:s}'.format(obs_id)]
-    else:
-        data_base_dir_list = ['/data/apertif/{0:s}'.format(obs_id), '/data2/apertif/{0:s}'.format(
-            obs_id), '/data3/apertif/{0:s}'.format(obs_id), '/data4/apertif/{0:s}'.format(obs_id)]
+        logger.warning("Please switch to {0:s}".format(topology.master))
+    data_base_dir_list = get_scan_paths(obs_id, trigger_mode=args.trigger_mode)
 
     # run the function to get the cube statistics
     # +++++++++++++++++++++++++++++++++++++++++++
     try:
-        get_cube_stats_cont(qa_line_dir, data_base_dir_list)
+        get_cube_stats_cont(qa_line_dir, data_base_dir_list, blocksize=args.blocksize, metrics=args.metrics,
+                            n_workers=args.n_workers, max_memory=args.max_memory,
+                            force=args.force, noise_maps=not args.no_noise_maps,
+                            previews=not args.no_previews, residuals=not args.no_residuals)
     except Exception as e:
         logger.error(e)
 
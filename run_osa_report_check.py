@@ -10,6 +10,7 @@ import socket
 import glob
 import argparse
 from astropy.table import Table
+from dataqa.node_topology import get_topology
 
 
 def osa_report_check(output_file=''):
@@ -18,18 +19,19 @@ def osa_report_check(output_file=''):
     Basic check if the number of OSA reports match the number of checks
     """
 
-    # check that we are running on happili-01
+    # check that we are running on the master node
     host_name = socket.gethostname()
+    topology = get_topology()
 
-    if host_name != "happili-01":
-        print("Wrong host. Please use happili-01. Abort")
+    if not topology.is_master(host_name):
+        print("Wrong host. Please use {0:s}. Abort".format(topology.master))
         raise RuntimeError("Wrong host")
 
     # data directory
-    data_dir = "/data/apertif"
+    data_dir = topology.get_data_root()
 
     # the osa report backup path is fixed
-    osa_report_path = "/data/apertif/qa/OSA_reports"
+    osa_report_path = os.path.join(data_dir, "qa/OSA_reports")
 
     # get a list of existing osa reports
     osa_report_list = glob.glob(os.path.join(osa_report_path, "*.json"))
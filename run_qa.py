@@ -12,6 +12,13 @@ from apercal.subs import calmodels as subs_calmodels
 from astropy.table import Table
 
 from dataqa.scandata import get_default_imagepath
+from dataqa.node_topology import get_topology
+
+# number of beams whose fluxcal MS is read at the same time for the RFI statistics
+RFI_STATS_WORKERS = 5
+
+# time in seconds to wait for the RFI statistics of all beams of a node
+RFI_STATS_TIMEOUT = 3600
 
 
 def run_triggered_qa(targets, fluxcals, polcals, steps=None, basedir=None, osa=''):
@@ -318,6 +325,27 @@ def run_triggered_qa(targets, fluxcals, polcals, steps=None, basedir=None, osa='
     else:
         logger.warning("#### Did not perform preflag QA")
 
+    # RFI statistics of the fluxcal MS, on every node for its own beams
+    if 'preflag' in steps and name_fluxcal != '':
+
+        logger.info("#### Running RFI statistics ...")
+
+        start_time_rfi = time.time()
+
+        try:
+            rfi_msg = os.system(
+                'python /home/apercal/dataqa/run_rfi_stats.py {0:d} "{1:s}" --basedir={2} -n {3:d} --timeout={4} --trigger_mode'.format(
+                    taskid_target, name_fluxcal, basedir, RFI_STATS_WORKERS, RFI_STATS_TIMEOUT))
+            logger.info(
+                "RFI statistics finished with msg {0}".format(rfi_msg))
+            logger.info("#### Running RFI statistics ... Done (time {0:.1f}s)".format(
+                time.time()-start_time_rfi))
+        except Exception as e:
+            logger.warning("RFI statistics failed. Continue with next QA")
+            logger.exception(e)
+    else:
+        logger.warning("#### Did not perform RFI statistics")
+
     # Crosscal QA
     # ===========
 
@@ -496,6 +524,23 @@ def run_triggered_qa(targets, fluxcals, polcals, steps=None, basedir=None, osa='
                 logger.warning("Merge crosscal and selfcal plots failed.")
                 logger.exception(e)
 
+        # merge the RFI statistics that every node wrote for its own beams
+        if get_topology().is_master(host_name) and 'preflag' in steps and name_fluxcal != '':
+            logger.info('#### Merge RFI statistics ...')
+
+            start_time_merge = time.time()
+
+            try:
+                rfi_msg = os.system(
+                    'python /home/apercal/dataqa/run_rfi_stats.py {0:d} "{1:s}" --basedir={2} --merge'.format(taskid_target, name_fluxcal, basedir))
+                logger.info(
+                    "Merging RFI statistics finished with msg {0}".format(rfi_msg))
+                logger.info("#### Merge RFI statistics ... Done (time {0:.1f}s)".format(
+                    time.time()-start_time_merge))
+            except Exception as e:
+                logger.warning("Merge RFI statistics failed.")
+                logger.exception(e)
+
         # now create the report
         logger.info('#### Create report ...')
 
@@ -0,0 +1,101 @@
+#!/usr/bin/env python
+"""
+Script to compute RFI statistics of the fluxcal MS
+Requires a scan number and the name of the flux calibrator
+Optionally takes a directory for writing the statistics and plots
+
+Every node writes the statistics of its own beams. With --merge, the
+files of all nodes are combined into a single file on the master node.
+"""
+
+from preflag import rfi_stats
+from scandata import get_default_imagepath
+from node_topology import get_topology
+import argparse
+from timeit import default_timer as timer
+import logging
+import os
+from apercal.libs import lib
+
+start = timer()
+
+parser = argparse.ArgumentParser(description='Compute RFI statistics of the fluxcal MS')
+
+# 1st argument: File name
+parser.add_argument("scan", help='Scan of target field')
+parser.add_argument("fluxcal", help='Fluxcal name')
+
+parser.add_argument('-p', '--path', default=None,
+                    help='Destination for statistics and images')
+
+parser.add_argument('-b', '--basedir', default=None,
+                    help='Data directory')
+
+parser.add_argument('-n', '--n_workers', default=1, type=int,
+                    help='Number of processes reading the beams in parallel')
+
+parser.add_argument('--blocksize', default=rfi_stats.BLOCKSIZE, type=int,
+                    help='Number of MS rows read at once, limits the memory use')
+
+parser.add_argument('--time_bin', default=rfi_stats.TIME_BIN, type=float,
+                    help='Width of the time bins in seconds')
+
+parser.add_argument('--channel_bin', default=rfi_stats.CHANNEL_BIN, type=int,
+                    help='Number of channels per channel bin')
+
+parser.add_argument('--timeout', default=None, type=float,
+                    help='Time in seconds to wait for all beams')
+
+parser.add_argument("--merge", action="store_true", default=False,
+                    help='Combine the files of all nodes instead of reading the MS, run on the master node')
+
+# this mode will make the script look only for the beams processed by Apercal on a given node
+parser.add_argument("--trigger_mode", action="store_true", default=False,
+                    help='Set it to run Autocal triggering mode automatically after Apercal.')
+
+args = parser.parse_args()
+
+# If no path is given change to default QA path
+if args.path is None:
+    output_path = get_default_imagepath(args.scan, basedir=args.basedir)
+
+    # check that preflag qa directory exists
+    output_path = "{0:s}preflag/".format(output_path)
+
+    if not os.path.exists(output_path):
+        os.mkdir(output_path)
+else:
+    output_path = args.path
+
+# Create logging file
+lib.setup_logger(
+    'debug', logfile='{0:s}run_rfi_stats.log'.format(output_path))
+logger = logging.getLogger(__name__)
+
+if args.merge:
+    # Combine the files that every node wrote for its own beams
+    topology = get_topology()
+    if not topology.is_master():
+        logger.warning("Not on {0}, the statistics of the other nodes are not found".format(
+            topology.master))
+    logger.info("Merging RFI statistics of all nodes")
+    n_beams = rfi_stats.merge_rfi_stats(
+        [os.path.join(path, rfi_stats.get_rfi_stats_name(args.scan))
+         for path in topology.get_node_paths(output_path)],
+        os.path.join(output_path, rfi_stats.get_rfi_stats_name(args.scan, combined=True)))
+    logger.info("Merged RFI statistics of {0:d} beams".format(n_beams))
+else:
+    # Read the fluxcal MS of all beams
+    logger.info("Reading RFI statistics of the fluxcal MS")
+    RFI = rfi_stats.RFIStats(args.scan, args.fluxcal, args.trigger_mode, basedir=args.basedir,
+                             time_bin=args.time_bin, channel_bin=args.channel_bin,
+                             blocksize=args.blocksize)
+    RFI.get_data(n_workers=args.n_workers, timeout=args.timeout)
+
+    RFI.write(os.path.join(output_path, rfi_stats.get_rfi_stats_name(args.scan)))
+    RFI.plot_waterfalls(imagepath=output_path)
+
+end = timer()
+logger.info('Elapsed time to compute the RFI statistics is {} minutes'.format(
+    (end - start)/60.))
+#time in minutes
@@ -10,6 +10,9 @@ from timeit import default_timer as timer
 import logging
 from apercal.libs import lib
 from dataqa.scandata import get_default_imagepath
+from dataqa.node_topology import get_topology
+from dataqa.observation_layout import get_scan_paths
+from dataqa.preflag.rfinder_runs import get_rfinder_args, run_rfinder_beams, RFINDER_TIMEOUT, RFINDER_TABLE_NAME
 import socket
 import glob
 
@@ -34,6 +37,12 @@ parser.add_argument('-b', '--basedir', default=None,
 parser.add_argument("--trigger_mode", action="store_true", default=False,
                     help='Set it to run Autocal triggering mode automatically after Apercal')
 
+parser.add_argument("-n", "--n_workers", type=int, default=1,
+                    help='Number of beams to run RFinder for at the same time')
+
+parser.add_argument("--timeout", type=float, default=RFINDER_TIMEOUT,
+                    help='Time limit in seconds of RFinder for a single beam (default: %(default)s)')
+
 args = parser.parse_args()
 
 # If no path is given change to default QA path
@@ -55,25 +64,24 @@ logger = logging.getLogger(__name__)
 
 # get data directories depending on the host name
 host_name = socket.gethostname()
+topology = get_topology()
 if args.trigger_mode:
     logger.info(
         "--> Running line QA in trigger mode. Looking only for data processed by Apercal on {0:s} <--".format(host_name))
-    data_beam_dir_list = glob.glob(
-        "/data/apertif/{}/[0-3][0-9]".format(args.taskID))
-elif host_name != "happili-01" and not args.trigger_mode:
-    logger.warning("You are not working on happili-01.")
+elif not topology.is_master(host_name):
+    logger.warning("You are not working on {0:s}.".format(topology.master))
     logger.warning("The script will not process all beams")
-    logger.warning("Please switch to happili-01")
-    data_beam_dir_list = glob.glob(
-        "/data/apertif/{}/[0-3][0-9]".format(args.taskID))
+    logger.warning("Please switch to {0:s}".format(topology.master))
 else:
-    logger.info("Running on happili-01. Using data from all nodes.")
-    data_beam_dir_list = glob.glob(
-        "/data*/apertif/{}/[0-3][0-9]".format(args.taskID))
+    logger.info("Running on {0:s}. Using data from all nodes.".format(host_name))
+data_beam_dir_list = []
+for scan_path in get_scan_paths(args.taskID, basedir=args.basedir, trigger_mode=args.trigger_mode):
+    data_beam_dir_list.extend(glob.glob("{0:s}/[0-3][0-9]".format(scan_path)))
 
 # Run RFInder
-# iterate over beams
-for beam_dir in data_beam_dir_list:
+# collect the runs of all beams
+beam_runs = []
+for beam_dir in sorted(data_beam_dir_list):
 
     # get beam
     b = beam_dir.split("/")[-1]
@@ -88,24 +96,20 @@ for beam_dir in data_beam_dir_list:
 
     datapath = '{0:s}/raw/'.format(beam_dir)
 
-    # if b < 10:
-    #     datapath='/data/apertif/{0:s}/{1:02d}/raw/'.format(args.taskID, b)
-    # if 10 <= b < 20:
-    #     datapath='/data2/apertif/{0:s}/{1:02d}/raw/'.format(args.taskID, b)
-    # if 20 <= b < 30:
-    #     datapath='/data3/apertif/{0:s}/{1:02d}/raw/'.format(args.taskID, b)
-    # if 30 <= b < 40:
-    #     datapath='/data4/apertif/{0:s}/{1:02d}/raw/'.format(args.taskID, b)
-    rfinder_command = ("python /home/apercal/pipeline/bin/rfinder -idir {0:s} -i {1:s} -tel apertif "
-                       "-mode use_flags -odir {2:s} -fl 0 -tStep 5 -yesClp").format(datapath, msfile, qapath)
-    # print rfinder_command
-    try:
-        logging.info("Running RFinder for beam {0:s}".format(b))
-        os.system(rfinder_command)
-        logging.info("Running RFinder for beam {0:s} ... Done".format(b))
-    except Exception as e:
-        logger.error(e)
-        logging.error("Running RFinder for beam {0:s} failed".format(b))
+    beam_runs.append((b, get_rfinder_args(datapath, msfile, qapath),
+                      "{0:s}rfinder.log".format(qapath)))
+
+# run the beams in parallel, each with a time limit
+rfinder_runs = run_rfinder_beams(
+    beam_runs, n_workers=args.n_workers, timeout=args.timeout)
+
+rfinder_table_file = "{0:s}{1:s}".format(output_path, RFINDER_TABLE_NAME)
+rfinder_runs.write(rfinder_table_file, format="csv", overwrite=True)
+logger.info("Saved RFinder runs to {0:s}".format(rfinder_table_file))
+
+for b, _, _ in beam_runs:
+
+    qapath = "{0:s}{1:s}/".format(output_path, b)
 
     # move 2D plot to where report can find it (quick & dirty hack)
     old2d = "{0:s}/rfi_q/plots/movies/Time_2Dplot_movie.gif".format(qapath)
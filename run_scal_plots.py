@@ -9,6 +9,7 @@ from selfcal import selfcal_plots as scplots
 import argparse
 from timeit import default_timer as timer
 from scandata import get_default_imagepath
+from beam_grid import PlotQueue
 from selfcal.selfcal_maps import get_selfcal_maps
 import time
 from apercal.libs import lib
@@ -28,6 +29,12 @@ parser.add_argument('-p', '--path', default=None,
 parser.add_argument('-b', '--basedir', default=None,
                     help='Data directory')
 
+parser.add_argument('-n', '--n_workers', default=1, type=int,
+                    help='Number of processes reading the beams and rendering the plots in parallel')
+
+parser.add_argument('--timeout', default=None, type=float,
+                    help='Time in seconds to wait for the beams of a table')
+
 parser.add_argument('-M', '--maps', default=True,
                     action='store_false', help='Do not generate selfcal maps')
 parser.add_argument('-P', '--phase', default=True,
@@ -73,6 +80,9 @@ if args.maps:
 else:
     logger.info("#### Not generating selfcal maps")
 
+# The phase and amplitude figures are rendered together at the end
+plots = PlotQueue()
+
 # Get phase plots
 if args.phase:
     try:
@@ -80,8 +90,8 @@ if args.phase:
         start_time_plots = time.time()
         PH = scplots.PHSols(args.scan, args.target,
                             trigger_mode=args.trigger_mode, basedir=args.basedir)
-        PH.get_data()
-        PH.plot_phase(imagepath=output_path)
+        PH.get_data(n_workers=args.n_workers, timeout=args.timeout)
+        PH.plot_phase(imagepath=output_path, plot_queue=plots)
         logger.info('#### Done with phase plots ({0:.0f}s)'.format(
             time.time()-start_time_plots))
     except Exception as e:
@@ -97,8 +107,8 @@ if args.amplitude:
         start_time_plots = time.time()
         AMP = scplots.AMPSols(args.scan, args.target,
                               trigger_mode=args.trigger_mode, basedir=args.basedir)
-        AMP.get_data()
-        AMP.plot_amp(imagepath=output_path)
+        AMP.get_data(n_workers=args.n_workers, timeout=args.timeout)
+        AMP.plot_amp(imagepath=output_path, plot_queue=plots)
         logger.info('#### Done with amplitude plots ({0:.0f}s)'.format(
             time.time()-start_time_plots))
     except Exception as e:
@@ -107,6 +117,18 @@ if args.amplitude:
 else:
     logger.info("#### Not generating amplitude plots")
 
+# Render the phase and amplitude plots
+if len(plots) != 0:
+    try:
+        logger.info("#### Rendering {} selfcal plots".format(len(plots)))
+        start_time_render = time.time()
+        plots.run(n_workers=args.n_workers)
+        logger.info('#### Done with rendering selfcal plots ({0:.0f}s)'.format(
+            time.time()-start_time_render))
+    except Exception as e:
+        logger.error(e)
+        logger.error("Rendering selfcal plots failed.")
+
 
 end = timer()
 print 'Elapsed time to generate self-calibration data QA inpection plots and images is {} minutes'.format((end - start)/60.)
@@ -1,6 +1,11 @@
 import os
 import numpy as np
 import logging
+import time
+import traceback
+import multiprocessing
+import hashlib
+from observation_layout import get_observation_layout, get_scan_paths
 """
 Define object classes for holding data related to scans
 The key thing to specify an object is the scan of the target field
@@ -11,6 +16,26 @@ This specifies the location of all data, assuming setup of automatic pipeline
 """
 
 
+logger = logging.getLogger(__name__)
+
+# ScanData object used by the worker processes of ScanData.get_data
+# it is set before the pool is created, so the workers inherit it
+_worker_scandata = None
+
+
+def _get_beam_data_worker(path, beam):
+    """
+    Get the data of a single beam in a worker process
+
+    Exceptions are returned as a formatted traceback, because not all of them
+    (e.g. those from casacore) can be sent back to the main process.
+    """
+    try:
+        return _worker_scandata.read_beam_data(path, beam), None
+    except Exception:
+        return None, traceback.format_exc()
+
+
 def get_default_imagepath(scan, basedir=None):
     """
     Get the default path for saving images
@@ -28,6 +53,242 @@ def get_default_imagepath(scan, basedir=None):
         return '/data/apertif/{scan}/qa/'.format(scan=scan)
 
 
+def get_table_fingerprint(table):
+    """
+    Fingerprint of a casacore table to detect changes
+
+    Args:
+        table (str): Path to the table directory
+
+    Returns:
+        list: Number of files, total size and latest modification time
+              of all files in the table, including subtables
+    """
+    n_files = 0
+    size = 0
+    mtime = 0.
+    for root, dirs, files in os.walk(table):
+        for f in files:
+            stat = os.stat(os.path.join(root, f))
+            n_files += 1
+            size += stat.st_size
+            mtime = max(mtime, stat.st_mtime)
+    return [n_files, size, mtime]
+
+
+class SolutionCache(object):
+    def __init__(self, cache_dir, max_size=1024**3):
+        """
+        On-disk cache of per-beam data extracted from casacore tables
+
+        Every entry is a compressed npz file with the arrays of one beam.
+        It is only used if the table has the same fingerprint (size and
+        modification time) as when the entry was written. If the cache grows
+        beyond max_size, the least recently used entries are removed.
+
+        Args:
+            cache_dir (str): Directory for the cache files
+            max_size (int): Maximum total size of the cache in bytes
+        """
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+        if not os.path.exists(self.cache_dir):
+            os.makedirs(self.cache_dir)
+
+    def get_cache_file(self, table, name):
+        key = hashlib.sha1("{0}:{1}".format(
+            name, os.path.abspath(table)).encode('utf-8')).hexdigest()
+        return os.path.join(self.cache_dir, "{}.npz".format(key))
+
+    def get(self, table, name):
+        """
+        Get the cached data of a table
+
+        Args:
+            table (str): Path to the table
+            name (str): Name of what was extracted, e.g. the class name
+
+        Returns:
+            dict: Arrays keyed by attribute name, None if not cached or outdated
+        """
+        cache_file = self.get_cache_file(table, name)
+        if not os.path.exists(cache_file):
+            return None
+        try:
+            with np.load(cache_file) as cached:
+                if list(cached['__fingerprint__']) != get_table_fingerprint(table):
+                    return None
+                beam_data = dict((key, cached[key])
+                                 for key in cached.files if key != '__fingerprint__')
+        except Exception as e:
+            logger.warning("Could not read cache file {}".format(cache_file))
+            logger.exception(e)
+            return None
+        # mark as recently used
+        os.utime(cache_file, None)
+        return beam_data
+
+    def put(self, table, name, beam_data):
+        """
+        Store the extracted data of a table
+
+        Args:
+            table (str): Path to the table
+            name (str): Name of what was extracted, e.g. the class name
+            beam_data (dict): Arrays keyed by attribute name
+        """
+        cache_file = self.get_cache_file(table, name)
+        # write to a temporary file first, so other processes
+        # never see a partially written entry
+        tmp_file = "{0}.{1}.tmp".format(cache_file, os.getpid())
+        try:
+            with open(tmp_file, 'wb') as f:
+                np.savez_compressed(f, __fingerprint__=get_table_fingerprint(table),
+                                    **beam_data)
+            os.rename(tmp_file, cache_file)
+        except Exception as e:
+            logger.warning("Could not write cache file {}".format(cache_file))
+            logger.exception(e)
+            if os.path.exists(tmp_file):
+                os.remove(tmp_file)
+            return
+        self.evict()
+
+    def evict(self):
+        """
+        Remove the least recently used entries until the cache fits in max_size
+        """
+        entries = []
+        for f in os.listdir(self.cache_dir):
+            if f.endswith('.npz'):
+                stat = os.stat(os.path.join(self.cache_dir, f))
+                entries.append((stat.st_mtime, stat.st_size, f))
+        total_size = sum(entry[1] for entry in entries)
+        for mtime, size, f in sorted(entries):
+            if total_size <= self.max_size:
+                break
+            try:
+                os.remove(os.path.join(self.cache_dir, f))
+            except OSError:
+                # already removed by another process
+                pass
+            total_size -= size
+
+
+class BeamArray(object):
+    def __init__(self, beamlist, dtype=float, fill_value=np.nan, empty_shape=()):
+        """
+        Per-beam arrays stored in a single contiguous array
+
+        The arrays of all beams are stored in data, with shape (n_beam, ...),
+        padded with fill_value to the largest shape of any beam. The valid
+        array marks the elements that were set, so padding and beams without
+        data can be masked for statistics over all beams.
+
+        Indexing with the beam index returns the array of that beam with its
+        original shape, which keeps the per-beam plotting code unchanged.
+        Beams without data return an array of fill_value.
+
+        Args:
+            beamlist (list(str)): Beams, e.g. ["00", "01"]
+            dtype (type): Data type of the values
+            fill_value: Value for padding and beams without data
+            empty_shape (tuple): Shape returned for beams without data
+                if none of the beams have data
+        """
+        self.beamlist = list(beamlist)
+        self.index = dict((beam, i) for i, beam in enumerate(self.beamlist))
+        self.dtype = dtype
+        self.fill_value = fill_value
+        self.empty_shape = empty_shape
+        self.data = None
+        self.valid = None
+        self.shapes = [None] * len(self.beamlist)
+
+    def __len__(self):
+        return len(self.beamlist)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def __getitem__(self, i):
+        if self.data is None:
+            return np.full(self.empty_shape, self.fill_value, dtype=self.dtype)
+        if self.shapes[i] is None:
+            return self.data[i]
+        return self.data[(i,) + tuple(slice(0, n) for n in self.shapes[i])]
+
+    def __setitem__(self, i, value):
+        value = np.asarray(value, dtype=self.dtype)
+        if self.data is None:
+            self.data = np.full((len(self),) + value.shape,
+                                self.fill_value, dtype=self.dtype)
+            self.valid = np.zeros(self.data.shape, dtype=bool)
+        elif value.ndim != self.data.ndim - 1:
+            raise ValueError("Beam {0} has {1} dimensions instead of {2}".format(
+                self.beamlist[i], value.ndim, self.data.ndim - 1))
+        elif any(n > m for n, m in zip(value.shape, self.data.shape[1:])):
+            # grow the array to fit the new beam
+            shape = (len(self),) + tuple(max(n, m) for n, m in
+                                         zip(value.shape, self.data.shape[1:]))
+            data = np.full(shape, self.fill_value, dtype=self.dtype)
+            valid = np.zeros(shape, dtype=bool)
+            old = tuple(slice(0, n) for n in self.data.shape)
+            data[old] = self.data
+            valid[old] = self.valid
+            self.data = data
+            self.valid = valid
+
+        beam_slice = (i,) + tuple(slice(0, n) for n in value.shape)
+        self.data[i] = self.fill_value
+        self.data[beam_slice] = value
+        self.valid[i] = False
+        self.valid[beam_slice] = True
+        self.shapes[i] = value.shape
+
+    def has_beam(self, i):
+        """
+        Check if a beam has data
+
+        Args:
+            i (int): Index of the beam
+
+        Returns:
+            bool: True if the beam has data
+        """
+        return self.shapes[i] is not None
+
+    def get_beam(self, beam):
+        """
+        Get the array of a beam by name
+
+        Args:
+            beam (str): Beam, e.g. "00"
+
+        Returns:
+            ndarray: Array of the beam
+        """
+        return self[self.index[beam]]
+
+    def masked(self):
+        """
+        Get the data of all beams as a masked array
+
+        Padding, beams without data and non-finite values are masked.
+
+        Returns:
+            MaskedArray: Array of shape (n_beam, ...)
+        """
+        if self.data is None:
+            return np.ma.masked_all((len(self),) + tuple(self.empty_shape),
+                                    dtype=self.dtype)
+        mask = np.logical_not(self.valid)
+        if np.issubdtype(self.data.dtype, np.inexact):
+            mask |= np.logical_not(np.isfinite(self.data))
+        return np.ma.masked_array(self.data, mask=mask)
+
+
 class ScanData(object):
     def __init__(self, scan, sourcename, basedir=None, trigger_mode=False):
         """
@@ -41,6 +302,8 @@ class ScanData(object):
         self.sourcename = sourcename
         self.imagepathsuffix = ""
         self.trigger_mode = trigger_mode
+        self.basedir = basedir
+        self.cache = None
         # check if fluxcal is given as 3CXXX.MS or 3CXXX
         # Fix to not include .MS no matter what
         if self.sourcename[0:2] != '3C':
@@ -48,54 +311,21 @@ class ScanData(object):
         elif self.sourcename[-2:] == 'MS':
             self.sourcename = self.sourcename[:-3]
         # also get a directory list and beamlist
+        # from the index of the data directories of the scan
+        self.layout = get_observation_layout(
+            get_scan_paths(self.scan, basedir=basedir, trigger_mode=trigger_mode))
         self.dirlist = []
         self.beamlist = []
-        # first check what happili node on
-        # if not happili-01, print a warning and only search locally
-        hostname = os.uname()[1]
-        paths = []
-        # in case it runs on triggered mode, it should only look into
-        # the apertif dir of this node
-        if self.trigger_mode:
-            logging.info(
-                "--> Running in trigger mode. Looking only for data processed by Apercal on {0:s} <--".format(hostname))
-            path = '/data/apertif/{}'.format(self.scan)
-            paths = [path]
-        elif hostname != 'happili-01' and not trigger_mode:
-            logging.info(
-                'Not on happili-01, only search local {} for data'.format(hostname))
-            if basedir is not None:
-                path = os.path.join(basedir, "{}".format(self.scan))
-            else:
-                path = '/data/apertif/{}'.format(self.scan)
-            paths = [path]
-        elif hostname == 'happili-01' and basedir is not None:
-            path = os.path.join(basedir, "{}".format(self.scan))
-            paths = [path]
-        else:
-            # On happili-01, so search all nodes
-            # ignoring happili-05 - may have to fix this eventually
-            logging.info(
-                "Running on {0:s}. Search for data from all nodes".format(hostname))
-            paths += ['/data/apertif/{}'.format(self.scan)]
-            paths += ['/data2/apertif/{}'.format(self.scan)]
-            paths += ['/data3/apertif/{}'.format(self.scan)]
-            paths += ['/data4/apertif/{}'.format(self.scan)]
-
-        for path in paths:
-            allfiles = os.listdir(path)
-            for f in allfiles:
-                full_path = os.path.join(path, f)
-                if os.path.isdir(full_path) and len(f) == 2 and unicode(f, 'utf-8').isnumeric():
-                    self.dirlist.append(full_path)
-                    # create a list of all directories with full path.
-                    # This should be all beams - there should be no other directories
-                    # f is a string, so add to beam list to also track info about beams
-                    self.beamlist.append(f)
+        for beam, path in self.layout.get_beams():
+            # create a list of all directories with full path.
+            # This should be all beams - there should be no other directories
+            # f is a string, so add to beam list to also track info about beams
+            self.dirlist.append(path)
+            self.beamlist.append(beam)
 
         # Initialize phase & amp arrays - common to all types of
-        self.phase = np.empty(len(self.dirlist), dtype=np.ndarray)
-        self.amp = np.empty(len(self.dirlist), dtype=np.ndarray)
+        self.phase = BeamArray(self.beamlist)
+        self.amp = BeamArray(self.beamlist)
 
     def get_default_imagepath(self, scan):
         """
@@ -121,3 +351,138 @@ class ScanData(object):
             os.makedirs(imagepath)
 
         return imagepath
+
+    def get_data(self, n_workers=1, timeout=None, cache=None):
+        """
+        Get the data of all beams
+
+        The beams are independent, so with more than one worker they are
+        read by a pool of processes. A beam that fails or is not finished
+        when the timeout has passed is filled with get_empty_beam_data and
+        does not affect the other beams.
+
+        Args:
+            n_workers (int): Number of processes reading beams in parallel,
+                1 reads the beams one after another
+            timeout (float): Time in seconds to wait for all beams in parallel mode,
+                None to wait indefinitely
+            cache (SolutionCache): Cache for the data of unchanged tables,
+                None to always read the tables
+        """
+        self.cache = cache
+        n_workers = max(1, min(n_workers, len(self.dirlist),
+                               multiprocessing.cpu_count()))
+
+        if n_workers == 1:
+            for i, (path, beam) in enumerate(zip(self.dirlist, self.beamlist)):
+                try:
+                    beam_data = self.read_beam_data(path, beam)
+                except Exception as e:
+                    logger.warning(
+                        "Getting data failed for B{}. Filling with NaNs".format(beam))
+                    logger.exception(e)
+                    beam_data = self.get_empty_beam_data(beam)
+                self.set_beam_data(i, beam_data)
+            return
+
+        logger.info("Getting data for {0} beams with {1} processes".format(
+            len(self.dirlist), n_workers))
+        global _worker_scandata
+        _worker_scandata = self
+        if timeout is not None:
+            deadline = time.time() + timeout
+        pool = multiprocessing.Pool(n_workers)
+        try:
+            results = [pool.apply_async(_get_beam_data_worker, (path, beam))
+                       for path, beam in zip(self.dirlist, self.beamlist)]
+            # collect in beam order, all beams share the same deadline
+            for i, (result, beam) in enumerate(zip(results, self.beamlist)):
+                try:
+                    if timeout is None:
+                        beam_data, error = result.get()
+                    else:
+                        beam_data, error = result.get(max(0, deadline - time.time()))
+                except multiprocessing.TimeoutError:
+                    beam_data, error = None, "No result after {}s".format(timeout)
+                if error is not None:
+                    logger.warning(
+                        "Getting data failed for B{}. Filling with NaNs".format(beam))
+                    logger.warning(error)
+                    beam_data = self.get_empty_beam_data(beam)
+                self.set_beam_data(i, beam_data)
+        finally:
+            # stops workers that are still busy with a beam that timed out
+            pool.terminate()
+            _worker_scandata = None
+
+    def read_beam_data(self, path, beam):
+        """
+        Get the data of a single beam, from the cache if the table did not change
+
+        Args:
+            path (str): Directory of the beam, e.g. "/data/apertif/190303083/00"
+            beam (str): Beam, e.g. "00"
+
+        Returns:
+            dict: Values of the per-beam arrays, keyed by attribute name
+        """
+        table = self.get_beam_table(path)
+        if self.cache is None or table is None or not os.path.isdir(table):
+            return self.get_beam_data(path, beam)
+
+        name = type(self).__name__
+        beam_data = self.cache.get(table, name)
+        if beam_data is not None:
+            logger.debug("Using cached data of {}".format(table))
+            return beam_data
+        beam_data = self.get_beam_data(path, beam)
+        self.cache.put(table, name, beam_data)
+        return beam_data
+
+    def get_beam_table(self, path):
+        """
+        Table that get_beam_data reads, used as key for the cache
+
+        Args:
+            path (str): Directory of the beam
+
+        Returns:
+            str: Path to the table, None if the data should not be cached
+        """
+        return None
+
+    def get_beam_data(self, path, beam):
+        """
+        Get the data of a single beam, to be implemented by subclasses
+
+        Args:
+            path (str): Directory of the beam, e.g. "/data/apertif/190303083/00"
+            beam (str): Beam, e.g. "00"
+
+        Returns:
+            dict: Values of the per-beam arrays, keyed by attribute name
+        """
+        raise NotImplementedError
+
+    def get_empty_beam_data(self, beam):
+        """
+        Placeholder values for a beam without data
+
+        Args:
+            beam (str): Beam, e.g. "00"
+
+        Returns:
+            dict: Values of the per-beam arrays, keyed by attribute name
+        """
+        return {}
+
+    def set_beam_data(self, i, beam_data):
+        """
+        Store the data of a beam in the per-beam arrays
+
+        Args:
+            i (int): Index of the beam in dirlist and beamlist
+            beam_data (dict): Values keyed by attribute name
+        """
+        for name, value in beam_data.items():
+            getattr(self, name)[i] = value
@@ -7,8 +7,7 @@ from apercal.libs import lib
 import glob
 import socket
 import logging
-from astropy.io import fits
-from astropy.wcs import WCS
+from dataqa.fits_image import get_fits_image
 import matplotlib
 matplotlib.use('Agg')
 import matplotlib.pyplot as plt
@@ -21,21 +20,11 @@ def plot_selfcal_maps(fits_name, qa_selfcal_beam_dir, plot_residuals=False):
     """This function plots the selfcal maps
     """
 
-    fits_hdulist = fits.open(fits_name)
+    fits_image = get_fits_image(fits_name)
 
-    # get WCS header of cube
-    wcs = WCS(fits_hdulist[0].header)
-
-    # remove unnecessary axis
-    if wcs.naxis == 4:
-        wcs = wcs.dropaxis(3)
-        wcs = wcs.dropaxis(2)
-        img = fits_hdulist[0].data[0][0]
-    elif wcs.naxis == 3:
-        wcs = wcs.dropaxis(2)
-        img = fits_hdulist[0].data[0]
-    else:
-        img = fits_hdulist[0].data
+    # get WCS header and image without the unnecessary axis
+    wcs = fits_image.celestial
+    img = fits_image.plane()
 
     # set up plot
     ax = plt.subplot(projection=wcs)
@@ -10,7 +10,8 @@ from apercal.subs import readmirlog
 from apercal.subs import misc
 import matplotlib.pyplot as plt
 from matplotlib.pyplot import cm
-from scandata import ScanData
+from scandata import ScanData, BeamArray
+from beam_grid import Frame, render_frames
 
 
 class PHSols(ScanData):
@@ -19,75 +20,64 @@ class PHSols(ScanData):
                           trigger_mode=trigger_mode, basedir=basedir)
         self.phants = np.empty(len(self.dirlist), dtype=np.object)
         self.phtimes = np.empty(len(self.dirlist), dtype=np.object)
-        self.phases = np.empty(len(self.dirlist), dtype=np.ndarray)
+        self.phases = BeamArray(self.beamlist)
         self.phnants = np.empty(len(self.dirlist), dtype=np.ndarray)
         self.phnbins = np.empty(len(self.dirlist), dtype=np.ndarray)
         self.phnsols = np.empty(len(self.dirlist), dtype=np.ndarray)
 
-    def get_data(self):
+    def get_beam_data(self, path, beam):
         # get the data
-        for i, (path, beam) in enumerate(zip(self.dirlist, self.beamlist)):
-            phdata = "{0}/selfcal/{1}.mir".format(path, self.sourcename)
-            if os.path.isdir(phdata):
-                try:
-                    phgains, times = readmirlog.get_phases(phdata)
-                    self.phants[i] = misc.create_antnames()
-                    self.phtimes[i] = times
-                    self.phases[i] = phgains
-                    self.phnants[i], self.phnbins[i], self.phnsols[i] = readmirlog.get_ndims(
-                        phdata)
-                except:
-                    print 'Filling with NaNs. Phase self-calibration not present for B{}'.format(beam)
-                    self.phants[i] = misc.create_antnames()
-                    self.phtimes[i] = np.array(np.nan)
-                    self.phases[i] = np.array(np.nan)
-                    self.phnbins[i] = np.array(np.nan)
-                    self.phnants[i], self.phnbins[i], self.phnsols[i] = np.array(
-                        np.nan), np.array(np.nan), np.array(np.nan)
-            else:
+        phdata = "{0}/selfcal/{1}.mir".format(path, self.sourcename)
+        if os.path.isdir(phdata):
+            try:
+                phgains, times = readmirlog.get_phases(phdata)
+                phnants, phnbins, phnsols = readmirlog.get_ndims(phdata)
+                return {'phants': misc.create_antnames(),
+                        'phtimes': times,
+                        'phases': phgains,
+                        'phnants': phnants,
+                        'phnbins': phnbins,
+                        'phnsols': phnsols}
+            except:
                 print 'Filling with NaNs. Phase self-calibration not present for B{}'.format(beam)
-                self.phants[i] = misc.create_antnames()
-                self.phtimes[i] = np.array(np.nan)
-                self.phases[i] = np.array(np.nan)
-                self.phnbins[i] = np.array(np.nan)
-                self.phnants[i], self.phnbins[i], self.phnsols[i] = np.array(
-                    np.nan), np.array(np.nan), np.array(np.nan)
+                return self.get_empty_beam_data(beam)
+        else:
+            print 'Filling with NaNs. Phase self-calibration not present for B{}'.format(beam)
+            return self.get_empty_beam_data(beam)
 
-    def plot_phase(self, imagepath=None):
+    def get_empty_beam_data(self, beam):
+        return {'phants': misc.create_antnames(),
+                'phtimes': np.array(np.nan),
+                'phnants': np.array(np.nan),
+                'phnbins': np.array(np.nan),
+                'phnsols': np.array(np.nan)}
+
+    def plot_phase(self, imagepath=None, plot_queue=None):
         """Plot phase, one plot per antenna"""
         imagepath = self.create_imagepath(imagepath)
         ant_names = misc.create_antnames()
+        frames = []
         for a, ant in enumerate(ant_names):
-            # iterate through antennas
-            # set up for 8x5 plots (40 beams)
-            nx = 8
-            ny = 5
-            xsize = nx * 4
-            ysize = ny * 4
-            plt.figure(figsize=(xsize, ysize))
-            plt.suptitle('Selfcal phases for Antenna {0}'.format(ant))
-
+            # iterate through antennas, one panel per beam
+            panels = []
             for n, beam in enumerate(self.beamlist):
                 beamnum = int(beam)
-                plt.subplot(ny, nx, beamnum + 1)
                 if np.isnan(self.phnbins[n]):
-                    continue
+                    panels.append((beamnum, None, []))
                 else:
                     color = cm.rainbow(np.linspace(0, 1, self.phnbins[n]))
-                    for f in range(self.phnbins[n]):
-                        plt.scatter(range(len(
-                            self.phtimes[n])), self.phases[n][a, f, :], label='F'+str(f), marker=',', s=1, c=color[f])
-                        if n >= 32:
-                            plt.xlabel('Time [solint]')
-                        if n % nx == 0:
-                            plt.ylabel('Phase [deg]')
-
-                plt.title('Beam {0}'.format(beam))
-            plt.legend(prop={'size': 5})
+                    points = [(range(len(self.phtimes[n])), self.phases[n][a, f, :], color[f])
+                              for f in range(self.phnbins[n])]
+                    panels.append((beamnum, 'Beam {0}'.format(beam), points))
+            frames.append(Frame('{2}SCAL_phase_{0}_{1}.png'.format(ant, self.scan, imagepath),
+                                'Selfcal phases for Antenna {0}'.format(ant), panels))
 
-            plt.savefig(
-                '{2}SCAL_phase_{0}_{1}.png'.format(ant, self.scan, imagepath))
-            plt.close("all")
+        # one series per frequency bin
+        nbins = [nbin for nbin in self.phnbins if not np.isnan(nbin)]
+        series = [{'label': 'F' + str(f), 'marker': ',', 's': 1}
+                  for f in range(int(max(nbins)) if len(nbins) != 0 else 0)]
+        render_frames(frames, plot_queue=plot_queue, series=series, suptitle_size=None,
+                      xlabel='Time [solint]', ylabel='Phase [deg]', legend_kwargs={'prop': {'size': 5}})
 
 
 class AMPSols(ScanData):
@@ -96,71 +86,60 @@ class AMPSols(ScanData):
                           trigger_mode=trigger_mode, basedir=basedir)
         self.ampants = np.empty(len(self.dirlist), dtype=np.object)
         self.amptimes = np.empty(len(self.dirlist), dtype=np.object)
-        self.amps = np.empty(len(self.dirlist), dtype=np.ndarray)
+        self.amps = BeamArray(self.beamlist)
         self.ampnants = np.empty(len(self.dirlist), dtype=np.ndarray)
         self.ampnbins = np.empty(len(self.dirlist), dtype=np.ndarray)
         self.ampnsols = np.empty(len(self.dirlist), dtype=np.ndarray)
 
-    def get_data(self):
-        for i, (path, beam) in enumerate(zip(self.dirlist, self.beamlist)):
-            ampdata = "{0}/selfcal/{1}_amp.mir".format(path, self.sourcename)
-            if os.path.isdir(ampdata):
-                try:
-                    ampgains, times = readmirlog.get_amps(ampdata)
-                    self.ampants[i] = misc.create_antnames()
-                    self.amptimes[i] = times
-                    self.amps[i] = ampgains
-                    self.ampnants[i], self.ampnbins[i], self.ampnsols[i] = readmirlog.get_ndims(
-                        ampdata)
-                except:
-                    print 'Filling with NaNs. Amplitude self-calibration not present for B{}'.format(beam)
-                    self.ampants[i] = misc.create_antnames()
-                    self.amptimes[i] = np.array(np.nan)
-                    self.amps[i] = np.array(np.nan)
-                    self.ampnbins[i] = np.array(np.nan)
-                    self.ampnants[i], self.ampnbins[i], self.ampnsols[i] = np.array(
-                        np.nan), np.array(np.nan), np.array(np.nan)
-            else:
+    def get_beam_data(self, path, beam):
+        ampdata = "{0}/selfcal/{1}_amp.mir".format(path, self.sourcename)
+        if os.path.isdir(ampdata):
+            try:
+                ampgains, times = readmirlog.get_amps(ampdata)
+                ampnants, ampnbins, ampnsols = readmirlog.get_ndims(ampdata)
+                return {'ampants': misc.create_antnames(),
+                        'amptimes': times,
+                        'amps': ampgains,
+                        'ampnants': ampnants,
+                        'ampnbins': ampnbins,
+                        'ampnsols': ampnsols}
+            except:
                 print 'Filling with NaNs. Amplitude self-calibration not present for B{}'.format(beam)
-                self.ampants[i] = misc.create_antnames()
-                self.amptimes[i] = np.array(np.nan)
-                self.amps[i] = np.array(np.nan)
-                self.ampnbins[i] = np.array(np.nan)
-                self.ampnants[i], self.ampnbins[i], self.ampnsols[i] = np.array(
-                    np.nan), np.array(np.nan), np.array(np.nan)
+                return self.get_empty_beam_data(beam)
+        else:
+            print 'Filling with NaNs. Amplitude self-calibration not present for B{}'.format(beam)
+            return self.get_empty_beam_data(beam)
 
-    def plot_amp(self, imagepath=None):
+    def get_empty_beam_data(self, beam):
+        return {'ampants': misc.create_antnames(),
+                'amptimes': np.array(np.nan),
+                'ampnants': np.array(np.nan),
+                'ampnbins': np.array(np.nan),
+                'ampnsols': np.array(np.nan)}
+
+    def plot_amp(self, imagepath=None, plot_queue=None):
         """Plot amplitudes, one plot per antenna"""
         imagepath = self.create_imagepath(imagepath)
         ant_names = misc.create_antnames()
+        frames = []
         for a, ant in enumerate(ant_names):
-            # iterate through antennas
-            # set up for 8x5 plots (40 beams)
-            nx = 8
-            ny = 5
-            xsize = nx * 4
-            ysize = ny * 4
-            plt.figure(figsize=(xsize, ysize))
-            plt.suptitle('Selfcal amplitudes for Antenna {0}'.format(ant))
-
+            # iterate through antennas, one panel per beam
+            panels = []
             for n, beam in enumerate(self.beamlist):
                 beamnum = int(beam)
-                plt.subplot(ny, nx, beamnum + 1)
                 if np.isnan(self.ampnbins[n]):
-                    continue
+                    panels.append((beamnum, None, []))
                 else:
                     color = cm.rainbow(np.linspace(0, 1, self.ampnbins[n]))
-                    for f in range(self.ampnbins[n]):
-                        plt.scatter(range(len(
-                            self.amptimes[n])), self.amps[n][a, f, :], label='F' + str(f), marker=',', s=1, c=color[f])
-                        if n >= 32:
-                            plt.xlabel('Time [solint]')
-                        if n % nx == 0:
-                            plt.ylabel('Amp')
-
-                plt.title('Beam {0}'.format(beam))
-            plt.legend()
+                    points = [(range(len(self.amptimes[n])), self.amps[n][a, f, :], color[f])
+                              for f in range(self.ampnbins[n])]
+                    panels.append((beamnum, 'Beam {0}'.format(beam), points))
+            frames.append(Frame('{2}SCAL_amp_{0}_{1}.png'.format(ant, self.scan, imagepath),
+                                'Selfcal amplitudes for Antenna {0}'.format(ant), panels))
 
-            plt.savefig('{2}SCAL_amp_{0}_{1}.png'.format(
-                ant, self.scan, imagepath))
-            plt.close("all")
+        # one series per frequency bin
+        nbins = [nbin for nbin in self.ampnbins if not np.isnan(nbin)]
+        series = [{'label': 'F' + str(f), 'marker': ',', 's': 1}
+                  for f in range(int(max(nbins)) if len(nbins) != 0 else 0)]
+        render_frames(frames, plot_queue=plot_queue, series=series, suptitle_size=None,
+                      xlabel='Time [solint]', ylabel='Amp', legend_kwargs={})